@@ -1,7 +1,6 @@
 import logging
 from flask import Flask
 from slack_sdk.web.async_client import AsyncWebClient
-from slack_sdk.http_retry.builtin_async_handlers import AsyncRateLimitErrorRetryHandler
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 from slack_bolt import App
 from config import Config
@@ -9,18 +8,39 @@ from config import Config
 config = Config()
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
-client = AsyncWebClient(token=config.SLACK_BOT_TOKEN)
-rate_limit_handler = AsyncRateLimitErrorRetryHandler(max_retry_count=1)
-client.retry_handlers.append(rate_limit_handler)
+
+# Imported once the config exists, which they read at import
+from app import metrics, routing  # noqa: E402
+from app.breaker import CircuitBreaker  # noqa: E402
+from app.slack_scheduler import SlackScheduler  # noqa: E402
+
+slack_breaker = CircuitBreaker(config.SLACK_BREAKER_FAILURES, config.SLACK_BREAKER_SLOW_CALL,
+                               config.SLACK_BREAKER_COOLDOWN)
+client = SlackScheduler(metrics.InstrumentedClient(AsyncWebClient(token=config.SLACK_BOT_TOKEN,
+                                                                  base_url=config.SLACK_API_URL)),
+                        max_retries=config.SLACK_MAX_RETRIES,
+                        breaker=slack_breaker,
+                        shared=True)
+metrics.registry.register(metrics.Gauge(
+    "mergeminion_slack_queue_depth", "Slack Web API calls waiting for their rate limit.", ('bucket',),
+    lambda: {(bucket,): depth for bucket, depth in client.queue_depth().items()}))
+metrics.registry.register(metrics.Gauge(
+    "mergeminion_slack_breaker_open", "Workers whose Slack circuit breaker is open or probing.", (),
+    lambda: {(): 0 if slack_breaker.is_closed() else 1}))
+# The token is verified on the first Socket Mode event instead of at import, so workers start without reaching Slack
 bolt_app = App(token=config.SLACK_BOT_TOKEN,
-               signing_secret=config.SLACK_SIGNING_SECRET)
+               signing_secret=config.SLACK_SIGNING_SECRET,
+               token_verification_enabled=False)
+# Socket Mode and the event handlers call the same Slack API as the rest of the app
+bolt_app.client.base_url = config.SLACK_API_URL
 handler = SocketModeHandler(bolt_app, config.SLACK_APP_TOKEN)
-handler.connect()
 
 
 def create_app(config_class: Config):
     app.config.from_object(config_class)
     app.url_map.strict_slashes = False
+    # Fail on start rather than on the first webhook when the routing does not validate
+    routing.get()
 
     with app.app_context():
         from . import routes
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Optional
+from aiohttp import ClientError
+from slack_sdk.errors import SlackApiError
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def is_degraded(error: Optional[BaseException]) -> bool:
+    """
+    Check if a failed Slack call points at Slack being down, rather than at the call: timeouts, connection errors
+    and 5xx responses.
+
+    :param error: Optional[BaseException]: error of the call, None if it succeeded
+    :return: bool
+    """
+    if isinstance(error, SlackApiError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, (ClientError, asyncio.TimeoutError, OSError))
+
+
+class CircuitBreaker:
+    """
+    Stops calling Slack when it is degraded. After failure_threshold calls in a row failed or took longer than
+    slow_call seconds the breaker opens, and calls fail right away with CircuitOpenError. After cooldown seconds one
+    call is let through to probe Slack: the breaker closes when it succeeds and opens again when it fails.
+    """
+
+    def __init__(self, failure_threshold: int, slow_call: float, cooldown: float):
+        """
+        :param failure_threshold: int: failed or slow calls in a row that open the breaker
+        :param slow_call: float: seconds after which a call counts as failed
+        :param cooldown: float: seconds the breaker stays open before Slack is probed
+        """
+        self.failure_threshold = failure_threshold
+        self.slow_call = slow_call
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.trips = 0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """
+        Let a call through, or raise CircuitOpenError if the breaker is open or already probing.
+
+        :return: None
+        """
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return
+        raise CircuitOpenError("Slack is degraded, the circuit breaker is open")
+
+    def record(self, duration: float, error: Optional[BaseException] = None) -> None:
+        """
+        Count the outcome of a call that was let through.
+
+        :param duration: float: seconds the call took
+        :param error: Optional[BaseException]: error of the call, None if it succeeded
+        :return: None
+        """
+        failed = is_degraded(error) or duration >= self.slow_call
+        with self.lock:
+            probe = self.state == HALF_OPEN and self.probing
+            self.probing = False
+            if not failed:
+                self.failures = 0
+                if probe:
+                    self.state = CLOSED
+                    logging.info("Slack recovered, the circuit breaker is closed")
+                return
+
+            self.failures += 1
+            if probe or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.trips += 1
+                logging.error(f"Slack is degraded after {self.failures} failed calls, the circuit breaker is open for "
+                              f"{self.cooldown}s: {error or f'call took {duration:.1f}s'}")
+
+    def cancel(self) -> None:
+        """
+        Forget a call that was let through but cancelled, so another call can probe Slack.
+
+        :return: None
+        """
+        with self.lock:
+            self.probing = False
+
+    def is_available(self) -> bool:
+        """
+        Check if a call would be let through, without letting it through.
+
+        :return: bool
+        """
+        with self.lock:
+            return (self.state == CLOSED or (self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown)
+                    or (self.state == HALF_OPEN and not self.probing))
+
+    def is_closed(self) -> bool:
+        return self.state == CLOSED
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {'state': self.state, 'failures': self.failures, 'trips': self.trips,
+                    'open_for': time.monotonic() - self.opened_at if self.state != CLOSED else 0}
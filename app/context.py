@@ -0,0 +1,16 @@
+from dataclasses import dataclass
+from typing import Dict
+from app.users import UserDirectory
+from app.events import MergeRequestEvent
+
+
+@dataclass(frozen=True)
+class EventContext:
+    """
+    Everything needed to render the Slack messages of a single webhook: the webhook payload, its decoded event and
+    the Slack user directory. Built once per webhook and passed explicitly, so rendering does not depend on the Flask
+    request and can run in background workers.
+    """
+    data: Dict
+    users: UserDirectory
+    event: MergeRequestEvent
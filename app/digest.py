@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Set
+from slack_sdk.errors import SlackApiError
+from app import client, config, metrics, parser, routing, runtime, store, thread_index
+from app.context import EventContext
+from app.mr_queue import MergeRequestQueue
+
+POLL_INTERVAL = 10
+MAX_BLOCKS = 50
+
+
+def get_update_types(channel_id: str) -> Set[str]:
+    """
+    The update types that the teams of a channel collect in their digest, from the digest mapping.
+
+    :param channel_id: str: Slack channel id
+    :return: Set of update types
+    """
+    return routing.get().digest_types.get(channel_id, frozenset())
+
+
+def is_digested(channel_id: str, action: str, update_type: str) -> bool:
+    """
+    Check if an event is collected in the digest of the channel instead of being posted right away. Only updates are,
+    merges, approvals and the other actions are always posted right away.
+
+    :param channel_id: str: Slack channel id
+    :param action: str: MR action
+    :param update_type: str: Kind of update
+    :return: bool
+    """
+    return action == 'update' and update_type in get_update_types(channel_id)
+
+
+def append(channel_id: str, ts: str, ctx: EventContext, reply: list) -> None:
+    """
+    Add the thread reply of an event to the digest of the channel.
+
+    :param channel_id: str: Slack channel id
+    :param ts: str: ts of the thread start message
+    :param ctx: EventContext: webhook context
+    :param reply: list: thread reply blocks
+    :return: None
+    """
+    entry = {'title': ctx.event.title, 'url': ctx.event.url,
+             'lines': [parser.deep_get(block, "text.text", '') for block in reply]}
+    store.get_connection().execute("INSERT INTO digest (channel, ts, entry, created) VALUES (?, ?, ?, ?)",
+                                   (channel_id, ts, json.dumps(entry), time.time()))
+    metrics.DIGEST_EVENTS.inc()
+
+
+def parse_digest_to_blocks(entries: List[Dict], thread_ts: List[str]) -> list:
+    """
+    Generate Blocks for a digest message, one section per MR.
+
+    :param entries: List[Dict]: digest entries in the order of the events
+    :param thread_ts: List[str]: ts of the thread start messages of the entries
+    :return: Slack message blocks
+    """
+    merge_requests = {}
+    for entry, ts in zip(entries, thread_ts):
+        merge_requests.setdefault(ts, (entry['url'], entry['title'], []))[2].extend(entry['lines'])
+
+    blocks = [{"type": "section",
+               "text": {"type": "mrkdwn",
+                        "text": f"*Merge request digest:* {len(entries)} updates of {len(merge_requests)} merge "
+                                f"requests"}}]
+    for url, title, lines in merge_requests.values():
+        text = f"*<{url}|{title}>*\n" + "\n".join(f"• {line}" for line in lines)
+        blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": text[:3000]}})
+    return blocks
+
+
+async def update_root(queue: MergeRequestQueue, channel_id: str, ts: str) -> None:
+    """
+    Update a thread start message to its latest state while holding the lock of its MR, so the update cannot
+    overtake or undo one of an event of the MR. A thread start with a pending batch is left to the batch, that
+    sends the latest state anyway.
+
+    :param queue: MergeRequestQueue: MR queue of the event handlers
+    :param channel_id: str: Slack channel id
+    :param ts: str: ts of the thread start message
+    :return: None
+    """
+    root = thread_index.get_thread_message(channel_id, ts)
+    if root is None:
+        return
+    mr_id = parser.deep_get(root, "metadata.event_payload.mr_id")
+    async with queue.acquire(channel_id, mr_id):
+        if queue.has_batch(channel_id, mr_id):
+            return
+        root = thread_index.get_thread_message(channel_id, ts)
+        try:
+            response = await client.chat_update(channel=channel_id,
+                                                ts=ts,
+                                                blocks=root['blocks'],
+                                                metadata=root['metadata'],
+                                                text='')
+            assert response["ok"] is True
+        except SlackApiError as e:
+            # A thread start that was deleted does not hold back the digest
+            logging.error(f"Failed to update thread {ts} of the digest of {channel_id}: {e}")
+
+
+async def flush_channel(queue: MergeRequestQueue, channel_id: str, entries: List[Dict], thread_ts: List[str]) -> None:
+    """
+    Send the digest of a channel: the thread start messages of the MRs are updated once to their latest state, and
+    the updates are posted as one summary message.
+
+    :param queue: MergeRequestQueue: MR queue of the event handlers
+    :param channel_id: str: Slack channel id
+    :param entries: List[Dict]: digest entries in the order of the events
+    :param thread_ts: List[str]: ts of the thread start messages of the entries
+    :return: None
+    """
+    for ts in dict.fromkeys(thread_ts):
+        await update_root(queue, channel_id, ts)
+
+    blocks = parse_digest_to_blocks(entries, thread_ts)
+    for i in range(0, len(blocks), MAX_BLOCKS):
+        try:
+            response = await client.chat_postMessage(channel=channel_id,
+                                                     blocks=blocks[i:i + MAX_BLOCKS],
+                                                     unfurl_links=False,
+                                                     text='')
+            assert response["ok"] is True
+        except SlackApiError as e:
+            assert e.response['ok'] is False
+            assert e.response["error"]
+            raise e
+
+
+async def flush_due(queue: MergeRequestQueue) -> None:
+    """
+    Send the digests of all channels whose oldest entry has waited DIGEST_INTERVAL seconds. Entries are removed once
+    their digest is sent, a channel that fails is retried on the next poll.
+
+    :param queue: MergeRequestQueue: MR queue of the event handlers
+    :return: None
+    """
+    conn = store.get_connection()
+    rows = conn.execute(
+        "SELECT id, channel, ts, entry FROM digest WHERE channel IN "
+        "(SELECT channel FROM digest GROUP BY channel HAVING MIN(created) <= ?) ORDER BY id",
+        (time.time() - config.DIGEST_INTERVAL,)).fetchall()
+
+    channels = {}
+    for row in rows:
+        channels.setdefault(row[1], []).append(row)
+    for channel_id, channel_rows in channels.items():
+        try:
+            await flush_channel(queue, channel_id, [json.loads(row[3]) for row in channel_rows],
+                                [row[2] for row in channel_rows])
+        except SlackApiError as e:
+            logging.error(f"Failed to send the digest of {channel_id}: {e}")
+            continue
+        with store.transaction() as conn:
+            conn.executemany("DELETE FROM digest WHERE id = ?", [(row[0],) for row in channel_rows])
+        logging.info(f"Sent digest of {len(channel_rows)} updates to {channel_id}")
+
+
+async def scheduler(queue: MergeRequestQueue) -> None:
+    while True:
+        await asyncio.sleep(POLL_INTERVAL)
+        try:
+            await flush_due(queue)
+        except Exception as e:
+            logging.error(f"Failed to send the digests: {e}")
+
+
+def start(queue: MergeRequestQueue) -> None:
+    """
+    Start sending the digests from this process. Only the Socket Mode owner does, so every digest is sent once.
+
+    :param queue: MergeRequestQueue: MR queue of the event handlers, whose locks the thread start updates take
+    :return: None
+    """
+    loop = runtime.get_loop()
+    loop.call_soon_threadsafe(lambda: loop.create_task(scheduler(queue)))
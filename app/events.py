@@ -0,0 +1,81 @@
+from typing import Dict, Optional, Tuple
+from app.paths import compile_path
+from app.templates import NEW_MR
+
+EVENT_PATHS = (
+    ('object_kind', "object_kind"),
+    ('username', "user.username"),
+    ('web_url', "project.web_url"),
+    ('mr_id', "object_attributes.id"),
+    ('iid', "object_attributes.iid"),
+    ('title', "object_attributes.title"),
+    ('url', "object_attributes.url"),
+    ('action', "object_attributes.action"),
+    ('source_branch', "object_attributes.source_branch"),
+    ('target_branch', "object_attributes.target_branch"),
+    ('updated_at', "object_attributes.updated_at"),
+    ('last_commit_id', "object_attributes.last_commit.id"),
+    ('last_commit_url', "object_attributes.last_commit.url"),
+    ('project_url', "object_attributes.target.web_url"),
+    ('project_name', "object_attributes.target.name"),
+)
+THREAD_PATHS = (
+    ('ts', "ts"),
+    ('blocks', "blocks"),
+    ('metadata', "metadata"),
+    ('target_branch', "metadata.event_payload.target_branch"),
+    ('assignees', "metadata.event_payload.assignees"),
+    ('reviewers', "metadata.event_payload.reviewers"),
+    ('target_branch_text', NEW_MR.path('branches')),
+    ('status', NEW_MR.path('status')),
+    ('assignee_text', NEW_MR.path('assignees')),
+    ('reviewer_text', NEW_MR.path('reviewers')),
+)
+EVENT_FIELDS = tuple((name, compile_path(path)) for name, path in EVENT_PATHS)
+THREAD_FIELDS = tuple((name, compile_path(path)) for name, path in THREAD_PATHS)
+
+
+def usernames(users) -> Tuple[str, ...]:
+    return tuple(user.get('username') for user in users) if isinstance(users, list) else ()
+
+
+class MergeRequestEvent:
+    """
+    The fields of a GitLab merge request webhook that the app uses, decoded once from the payload.
+    changed_assignees and changed_reviewers are None unless the event changed them.
+    """
+    __slots__ = tuple(name for name, _ in EVENT_FIELDS) + ('has_oldrev', 'changes', 'assignees', 'reviewers',
+                                                          'changed_assignees', 'changed_reviewers')
+
+    def __init__(self, data: Dict):
+        for name, get in EVENT_FIELDS:
+            setattr(self, name, get(data))
+
+        changes = data.get('changes') or {}
+        self.has_oldrev = 'oldrev' in (data.get('object_attributes') or {})
+        self.changes = changes
+        self.assignees = usernames(data.get('assignees'))
+        self.reviewers = usernames(data.get('reviewers'))
+        self.changed_assignees = usernames(changes['assignees'].get('current')) if 'assignees' in changes else None
+        self.changed_reviewers = usernames(changes['reviewers'].get('current')) if 'reviewers' in changes else None
+
+    def get_users(self, user_type: str, is_change: bool) -> Optional[Tuple[str, ...]]:
+        """
+        :param user_type: str: reviewers or assignees
+        :param is_change: bool: the changed users instead of the current ones
+        :return: Tuple of GitLab usernames
+        """
+        if user_type == 'assignees':
+            return self.changed_assignees if is_change else self.assignees
+        return self.changed_reviewers if is_change else self.reviewers
+
+
+class ThreadState:
+    """
+    The state of an MR thread start message, decoded once from the Slack message.
+    """
+    __slots__ = tuple(name for name, _ in THREAD_FIELDS)
+
+    def __init__(self, message: Dict):
+        for name, get in THREAD_FIELDS:
+            setattr(self, name, get(message))
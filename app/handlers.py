@@ -1,101 +1,240 @@
+import asyncio
+import time
 from typing import Dict, Optional, Awaitable
 from slack_sdk.errors import SlackApiError
 from app import client
 from app.models import *
-from async_lru import alru_cache
-from app import config
+from app.history import HistoryCache
+from app.users import UserDirectory
+from app.mr_queue import MergeRequestQueue, Batch
+from app.context import EventContext
+from app.events import MergeRequestEvent
+from app import config, digest, idempotency, metrics, thread_index, tracing, user_store
 import logging
 
+USERS_PAGE_SIZE = 200
+USERS_POLL_INTERVAL = 0.5
+MAX_BLOCKS = 50
 
-async def handle_mr_notify(data: Dict, channel_name: str):
+
+async def handle_mr_notify(data: Dict, channel_name: str, event_uuid: Optional[str] = None) -> Dict[str, object]:
     """
     The handle_mr_notify function is the main function that handles all merge request webhooks.
     It first checks if the object_kind is a merge_request, and then checks if it's a draft MR.
     If it's not either of those, then we know that this is an open or update MR event.
+    The webhook is parsed once and sent to the channels of all teams in channel_name at the same time.
+    Deliveries that were already handled in a channel, e.g. GitLab retrying after a timeout, are dropped before any
+    Slack call.
 
     :param data: Dict: Get the data from the webhook
-    :param channel_name: str: Determine which channel to send the message to
-    :return: None
+    :param channel_name: str: Comma separated team names, each team has one or more channels
+    :param event_uuid: Optional[str]: X-Gitlab-Event-UUID header
+    :return: Result per channel id: the update type, 'new' for a new thread, 'duplicate' for a delivery that was
+             handled, or the exception the channel failed with, InProgressError while another worker handles it
     """
-    if data.get('object_kind', '') != "merge_request":
-        raise ValueError(f"Enable MR webhook on project: {parser.deep_get(data, 'project.web_url')}")
-
-    title = parser.deep_get(data, "object_attributes.title")
-    username = data.get('user').get('username', '')
+    event = MergeRequestEvent(data)
+    if event.object_kind != "merge_request":
+        raise ValueError(f"Enable MR webhook on project: {event.web_url}")
 
     # Do not notify in slack if draft MR
-    if config.EXCLUDE_DRAFT and parser.is_draft(title):
+    if config.EXCLUDE_DRAFT and parser.is_draft(event.title):
+        metrics.DRAFT_SKIPPED.inc()
         raise ValueError("Draft MR, no slack update will be sent")
 
-    action =  parser.deep_get(data, "object_attributes.action")
-    channel_id = parser.get_channel_id(channel_name)
+    tracing.set_attributes(mr_id=event.mr_id, action=event.action)
+    channel_ids = parser.get_channel_ids(channel_name)
+    if not channel_ids:
+        raise ValueError(f"No Slack channel for team {channel_name}")
 
-    # Check if a Draft has been marked ready
-    is_ready = False
-    if config.NOTIFY_WHEN_MR_READY:
-        is_ready = parser.is_ready(action, data.get('changes', ''))
+    results = {}
+    keys = {}
+    for channel_id in channel_ids:
+        key = idempotency.event_key(channel_id, data, event_uuid)
+        try:
+            claimed = idempotency.claim(key)
+        except idempotency.InProgressError as e:
+            logging.info(e)
+            results[channel_id] = e
+            continue
+        if claimed:
+            keys[channel_id] = key
+        else:
+            metrics.DUPLICATE_WEBHOOKS.inc()
+            logging.info(f"Skipped duplicate delivery of {event.action} event of MR {event.mr_id} to {channel_id}")
+            results[channel_id] = 'duplicate'
+    if not keys:
+        return results
 
-    user_list = await get_users_list()
-    parser.set_user_list(user_list)
+    try:
+        # Check if a Draft has been marked ready
+        is_ready = False
+        if config.NOTIFY_WHEN_MR_READY:
+            is_ready = parser.is_ready(event.action, event.changes)
 
-    if action == 'open' or is_ready:
-        user_id = parser.parse_username_to_slack_id(username)
-        await send_new_msg(data, channel_id, user_id, is_ready)
-    else:
-        await send_upd_msg(data, channel_id, username)
+        with tracing.span("users.directory"):
+            users = await get_user_directory()
+    except BaseException:
+        # Let the delivery be retried
+        for key in keys.values():
+            idempotency.release(key)
+        raise
 
+    ctx = EventContext(data, users, event)
+    sent = await asyncio.gather(*(notify_claimed(ctx, channel_id, key, is_ready) for channel_id, key in keys.items()),
+                                return_exceptions=True)
+    for channel_id, result in zip(keys, sent):
+        if isinstance(result, BaseException):
+            logging.error(f"Failed to notify channel {channel_id}: {result}")
+        results[channel_id] = result
+    return {channel_id: results[channel_id] for channel_id in channel_ids}
 
-async def send_new_msg(data: Dict, channel_id: str, user_id: str, is_ready: bool):
+
+async def notify_claimed(ctx: EventContext, channel_id: str, key: str, is_ready: bool) -> str:
+    """
+    Send the message of a claimed delivery to one channel. The delivery is marked as handled once it was sent, and
+    the claim is released when sending fails or is cancelled, so GitLab or the spool can deliver the event to the
+    channel again.
+
+    :param ctx: EventContext: Webhook data and user directory
+    :param channel_id: str: Slack channel id
+    :param key: str: idempotency key of the delivery to the channel
+    :param is_ready: bool: Draft marked as Ready
+    :return: The update type of the event, 'new' for a new thread
+    """
+    try:
+        update_type = await notify_channel(ctx, channel_id, is_ready)
+    except BaseException:
+        idempotency.release(key)
+        raise
+    idempotency.done(key)
+    return update_type
+
+
+async def notify_channel(ctx: EventContext, channel_id: str, is_ready: bool) -> str:
+    """
+    Send the message of a webhook to one channel.
+
+    :param ctx: EventContext: Webhook data and user directory
+    :param channel_id: str: Slack channel id
+    :param is_ready: bool: Draft marked as Ready
+    :return: The update type of the event, 'new' for a new thread
+    """
+    event = ctx.event
+    with tracing.span("channel", channel=channel_id):
+        if event.action == 'open' or is_ready:
+            user_id = parser.parse_username_to_slack_id(ctx, event.username)
+            async with mr_queue.acquire(channel_id, event.mr_id):
+                await send_new_msg(ctx, channel_id, user_id, is_ready)
+            return 'new'
+        update_type = await send_upd_msg(ctx, channel_id, event.username)
+        if event.action in ('merge', 'close', 'reopen'):
+            thread_index.set_closed(channel_id, event.mr_id, event.action != 'reopen')
+        return update_type
+
+
+async def send_new_msg(ctx: EventContext, channel_id: str, user_id: str, is_ready: bool):
     """
     The send_new_msg function is used to send a new message to the channel.
 
     :param is_ready: bool: Draft marked as Ready
     :param user_id: str: Slack user ID
-    :param data: Dict: Pass in the data from the webhook
+    :param ctx: EventContext: Webhook data and user directory
     :param channel_id: str: Specify the channel to send the message to
     :return: None
     """
+    with tracing.span("render.blocks"):
+        blocks = parser.parse_request_to_nm_blocks(ctx, user_id, is_ready)
+        metadata = parser.parse_request_to_nm_metadata(ctx)
     try:
         response = await client.chat_postMessage(channel=channel_id,
-                                                 blocks=parser.parse_request_to_nm_blocks(data, user_id, is_ready),
-                                                 metadata=parser.parse_request_to_nm_metadata(data),
+                                                 blocks=blocks,
+                                                 metadata=metadata,
                                                  unfurl_links=False,
                                                  text='')
         assert response["ok"] is True
-        logging.info("Bot posted new message to the channel. Clearing channel history cache.")
-        get_message_history.cache_clear()
+        thread_index.save_thread_ts(channel_id, ctx.event.mr_id, response["ts"])
+        thread_index.save_thread_message(channel_id, {'ts': response["ts"], 'blocks': blocks, 'metadata': metadata})
+        history_cache.add(channel_id, {'ts': response["ts"], 'blocks': blocks, 'metadata': metadata})
+        logging.info("Bot posted new message to the channel.")
     except SlackApiError as e:
         assert e.response['ok'] is False
         assert e.response["error"]
         raise e
 
 
-async def send_upd_msg(data, channel_id, username):
+async def send_upd_msg(ctx: EventContext, channel_id: str, username: str):
     """
     The send_upd_msg function is responsible for sending the update message to Slack, as well as updating thread start.
+    Events of the same MR are applied one at a time to the latest root message state, and the resulting Slack calls
+    are coalesced by the MR queue. Events that change nothing but the Last Update field are not sent to Slack, the
+    new Last Update is sent along with the next visible change. Updates of the types in the digest of the channel
+    are added to the digest, and the root message is updated when the digest is sent.
 
-    :param data: Dict: Pass in the data from the webhook
+    :param ctx: EventContext: Webhook data and user directory
     :param channel_id: str: Specify the channel to send the message to
     :param username: str: Slack username
-    :return: None
+    :return: The update type
     """
-    message_history = await get_message_history(channel_id)
-    history_thread = parser.get_thread_start(data, message_history)
+    mr_id = ctx.event.mr_id
+
+    async with mr_queue.acquire(channel_id, mr_id):
+        history_thread = mr_queue.get_pending_root(channel_id, mr_id)
+        if history_thread is None:
+            with tracing.span("thread.get"):
+                history_thread = await get_thread(mr_id, channel_id)
+
+        if history_thread is None:
+            metrics.THREAD_NOT_FOUND.inc()
+            raise ValueError("Thread not found")
+
+        with tracing.span("thread.build"):
+            previous = visible_state(history_thread)
+            thread = Thread(history_thread, ctx)
+        update_type = thread.get_update_type()
+        assignee_list = [thread.old_assignees, thread.old_reviewers, thread.get_assignees(), thread.get_reviewers()]
+        action = ctx.event.action
+        reply = None
+        if (update_type != '' and action == 'update') or action != 'update':
+            with tracing.span("render.blocks"):
+                reply = parser.parse_request_to_um_blocks(ctx, username, update_type, assignee_list)
+
+        root = {'ts': thread.ts, 'blocks': thread.blocks, 'metadata': thread.metadata, 'text': thread.text}
+        if reply is not None and digest.is_digested(channel_id, action, update_type):
+            digest.append(channel_id, thread.ts, ctx, reply)
+            if not mr_queue.has_batch(channel_id, mr_id):
+                save_root(channel_id, root)
+                return update_type
+            reply = None
+
+        if reply is None and not mr_queue.has_batch(channel_id, mr_id) and visible_state(root) == previous:
+            skip_update(channel_id, root)
+            return update_type
 
-    if history_thread is None:
-        raise ValueError("Thread not found")
+        done = mr_queue.submit(channel_id, mr_id,
+                               root=root,
+                               reply=reply,
+                               reply_metadata=parser.parse_request_to_um_metadata(ctx))
+    with tracing.span("mr_queue.wait"):
+        await done
+    return update_type
 
-    thread = Thread(history_thread, data)
-    update_type = thread.get_update_type()
-    assignee_list = [thread.old_assignees, thread.old_reviewers, thread.get_assignees(), thread.get_reviewers()]
-    action = parser.deep_get(data, "object_attributes.action")
-    if (update_type != '' and action == 'update') or action != 'update':
+
+async def flush_updates(batch: Batch):
+    """
+    The flush_updates function sends a coalesced MR batch to Slack: the collected replies are posted to the thread
+    as one message, and the root message is updated once with the final state, unless the events of the batch left
+    it as it is.
+
+    :param batch: Batch: Pending Slack work of an MR thread
+    :return: None
+    """
+    root = batch.root
+    for i in range(0, len(batch.replies), MAX_BLOCKS):
         try:
-            response = await client.chat_postMessage(channel=channel_id,
-                                                     blocks=parser.parse_request_to_um_blocks(username, update_type,
-                                                                                              assignee_list),
-                                                     metadata=parser.parse_request_to_um_metadata(data),
-                                                     thread_ts=thread.ts,
+            response = await client.chat_postMessage(channel=batch.channel,
+                                                     blocks=batch.replies[i:i + MAX_BLOCKS],
+                                                     metadata=batch.reply_metadata,
+                                                     thread_ts=root['ts'],
                                                      unfurl_links=False,
                                                      text='')
             assert response["ok"] is True
@@ -104,52 +243,159 @@ async def send_upd_msg(data, channel_id, username):
             assert e.response["error"]
             raise e
 
+    current = thread_index.get_thread_message(batch.channel, root['ts'])
+    if current is not None and visible_state(current) == visible_state(root):
+        skip_update(batch.channel, root)
+        return
+
     try:
-        response = await client.chat_update(channel=channel_id,
-                                            ts=thread.ts,
-                                            blocks=thread.blocks,
-                                            metadata=thread.metadata,
-                                            text=thread.text)
+        response = await client.chat_update(channel=batch.channel,
+                                            ts=root['ts'],
+                                            blocks=root['blocks'],
+                                            metadata=root['metadata'],
+                                            text=root['text'])
         assert response["ok"] is True
+        thread_index.save_thread_message(batch.channel, root)
+        history_cache.update(batch.channel, root['ts'], root['blocks'], root['metadata'])
     except SlackApiError as e:
         assert e.response['ok'] is False
         assert e.response["error"]
         raise e
 
 
-@alru_cache(maxsize=10, ttl=None)
-async def get_message_history(channel: str) -> Awaitable[Dict]:
+def skip_update(channel_id: str, root: Dict) -> None:
     """
-    The get_message_history function takes a channel ID as an argument and returns the last 100 messages in that channel.
+    Keep a root message state that is not worth a chat.update call. The state is saved as if it was sent, so the
+    next update that is sent carries its Last Update.
+
+    :param channel_id: str: Slack channel id
+    :param root: Dict: root message state (ts, blocks, metadata)
+    :return: None
+    """
+    stored = thread_index.get_thread_message(channel_id, root['ts'])
+    if stored is not None and stored.get('blocks') == root['blocks']:
+        metrics.SLACK_CALLS_SAVED.inc(reason='unchanged')
+        return
+
+    metrics.SLACK_CALLS_SAVED.inc(reason='last_update')
+    save_root(channel_id, root)
+
+
+def save_root(channel_id: str, root: Dict) -> None:
+    thread_index.save_thread_message(channel_id, root)
+    history_cache.update(channel_id, root['ts'], root['blocks'], root['metadata'])
+
+
+mr_queue = MergeRequestQueue(flush_updates, window=config.MR_COALESCE_WINDOW)
+
+
+async def get_thread(mr_id: int, channel_id: str) -> Optional[Dict]:
+    """
+    The get_thread function finds the mr_created message of the MR in the channel. The thread index is consulted first,
+    so the message is found even if it is no longer in the recent channel history, and its latest state is taken from
+    the shared thread store, so workers never continue from a stale copy. MRs that were posted before the index
+    existed are found by searching the channel history, and are added to the index.
+
+    :param mr_id: int: GitLab MR id
+    :param channel_id: str: Slack channel id
+    :return: Matching message or None
+    """
+    ts = thread_index.get_thread_ts(channel_id, mr_id)
+    if ts is not None:
+        history_thread = thread_index.get_thread_message(channel_id, ts)
+        if history_thread is not None:
+            return history_thread
+
+    history_thread = await history_cache.find_thread(channel_id, mr_id, ts)
+    if history_thread is not None:
+        if ts is None:
+            thread_index.save_thread_ts(channel_id, mr_id, history_thread['ts'])
+        thread_index.save_thread_message(channel_id, history_thread)
+    return history_thread
+
+
+async def get_history_page(channel: str, **kwargs) -> Dict:
+    """
+    The get_history_page function fetches one page of the channel history, including message metadata.
 
     :param channel: str: Specify the channel to get the message history from
-    :return: A dictionary of messages
+    :param kwargs: conversations.history arguments, e.g. oldest, latest, limit or cursor
+    :return: conversations.history response
     """
     try:
         response = await client.conversations_history(channel=channel,
-                                                      limit=100,
-                                                      include_all_metadata=True)
+                                                      include_all_metadata=True,
+                                                      **kwargs)
         assert response['ok'] is True
-        return response['messages']
+        return response
     except SlackApiError as e:
         assert e.response['ok'] is False
         assert e.response["error"]
         raise e
 
 
-@alru_cache(maxsize=1, ttl=None)
+history_cache = HistoryCache(get_history_page,
+                             max_channels=config.HISTORY_MAX_CHANNELS,
+                             max_threads=config.HISTORY_MAX_THREADS,
+                             max_pages=config.HISTORY_MAX_PAGES)
+
+
+async def get_user_directory() -> UserDirectory:
+    """
+    The get_user_directory function returns the indexed directory of all users in the workspace. The users list is
+    downloaded once by the process that owns the Socket Mode connection, which also publishes the team_join and
+    user_change events to the shared user store. Every worker applies the changes since it last looked.
+
+    :return: The user directory
+    """
+    async with user_directory_lock:
+        metrics.CACHE_REQUESTS.inc(cache='users', result='hit' if user_directory.loaded else 'miss')
+        if not user_directory.loaded:
+            await wait_for_users()
+        user_directory.seq, users = user_store.changes(user_directory.seq)
+        if not user_directory.loaded:
+            user_directory.load(users)
+        else:
+            for user in users:
+                user_directory.upsert(user)
+    return user_directory
+
+
+async def wait_for_users() -> None:
+    """
+    The wait_for_users function waits until the Socket Mode owner has published the users list.
+
+    :return: None
+    :raises UsersNotLoadedError: if the users list is not published within USERS_WAIT_TIMEOUT seconds
+    """
+    deadline = time.monotonic() + config.USERS_WAIT_TIMEOUT
+    while not user_store.is_loaded():
+        if time.monotonic() > deadline:
+            raise user_store.UsersNotLoadedError("The users list has not been published by the Socket Mode owner")
+        await asyncio.sleep(USERS_POLL_INTERVAL)
+
+
 async def get_users_list() -> Awaitable[list]:
     """
-    The get_users_list function returns a list of all users in the workspace.
+    The get_users_list function returns a list of all users in the workspace, paging through the whole users list.
 
     :return: A list of all the users in your workspace
     """
+    members = []
+    cursor = None
     try:
-        response = await client.users_list()
-
-        assert response['ok'] is True
-        return response['members']
+        while True:
+            response = await client.users_list(cursor=cursor, limit=USERS_PAGE_SIZE)
+            assert response['ok'] is True
+            members.extend(response['members'])
+            cursor = parser.deep_get(response, "response_metadata.next_cursor")
+            if not cursor:
+                return members
     except SlackApiError as e:
         assert e.response['ok'] is False
         assert e.response["error"]
         raise e
+
+
+user_directory = UserDirectory()
+user_directory_lock = asyncio.Lock()
@@ -0,0 +1,48 @@
+import sqlite3
+import time
+from typing import Dict
+from app import config, slack_breaker, socket_mode, spool, store, user_store, warmup
+import app.handlers as handlers
+
+
+def readiness() -> Dict:
+    """
+    Check whether the app can handle webhooks: the state database is reachable, the Socket Mode owner is connected
+    to Slack and has published the users list, with WARMUP_ON_START the thread index is built, and the backlog of
+    webhooks waiting for Slack is not full. Also reports the Slack circuit breaker and how warm the caches of this
+    worker are.
+
+    :return: Dict with ready, the checks and the cache state
+    """
+    checks = {'state_db': False, 'slack': False, 'users': False, 'backlog': False}
+    if config.WARMUP_ON_START:
+        checks['warm_up'] = False
+    heartbeat = {}
+    threads = backlog = 0
+    try:
+        threads = store.get_connection().execute("SELECT COUNT(*) FROM thread_index").fetchone()[0]
+        checks['state_db'] = True
+        heartbeat = socket_mode.get_heartbeat()
+        checks['slack'] = (heartbeat.get('connected') is True and
+                           time.time() - heartbeat['time'] < 3 * config.SOCKET_MODE_ELECTION_INTERVAL)
+        checks['users'] = user_store.is_loaded()
+        backlog = spool.size()
+        checks['backlog'] = backlog < config.BACKLOG_MAX_SIZE
+        if config.WARMUP_ON_START:
+            checks['warm_up'] = warmup.is_done()
+    except sqlite3.Error:
+        pass
+
+    return {
+        'ready': all(checks.values()),
+        'checks': checks,
+        'socket_mode': {'owner_pid': heartbeat.get('pid'), 'is_owner': socket_mode.is_owner()},
+        'slack_breaker': slack_breaker.snapshot(),
+        'backlog': backlog,
+        'caches': {
+            'user_directory': handlers.user_directory.loaded,
+            'users': len(handlers.user_directory.keys),
+            'history_channels': len(handlers.history_cache.channels),
+            'indexed_threads': threads,
+        },
+    }
@@ -0,0 +1,160 @@
+import copy
+from collections import OrderedDict
+from typing import Dict, Optional, Callable, Awaitable
+from app import metrics, parser
+
+PAGE_SIZE = 100
+
+
+class ChannelHistory:
+    """
+    Compact history of a single channel. Only the mr_created messages are kept, and only the fields Thread needs.
+    newest_ts and oldest_ts mark the range of the channel history that has been fetched so far.
+    """
+    __slots__ = ('threads', 'mr_ids', 'newest_ts', 'oldest_ts', 'complete')
+
+    def __init__(self):
+        self.threads = {}
+        self.mr_ids = {}
+        self.newest_ts = None
+        self.oldest_ts = None
+        self.complete = False
+
+    def add(self, message: Dict, extend_range: bool = True) -> None:
+        ts = message.get('ts')
+        if extend_range:
+            self.newest_ts = ts if self.newest_ts is None or float(ts) > float(self.newest_ts) else self.newest_ts
+            self.oldest_ts = ts if self.oldest_ts is None or float(ts) < float(self.oldest_ts) else self.oldest_ts
+
+        if parser.deep_get(message, "metadata.event_type") != 'mr_created':
+            return
+
+        mr_id = parser.deep_get(message, "metadata.event_payload.mr_id")
+        self.threads[ts] = {'ts': ts, 'metadata': message.get('metadata'), 'blocks': message.get('blocks')}
+        # A draft marked as ready gets a new thread, the newest one is the one to update
+        if mr_id not in self.mr_ids or float(ts) > float(self.mr_ids[mr_id]):
+            self.mr_ids[mr_id] = ts
+
+    def evict(self, max_threads: int) -> None:
+        if len(self.threads) <= max_threads:
+            return
+
+        keep = sorted(self.threads, key=float, reverse=True)[:max_threads]
+        self.threads = {ts: self.threads[ts] for ts in keep}
+        self.mr_ids = {mr_id: ts for mr_id, ts in self.mr_ids.items() if ts in self.threads}
+        # Evicted threads can be paged back in again
+        self.oldest_ts = keep[-1]
+        self.complete = False
+
+
+class HistoryCache:
+    """
+    Per-channel cache of MR threads. New messages are fetched incrementally with the `oldest` cursor, and older
+    history is paged back through only when a thread can not be found otherwise. Channels are evicted least recently
+    used first, and every channel keeps at most max_threads threads.
+    """
+
+    def __init__(self, fetch: Callable[..., Awaitable[Dict]], max_channels: int, max_threads: int, max_pages: int):
+        """
+        :param fetch: Callable: coroutine calling conversations.history with the given channel and keyword arguments
+        :param max_channels: int: number of channels to keep
+        :param max_threads: int: number of threads to keep per channel
+        :param max_pages: int: number of history pages to fetch at most when looking for a thread
+        """
+        self.fetch = fetch
+        self.max_channels = max_channels
+        self.max_threads = max_threads
+        self.max_pages = max_pages
+        self.channels = OrderedDict()
+
+    def get_channel(self, channel: str) -> ChannelHistory:
+        history = self.channels.get(channel)
+        if history is None:
+            history = self.channels[channel] = ChannelHistory()
+            while len(self.channels) > self.max_channels:
+                self.channels.popitem(last=False)
+        self.channels.move_to_end(channel)
+        return history
+
+    async def find_thread(self, channel: str, mr_id: int, ts: Optional[str] = None) -> Optional[Dict]:
+        """
+        Find the thread start of an MR. Returns a copy, write changes back with update().
+
+        :param channel: str: Slack channel id
+        :param mr_id: int: GitLab MR id
+        :param ts: Optional[str]: thread ts, if it is already known
+        :return: Compact thread start message or None
+        """
+        history = self.get_channel(channel)
+        hit = ts in history.threads if ts is not None else mr_id in history.mr_ids
+        metrics.CACHE_REQUESTS.inc(cache='history', result='hit' if hit else 'miss')
+
+        if ts is None and mr_id not in history.mr_ids:
+            await self.fetch_newer(channel, history)
+
+            pages = 0
+            while mr_id not in history.mr_ids and not history.complete and pages < self.max_pages:
+                await self.fetch_older(channel, history)
+                pages += 1
+        elif ts is not None and ts not in history.threads:
+            await self.fetch_one(channel, history, ts)
+
+        ts = ts if ts is not None else history.mr_ids.get(mr_id)
+        thread = self.get(channel, ts) if ts is not None else None
+        history.evict(self.max_threads)
+        return thread
+
+    def get(self, channel: str, ts: str) -> Optional[Dict]:
+        thread = self.get_channel(channel).threads.get(ts)
+        return copy.deepcopy(thread) if thread is not None else None
+
+    def add(self, channel: str, message: Dict) -> None:
+        history = self.get_channel(channel)
+        history.add(copy.deepcopy(message))
+        history.evict(self.max_threads)
+
+    def update(self, channel: str, ts: str, blocks: list, metadata: Dict) -> None:
+        history = self.get_channel(channel)
+        if ts in history.threads:
+            history.threads[ts] = {'ts': ts, 'metadata': copy.deepcopy(metadata), 'blocks': copy.deepcopy(blocks)}
+
+    def clear(self) -> None:
+        self.channels.clear()
+
+    async def fetch_one(self, channel: str, history: ChannelHistory, ts: str) -> None:
+        response = await self.fetch(channel, latest=ts, oldest=ts, inclusive=True, limit=1)
+        for message in response['messages']:
+            history.add(message, extend_range=False)
+
+    async def fetch_newer(self, channel: str, history: ChannelHistory) -> None:
+        if history.newest_ts is None:
+            response = await self.fetch(channel, limit=PAGE_SIZE)
+            for message in response['messages']:
+                history.add(message)
+            history.complete = not response.get('has_more', False)
+            return
+
+        cursor = None
+        oldest = history.newest_ts
+        pages = []
+        for _ in range(self.max_pages):
+            response = await self.fetch(channel, oldest=oldest, limit=PAGE_SIZE, cursor=cursor)
+            pages.append(response['messages'])
+            cursor = parser.deep_get(response, "response_metadata.next_cursor")
+            if not response.get('has_more', False) or not cursor:
+                break
+        else:
+            # The pages, newest first, stopped short of newest_ts. The fetched messages become the range of the
+            # history, so the gap between them and the range fetched before is paged back by fetch_older
+            if pages:
+                history.newest_ts = history.oldest_ts = None
+                history.complete = False
+        for messages in pages:
+            for message in messages:
+                history.add(message)
+
+    async def fetch_older(self, channel: str, history: ChannelHistory) -> None:
+        response = await self.fetch(channel, latest=history.oldest_ts, limit=PAGE_SIZE)
+        for message in response['messages']:
+            history.add(message)
+        history.complete = not response.get('has_more', False)
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import time
+from typing import Dict, Optional
+from app import config, parser, store
+
+
+def event_key(channel_id: str, data: Dict, event_uuid: Optional[str] = None) -> str:
+    """
+    The key of a webhook delivery to a channel: the X-Gitlab-Event-UUID header, which GitLab keeps when it delivers an
+    event again, or a hash of the fields that identify the merge request event.
+
+    :param channel_id: str: Slack channel id, the same event can be sent to several channels
+    :param data: Dict: webhook request data
+    :param event_uuid: Optional[str]: X-Gitlab-Event-UUID header
+    :return: str
+    """
+    if event_uuid:
+        return f"{channel_id}:{event_uuid}"
+    fields = [parser.deep_get(data, path, None) for path in (
+        "object_attributes.id", "object_attributes.action", "object_attributes.updated_at",
+        "object_attributes.oldrev")]
+    return f"{channel_id}:" + hashlib.sha1(json.dumps(fields).encode()).hexdigest()
+
+
+class InProgressError(Exception):
+    """
+    The delivery is being handled by another worker, whose claim has not expired yet.
+    """
+
+
+def claim(key: str) -> bool:
+    """
+    Record that a webhook delivery is being handled, unless it was handled within the last IDEMPOTENCY_TTL seconds
+    by any worker. A claim of a worker that did not finish within IDEMPOTENCY_LEASE seconds, e.g. because it was
+    killed, is taken over. Expired keys are removed on the way, so the store stays bounded.
+
+    :param key: str: key of the delivery
+    :return: True if the delivery is new, False if it was handled
+    :raises InProgressError: if another worker is handling the delivery
+    """
+    if config.IDEMPOTENCY_TTL <= 0:
+        return True
+    now = time.time()
+    with store.transaction() as conn:
+        conn.execute("DELETE FROM webhook_events WHERE received < ?", (now - config.IDEMPOTENCY_TTL,))
+        row = conn.execute("SELECT state, claimed_at FROM webhook_events WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            conn.execute("INSERT INTO webhook_events (key, received, state, claimed_at) "
+                         "VALUES (?, ?, 'in_progress', ?)", (key, now, now))
+            return True
+        state, claimed_at = row
+        if state == 'done':
+            return False
+        if claimed_at is not None and claimed_at >= now - config.IDEMPOTENCY_LEASE:
+            raise InProgressError(f"Delivery {key} is being handled by another worker")
+        conn.execute("UPDATE webhook_events SET received = ?, claimed_at = ? WHERE key = ?", (now, now, key))
+        return True
+
+
+def done(key: str) -> None:
+    """
+    Mark a claimed delivery as handled, once its Slack calls succeeded. Only handled deliveries are dropped as
+    duplicates.
+
+    :param key: str: key of the delivery
+    :return: None
+    """
+    if config.IDEMPOTENCY_TTL > 0:
+        store.get_connection().execute(
+            "UPDATE webhook_events SET state = 'done', received = ? WHERE key = ?", (time.time(), key))
+
+
+def release(key: str) -> None:
+    """
+    Forget a delivery that failed, so GitLab or the spool can deliver it again.
+
+    :param key: str: key of the delivery
+    :return: None
+    """
+    if config.IDEMPOTENCY_TTL > 0:
+        store.get_connection().execute("DELETE FROM webhook_events WHERE key = ?", (key,))
@@ -0,0 +1,48 @@
+import json
+from typing import Dict, Iterable, Optional
+
+MERGE_REQUEST_HOOK = "Merge Request Hook"
+CHUNK_SIZE = 65536
+
+
+class BodyTooLarge(ValueError):
+    pass
+
+
+def is_merge_request_hook(event: Optional[str]) -> bool:
+    """
+    Check the X-Gitlab-Event header, so other hooks are rejected before their body is read.
+
+    :param event: Optional[str]: X-Gitlab-Event header, None if the request has none
+    :return: bool
+    """
+    return event is None or event == MERGE_REQUEST_HOOK
+
+
+def read(chunks: Iterable[bytes], max_size: int) -> bytes:
+    """
+    Read a request body, stopping as soon as it is larger than max_size.
+
+    :param chunks: Iterable[bytes]: body chunks
+    :param max_size: int: largest body size in bytes
+    :return: bytes
+    """
+    body = bytearray()
+    for chunk in chunks:
+        body += chunk
+        if len(body) > max_size:
+            raise BodyTooLarge(f"Webhook body larger than {max_size} bytes")
+    return bytes(body)
+
+
+def decode(body: bytes) -> Dict:
+    """
+    Decode a merge request webhook.
+
+    :param body: bytes: request body
+    :return: Dict: webhook data
+    """
+    data = json.loads(body)
+    if not isinstance(data, dict):
+        raise ValueError("Webhook body is not a JSON object")
+    return data
@@ -0,0 +1,239 @@
+import asyncio
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, Tuple
+from slack_sdk.errors import SlackApiError
+from app import config, store, tracing
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def format_labels(labelnames: Iterable[str], labels: Dict) -> str:
+    return ','.join(f'{name}="{escape(labels.get(name, ""))}"' for name in labelnames)
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_samples(name: str, samples: list) -> list:
+    return [f"{name}{{{labels}}} {format_value(value)}" if labels else f"{name} {format_value(value)}"
+            for labels, _, value in sorted(samples)]
+
+
+class Registry:
+    """
+    Collects metric updates of this process, and adds them to the metrics table of the shared state database every
+    METRICS_FLUSH_INTERVAL seconds from a background thread, so every worker serves the totals of all workers.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self.metrics = {}
+        self.pending = {}
+        self.flusher_pid = None
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add(self, name: str, labels: str, value: float, le: str = '') -> None:
+        with self.lock:
+            key = (name, labels, le)
+            self.pending[key] = self.pending.get(key, 0) + value
+            if self.flusher_pid != os.getpid():
+                self.flusher_pid = os.getpid()
+                threading.Thread(target=self.run, name="mergeminion-metrics", daemon=True).start()
+
+    def run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logging.error(f"Failed to save metrics: {e}")
+
+    def flush(self) -> None:
+        with self.lock:
+            pending, self.pending = self.pending, {}
+
+        now = time.time()
+        pid = os.getpid()
+        with store.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO metrics (name, labels, le, pid, value, updated) VALUES (?, ?, ?, 0, ?, ?) "
+                "ON CONFLICT (name, labels, le, pid) DO UPDATE SET value = value + excluded.value, "
+                "updated = excluded.updated",
+                [(name, labels, le, value, now) for (name, labels, le), value in pending.items()])
+            for metric in self.metrics.values():
+                if isinstance(metric, Gauge):
+                    conn.execute("DELETE FROM metrics WHERE name = ? AND pid = ?", (metric.name, pid))
+                    conn.executemany(
+                        "INSERT INTO metrics (name, labels, le, pid, value, updated) VALUES (?, ?, '', ?, ?, ?)",
+                        [(metric.name, labels, pid, value, now) for labels, value in metric.collect()])
+
+    def render(self) -> str:
+        """
+        Render the metrics of all workers in the Prometheus text format.
+
+        :return: str
+        """
+        self.flush()
+        rows = store.get_connection().execute(
+            "SELECT name, labels, le, SUM(value) FROM metrics WHERE pid = 0 OR updated > ? GROUP BY name, labels, le",
+            (time.time() - config.METRICS_GAUGE_TTL,)).fetchall()
+
+        samples = {}
+        for name, labels, le, value in rows:
+            samples.setdefault(name, []).append((labels, le, value))
+
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render(samples))
+        return '\n'.join(lines) + '\n'
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        registry.add(self.name, format_labels(self.labelnames, labels), amount)
+
+    def render(self, samples: Dict) -> list:
+        return render_samples(self.name, samples.get(self.name, []))
+
+
+class Gauge:
+    """
+    Gauge of a per-process value, read from the collect callback on every flush. The values of all live workers are
+    summed up.
+    """
+    type = 'gauge'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...], collect: Callable[[], Dict[Tuple, float]]):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.callback = collect
+
+    def collect(self) -> list:
+        return [(format_labels(self.labelnames, dict(zip(self.labelnames, labels))), value)
+                for labels, value in self.callback().items()]
+
+    def render(self, samples: Dict) -> list:
+        return render_samples(self.name, samples.get(self.name, []))
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels) -> None:
+        labels = format_labels(self.labelnames, labels)
+        bucket = next((b for b in self.buckets if value <= b), '+Inf')
+        registry.add(f"{self.name}_bucket", labels, 1, le=str(bucket))
+        registry.add(f"{self.name}_sum", labels, value)
+        registry.add(f"{self.name}_count", labels, 1)
+
+    def render(self, samples: Dict) -> list:
+        counts = {}
+        for labels, le, value in samples.get(f"{self.name}_bucket", []):
+            counts.setdefault(labels, {})[le] = value
+
+        lines = []
+        for labels, per_bucket in sorted(counts.items()):
+            prefix = f"{labels}," if labels else ''
+            total = 0
+            for bucket in [str(b) for b in self.buckets] + ['+Inf']:
+                total += per_bucket.get(bucket, 0)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bucket}"}} {format_value(total)}')
+        for suffix in ('_sum', '_count'):
+            lines.extend(render_samples(f"{self.name}{suffix}", samples.get(f"{self.name}{suffix}", [])))
+        return lines
+
+
+class InstrumentedClient:
+    """
+    Counts the calls, errors and latency of every Slack Web API method called through the wrapped client, and traces
+    them as a stage of the webhook they are made for.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.client, name)
+        if name.startswith('_') or not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                with tracing.span(f"slack.{name}", channel=kwargs.get('channel', '')):
+                    return await attr(*args, **kwargs)
+            except SlackApiError as e:
+                SLACK_ERRORS.inc(method=name, error=e.response.get('error', '') if e.response else '')
+                raise e
+            except Exception as e:
+                SLACK_ERRORS.inc(method=name, error=type(e).__name__)
+                raise e
+            finally:
+                SLACK_CALLS.inc(method=name)
+                SLACK_LATENCY.observe(time.perf_counter() - start, method=name)
+
+        return call
+
+
+registry = Registry(config.METRICS_FLUSH_INTERVAL)
+atexit.register(registry.flush)
+
+NOTIFY_LATENCY = registry.register(Histogram(
+    "mergeminion_notify_duration_seconds", "Time to answer /mr/notify.", ('action', 'update_type')))
+SPOOL_LATENCY = registry.register(Histogram(
+    "mergeminion_spool_job_duration_seconds", "Time to handle a spooled webhook.", ('action', 'update_type')))
+SLACK_CALLS = registry.register(Counter(
+    "mergeminion_slack_calls_total", "Slack Web API calls.", ('method',)))
+SLACK_ERRORS = registry.register(Counter(
+    "mergeminion_slack_errors_total", "Failed Slack Web API calls.", ('method', 'error')))
+SLACK_LATENCY = registry.register(Histogram(
+    "mergeminion_slack_call_duration_seconds", "Slack Web API call latency.", ('method',)))
+CACHE_REQUESTS = registry.register(Counter(
+    "mergeminion_cache_requests_total", "Cache lookups.", ('cache', 'result')))
+THREAD_NOT_FOUND = registry.register(Counter(
+    "mergeminion_thread_not_found_total", "Updates of MRs whose Slack thread was not found."))
+DRAFT_SKIPPED = registry.register(Counter(
+    "mergeminion_draft_skipped_total", "Webhooks of draft MRs that were not sent to Slack."))
+SLACK_CALLS_SAVED = registry.register(Counter(
+    "mergeminion_slack_calls_saved_total", "chat.update calls skipped because the thread start did not visibly "
+    "change.", ('reason',)))
+DIGEST_EVENTS = registry.register(Counter(
+    "mergeminion_digest_events_total", "Thread replies collected in a channel digest instead of posted."))
+WEBHOOKS_PARKED = registry.register(Counter(
+    "mergeminion_webhooks_parked_total", "Webhooks stored in the backlog because Slack was degraded."))
+WEBHOOKS_SHED = registry.register(Counter(
+    "mergeminion_webhooks_shed_total", "Webhooks rejected because the backlog was full."))
+SHARD_FORWARDS = registry.register(Counter(
+    "mergeminion_shard_forwards_total", "Webhooks sent on to the replica that owns their channel.", ('result',)))
+DUPLICATE_WEBHOOKS = registry.register(Counter(
+    "mergeminion_duplicate_webhooks_total", "Webhook deliveries that were already handled."))
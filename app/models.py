@@ -1,27 +1,50 @@
+import copy
+from typing import Dict
 from app import parser
+from app.context import EventContext
+from app.events import MergeRequestEvent, ThreadState
+from app.templates import NEW_MR
+
+
+def visible_state(message: Dict) -> tuple:
+    """
+    The part of a thread start message that matters to its readers: the blocks without the Last Update field, and the
+    metadata the next events are applied to. Both are copied, as Thread changes the message in place.
+
+    :param message: Dict: thread start message (blocks, metadata)
+    :return: tuple of blocks and metadata that can be compared
+    """
+    blocks = copy.deepcopy(message.get('blocks'))
+    try:
+        NEW_MR.set_text(blocks, 'last_update', '')
+    except (IndexError, KeyError, TypeError):
+        pass
+    return blocks, copy.deepcopy(message.get('metadata'))
 
 
 class Thread:
-    def __init__(self, history_thread, request):
+    def __init__(self, history_thread, ctx: EventContext):
+        state = ThreadState(history_thread)
+        self.ctx = ctx
         self.thread = history_thread
-        self.target_branch = parser.deep_get(history_thread, "metadata.event_payload.target_branch")
-        self.assignees = parser.deep_get(history_thread, "metadata.event_payload.assignees")
-        self.assignee_text = parser.deep_get(history_thread, "blocks.3.fields.3.text")
-        self.reviewers = parser.deep_get(history_thread, "metadata.event_payload.reviewers")
-        self.reviewer_text = parser.deep_get(history_thread, "blocks.3.fields.4.text")
-        self.target_branch_text = parser.deep_get(history_thread, "blocks.1.text.text")
-        self.blocks = parser.deep_get(history_thread, "blocks")
-        self.ts = parser.deep_get(history_thread, "ts")
-        self.metadata = parser.deep_get(history_thread, "metadata")
-        self.status = parser.deep_get(history_thread, "blocks.3.fields.1.text")
-        self.old_assignees = parser.deep_get(history_thread, "metadata.event_payload.assignees")
-        self.old_reviewers = parser.deep_get(history_thread, "metadata.event_payload.reviewers")
+        self.target_branch = state.target_branch
+        self.assignees = state.assignees
+        self.assignee_text = state.assignee_text
+        self.reviewers = state.reviewers
+        self.reviewer_text = state.reviewer_text
+        self.target_branch_text = state.target_branch_text
+        self.blocks = state.blocks
+        self.ts = state.ts
+        self.metadata = state.metadata
+        self.status = state.status
+        self.old_assignees = state.assignees
+        self.old_reviewers = state.reviewers
         self.text = ''
         self.update_type = ''
 
-        self.set_updates(request)
+        self.set_updates(ctx.event)
         if self.update_type not in ["new_commit", "target_change"]:
-            self.set_status(request)
+            self.set_status(ctx.event)
         self.set_last_update()
 
     def set_target_branch(self, new_target):
@@ -31,25 +54,25 @@ class Thread:
         self.assignees = new_assignees
         self.thread['metadata']['event_payload']['assignees'] = new_assignees
 
-    def set_assignee_text(self, new_assignee_text):
-        self.blocks[3]['fields'][3]['text'] = new_assignee_text
+    def set_assignee_text(self, new_assignees):
+        NEW_MR.set(self.blocks, 'assignees', new_assignees)
 
     def set_reviewers(self, new_reviewers):
         self.reviewers = new_reviewers
         self.thread['metadata']['event_payload']['reviewers'] = new_reviewers
 
-    def set_reviewer_text(self, new_reviewer_text):
-        self.blocks[3]['fields'][4]['text'] = new_reviewer_text
+    def set_reviewer_text(self, new_reviewers):
+        NEW_MR.set(self.blocks, 'reviewers', new_reviewers)
 
-    def set_target_branch_text(self, new_target_branch_text):
-        self.blocks[1]['text']['text'] = new_target_branch_text
+    def set_target_branch_text(self, source_branch, target_branch):
+        NEW_MR.set(self.blocks, 'branches', (source_branch, target_branch))
 
     def set_last_update(self):
-        self.blocks[3]['fields'][2]['text'] = f"*Last Update:*\n{parser.parse_date()}"
+        NEW_MR.set(self.blocks, 'last_update', parser.parse_date(self.ctx))
 
-    def set_status(self, request):
+    def set_status(self, event: MergeRequestEvent):
         new_status = 'None'
-        action = parser.deep_get(request, "object_attributes.action")
+        action = event.action
 
         if action != 'update':
             new_status = parser.parse_action_into_status(action)
@@ -60,7 +83,7 @@ class Thread:
                                                            self.update_type)
 
         if new_status != 'None':
-            self.blocks[3]['fields'][1]['text'] = f"*Status:*\n{new_status}"
+            NEW_MR.set(self.blocks, 'status', new_status)
 
     def get_update_type(self):
         return self.update_type
@@ -77,27 +100,27 @@ class Thread:
     def get_reviewers(self):
         return self.reviewers
 
-    def set_updates(self, request):
+    def set_updates(self, event: MergeRequestEvent):
         new_assignees = self.assignees
         new_reviewers = self.reviewers
 
-        if 'assignees' in request.get('changes', ''):
-            new_assignees = parser.parse_users_to_string(True, 'assignees')
-        elif 'reviewers' in request.get('changes', ''):
-            new_reviewers = parser.parse_users_to_string(True, 'reviewers')
+        if event.changed_assignees is not None:
+            new_assignees = parser.parse_users_to_string(self.ctx, True, 'assignees')
+        elif event.changed_reviewers is not None:
+            new_reviewers = parser.parse_users_to_string(self.ctx, True, 'reviewers')
 
-        target_branch = parser.deep_get(request, "object_attributes.target_branch")
-        source_branch = parser.deep_get(request, "object_attributes.source_branch")
+        target_branch = event.target_branch
+        source_branch = event.source_branch
 
         if self.get_target_branch() != target_branch:
             self.set_target_branch(target_branch)
-            self.set_target_branch_text(f"`{source_branch}` → `{target_branch}`")
+            self.set_target_branch_text(source_branch, target_branch)
             self.set_update_type('target_change')
-        elif 'oldrev' in request.get('object_attributes', ''):
+        elif event.has_oldrev:
             self.set_update_type('new_commit')
         elif self.assignees != new_assignees:
             self.set_assignees(new_assignees)
-            self.set_assignee_text(f"*Assignees:*\n{new_assignees}")
+            self.set_assignee_text(new_assignees)
 
             if new_assignees != 'None':
                 self.set_update_type('assignee_change')
@@ -105,7 +128,7 @@ class Thread:
                 self.set_update_type('no_assignees')
         elif self.get_reviewers() != new_reviewers:
             self.set_reviewers(new_reviewers)
-            self.set_reviewer_text(f"*Reviewers:*\n{new_reviewers}")
+            self.set_reviewer_text(new_reviewers)
             if new_reviewers != 'None':
                 self.set_update_type('reviewer_change')
             else:
@@ -0,0 +1,106 @@
+import asyncio
+import copy
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Callable, Awaitable
+
+
+class Batch:
+    """
+    Pending Slack work of a single MR thread: the final state of the root message and the replies collected
+    during the coalescing window.
+    """
+    __slots__ = ('channel', 'mr_id', 'root', 'replies', 'reply_metadata', 'done')
+
+    def __init__(self, channel: str, mr_id: int):
+        self.channel = channel
+        self.mr_id = mr_id
+        self.root = None
+        self.replies = []
+        self.reply_metadata = None
+        self.done = asyncio.get_running_loop().create_future()
+
+
+class MergeRequestQueue:
+    """
+    Serializes the events of every MR thread and coalesces the Slack calls they cause. Events of one MR are handled
+    one at a time, in arrival order. The first event opens a batch, and after the coalescing window the root message
+    is updated once with the final state and all replies are posted as a single thread message.
+    """
+
+    def __init__(self, flush: Callable[[Batch], Awaitable[None]], window: float):
+        """
+        :param flush: Callable: coroutine sending a batch to Slack
+        :param window: float: coalescing window in seconds
+        """
+        self.flush = flush
+        self.window = window
+        self.locks = {}
+        self.users = {}
+        self.batches = {}
+
+    @asynccontextmanager
+    async def acquire(self, channel: str, mr_id: int):
+        """
+        Hold the MR lock. Waiters are woken up in arrival order.
+
+        :param channel: str: Slack channel id
+        :param mr_id: int: GitLab MR id
+        """
+        key = (channel, mr_id)
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        self.users[key] = self.users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self.users[key] -= 1
+            if not self.users[key]:
+                del self.users[key]
+                del self.locks[key]
+
+    def get_pending_root(self, channel: str, mr_id: int) -> Optional[Dict]:
+        """
+        Return a copy of the root message state that is waiting to be sent, if any. Call while holding the MR lock.
+
+        :param channel: str: Slack channel id
+        :param mr_id: int: GitLab MR id
+        :return: Root message (ts, blocks, metadata) or None
+        """
+        batch = self.batches.get((channel, mr_id))
+        return copy.deepcopy(batch.root) if batch is not None else None
+
+    def has_batch(self, channel: str, mr_id: int) -> bool:
+        return (channel, mr_id) in self.batches
+
+    def submit(self, channel: str, mr_id: int, root: Dict, reply: Optional[list] = None,
+               reply_metadata: Optional[Dict] = None) -> asyncio.Future:
+        """
+        Add the outcome of an event to the MR batch. Call while holding the MR lock.
+
+        :param channel: str: Slack channel id
+        :param mr_id: int: GitLab MR id
+        :param root: Dict: new root message state (ts, blocks, metadata, text)
+        :param reply: Optional[list]: thread reply blocks
+        :param reply_metadata: Optional[Dict]: thread reply metadata
+        :return: Future that resolves once the batch has been sent
+        """
+        key = (channel, mr_id)
+        batch = self.batches.get(key)
+        if batch is None:
+            batch = self.batches[key] = Batch(channel, mr_id)
+            asyncio.get_running_loop().call_later(self.window, lambda: asyncio.ensure_future(self.run_flush(key)))
+
+        batch.root = root
+        if reply:
+            batch.replies.extend(reply)
+            batch.reply_metadata = batch.reply_metadata or reply_metadata
+        return batch.done
+
+    async def run_flush(self, key: tuple) -> None:
+        async with self.acquire(*key):
+            batch = self.batches.pop(key)
+            try:
+                await self.flush(batch)
+                batch.done.set_result(None)
+            except Exception as e:
+                batch.done.set_exception(e)
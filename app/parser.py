@@ -1,8 +1,9 @@
+from datetime import datetime
 from dateutil import parser
-from flask import request
-from typing import Optional, Dict
-from app import config
-from functools import reduce
+from typing import Optional, Dict, List
+from app import config, routing
+from app.context import EventContext
+from app.paths import compile_path
 
 DRAFT_SUBSTR = ["WIP", "Draft"]
 STATUS_REVIEWING = ":mag: reviewing :mag:"
@@ -14,44 +15,50 @@ STATUS_MERGED = ":rocket: merged :rocket:"
 STATUS_CLOSED = ":headstone: closed :headstone:"
 STATUS_APPROVED = ":thumbsup: approved :thumbsup:"
 STATUS_UNAPPROVED = ":thumbsdown: unapproved :thumbsdown:"
+# Marks a Slack channel id in place of a team name
+CHANNEL_ID_PREFIX = "#"
 
-slack_user_list = []
 
-
-def parse_users_to_string(is_change: bool, user_type: str) -> str:
+def parse_users_to_string(ctx: EventContext, is_change: bool, user_type: str) -> str:
     """
     Parse assignees or reviewers to a string of usernames
 
+    :param ctx: EventContext: webhook context
     :param is_change: bool: has user list updated
     :param user_type: str: reviewer or assignee
     :return: A string of users: @username, @username
     """
     current = []
 
-    try:
-        if is_change:
-            for user in deep_get(request.json, "changes." + user_type + ".current"):
-                current.append('<@' + parse_username_to_slack_id(user.get('username')) + '>')
-        else:
-            raw = request.json.get(user_type, '')
-            for i in raw:
-                current.append('<@' + parse_username_to_slack_id(i.get('username')) + '>')
-    except KeyError:
-        pass
-    except IndexError:
-        pass
+    for username in ctx.event.get_users(user_type, is_change) or ():
+        current.append('<@' + parse_username_to_slack_id(ctx, username) + '>')
 
     return ','.join(map(str, current)) if current else 'None'
 
 
-def parse_date() -> str:
+def parse_date(ctx: EventContext) -> str:
     """
     Take the date from the GitLab webhook and parses it into a more readable format.
 
+    :param ctx: EventContext: webhook context
+    :return: The date in a format that is more readable
+    """
+    return format_date(ctx.event.updated_at)
+
+
+def format_date(value: str) -> str:
+    """
+    Format a GitLab date. GitLab sends ISO dates, e.g. 2024-01-01 10:00:00 UTC, which are parsed natively; anything
+    else is left to dateutil.
+
+    :param value: str: date from the webhook
     :return: The date in a format that is more readable
     """
-    date = deep_get(request.json, "object_attributes.updated_at")
-    return parser.parse(date).strftime("%-d %b %H:%M")
+    try:
+        date = datetime.fromisoformat(value[:-4] if value.endswith(' UTC') else value)
+    except ValueError:
+        date = parser.parse(value)
+    return date.strftime("%-d %b %H:%M")
 
 
 def parse_action_into_status(action: str) -> str:
@@ -114,15 +121,16 @@ def parse_no_users_into_status(old_status: str, reviewers: str, assignees: str,
     return status
 
 
-def parse_action_into_message(update_type: str, assignee_list: []):
+def parse_action_into_message(ctx: EventContext, update_type: str, assignee_list: []):
     """
     Parse the action from the request object into a message that can be sent to Slack.
 
+    :param ctx: EventContext: webhook context
     :param update_type: str: MR update type
     :param assignee_list: []: list of old and new assignees and reviewers
     :return: A verb string to be used in Slack message
     """
-    action = deep_get(request.json, "object_attributes.action")
+    action = ctx.event.action
 
     switcher = {
         "open": "opened",
@@ -133,18 +141,19 @@ def parse_action_into_message(update_type: str, assignee_list: []):
         "unapproval": "unapproved",
         "merge": "merged",
         "reopen": "reopened",
-        "update": f"{parse_update_into_message(update_type, *assignee_list)}"
+        "update": f"{parse_update_into_message(ctx, update_type, *assignee_list)}"
     }
     result = switcher.get(action, 'Invalid')
     return result
 
 
-def parse_update_into_message(update_type: str, old_assignees: str, old_reviewers: str, assignees: str,
-                              reviewers: str) -> str:
+def parse_update_into_message(ctx: EventContext, update_type: str, old_assignees: str, old_reviewers: str,
+                              assignees: str, reviewers: str) -> str:
     """
     Parses out who was unassigned from the MR and who was assigned. Then, determine what message should be sent
     based on the update type.
 
+    :param ctx: EventContext: webhook context
     :param update_type: str: type of MR update
     :param old_assignees: str: old assignees
     :param old_reviewers: str: old reviewers
@@ -152,10 +161,10 @@ def parse_update_into_message(update_type: str, old_assignees: str, old_reviewer
     :param reviewers: str: new reviewers
     :return: A string that is used to build the message sent to Slack
     """
-    unassigned_assignees = parse_unassigned(old_assignees, assignees)
-    unassigned_reviewers = parse_unassigned(old_reviewers, reviewers)
-    assigned_assignees = parse_assigned(old_assignees, assignees)
-    assigned_reviewers = parse_assigned(old_reviewers, reviewers)
+    unassigned_assignees = parse_unassigned(ctx, old_assignees, assignees)
+    unassigned_reviewers = parse_unassigned(ctx, old_reviewers, reviewers)
+    assigned_assignees = parse_assigned(ctx, old_assignees, assignees)
+    assigned_reviewers = parse_assigned(ctx, old_reviewers, reviewers)
 
     if update_type == 'assignee_change' and unassigned_assignees and not assigned_assignees:
         update_type = 'unassigned_assignees'
@@ -173,7 +182,7 @@ def parse_update_into_message(update_type: str, old_assignees: str, old_reviewer
 
     switcher = {
         "target_change": "changed the target branch of",
-        "new_commit": f"added a new commit <{deep_get(request.json,'object_attributes.last_commit.url')}|{deep_get(request.json,'object_attributes.last_commit.id')[:8]}> to",
+        "new_commit": f"added a new commit <{ctx.event.last_commit_url}|{ctx.event.last_commit_id[:8]}> to",
         "unassigned_assignees": "unassigned " + ','.join(map(str, unassigned_assignees)) + " from",
         "unassigned_reviewers": "unassigned " + ','.join(map(str, unassigned_reviewers)) + " from reviewers of",
         "assigned_assignees": "assigned " + ','.join(map(str, assigned_assignees)) + " to",
@@ -191,15 +200,16 @@ def parse_update_into_message(update_type: str, old_assignees: str, old_reviewer
     return result
 
 
-def parse_unassigned(old_users: str, new_users: str) -> []:
+def parse_unassigned(ctx: EventContext, old_users: str, new_users: str) -> []:
     """
     Return a list of users who were unassigned from the MR.
 
+    :param ctx: EventContext: webhook context
     :param old_users: str: string of old usernames
     :param new_users: str: string of new usernames
     :return: A list of users that were unassigned from the MR
     """
-    initiator = deep_get(request.json, "user.username")
+    initiator = ctx.event.username
     users = [u for u in old_users.split(',') if u not in new_users.split(',') and u != 'None']
     for i, u in enumerate(users):
         if u.strip('@') == initiator:
@@ -208,15 +218,16 @@ def parse_unassigned(old_users: str, new_users: str) -> []:
     return users
 
 
-def parse_assigned(old_users: str, new_users: str) -> []:
+def parse_assigned(ctx: EventContext, old_users: str, new_users: str) -> []:
     """
     Return a list of users who were assigned from the MR.
 
+    :param ctx: EventContext: webhook context
     :param old_users: str: string of old usernames
     :param new_users: str: string of new usernames
     :return: A list of users that were assigned to the MR
     """
-    initiator = deep_get(request.json, "user.username")
+    initiator = ctx.event.username
     users = [u for u in new_users.split(',') if u not in old_users.split(',') and u != 'None']
     for i, u in enumerate(users):
         if u.strip('@') == initiator:
@@ -225,25 +236,6 @@ def parse_assigned(old_users: str, new_users: str) -> []:
     return users
 
 
-def get_thread_start(data: Dict, history) -> Optional[Dict]:
-    """
-    Iterate through the Slack message history, looking for an event_type that matches 'mr_created' and an mr_id that
-    matches the request's MR id.
-
-    :param data: Dict: Webhook request data
-    :param history: Dict: Dictionary of Slack messages
-    :return: Matching message or None
-    """
-    for message in history:
-        try:
-            if (deep_get(message, "metadata.event_type") == 'mr_created' and deep_get(message, "metadata.event_payload.mr_id") ==
-                    deep_get(data, "object_attributes.id")):
-                return message
-        except KeyError:
-            pass
-    return None
-
-
 def parse_new_msg_status(assignees: str, reviewers: str) -> str:
     """
     Parse new MR into Slack message status
@@ -272,60 +264,64 @@ def parse_new_msg_status(assignees: str, reviewers: str) -> str:
 #     usr = slack_app.client.users_lookupByEmail(email=email)
 #     return usr['user']['id'] if usr['ok'] else None
 
-def parse_username_to_slack_id(username: str) -> Optional[str]:
+def parse_username_to_slack_id(ctx: EventContext, username: str) -> Optional[str]:
     """
-    Get Slack user ID by username. Retrieves the whole list of slack users and matches on either name or display_name.
+    Get Slack user ID by username. Looks the username up in the user directory, matching on either name or
+    display_name.
+    :param ctx: EventContext: webhook context
     :param username: str
     :return user_id | None
     """
-    username = config.SLACK_GITLAB_USER_MAPPING[username] if username in config.SLACK_GITLAB_USER_MAPPING.keys() \
-        else username
-
-    for usr in slack_user_list:
-        if username in (usr.get('name', '').lower(), deep_get(usr, "profile.display_name").lower()):
-            return usr.get('id', '')
+    return ctx.users.lookup(username)
 
-    return None
 
-
-def get_channel_id(channel_name: str) -> Optional[str]:
+def get_channel_ids(channel_name: str) -> List[str]:
     """
-    Get Slack channel id of a specific team
-    :param channel_name: str: team name
-    :return channel_id | ''
+    Get Slack channel ids of one or more teams. A team is mapped to a channel id or a list of channel ids. Replicas
+    forward the channels they do not own as channel ids with CHANNEL_ID_PREFIX, those must be channels of a team.
+    :param channel_name: str: comma separated team names
+    :return unique channel ids of the teams that exist, in order
     """
-    channel_id = config.TEAM_CHANNEL_MAPPING[channel_name] if channel_name in config.TEAM_CHANNEL_MAPPING.keys() \
-        else ''
+    routes = routing.get()
+    channel_ids = []
+    for team in channel_name.split(','):
+        team = team.strip()
+        if team.startswith(CHANNEL_ID_PREFIX):
+            channels = (team[1:],) if team[1:] in routes.channels else ()
+        else:
+            channels = routes.team_channels.get(team, ())
+        for channel_id in channels:
+            if channel_id not in channel_ids:
+                channel_ids.append(channel_id)
 
-    return channel_id
+    return channel_ids
 
 
-def parse_request_to_nm_blocks(data: Dict, slack_id: str, mr_is_ready: bool) -> []:
+def parse_request_to_nm_blocks(ctx: EventContext, slack_id: str, mr_is_ready: bool) -> []:
     """"
     Generate Blocks for the new MR message
     :param mr_is_ready: Draft was marked as ready
     :param slack_id: str: Slack user id
-    :param data: Dict: request data
+    :param ctx: EventContext: webhook context
     :return Slack message blocks for a new MR message
     """
-    obj_attr = data.get('object_attributes', '')
-    assignees = parse_users_to_string(False, 'assignees')
-    reviewers = parse_users_to_string(False, 'reviewers')
+    event = ctx.event
+    assignees = parse_users_to_string(ctx, False, 'assignees')
+    reviewers = parse_users_to_string(ctx, False, 'reviewers')
     open_text = "has marked merge request as ready:" if mr_is_ready else "has created a new merge request:"
     return [
         {
             "type": "section",
             "text": {
                 "type": "mrkdwn",
-                "text": f"<@{slack_id}> {open_text} <{obj_attr.get('url', '')}|"
-                        f"!{obj_attr.get('iid', '')}>: {obj_attr.get('title', '')}"
+                "text": f"<@{slack_id}> {open_text} <{event.url}|!{event.iid}>: {event.title}"
             }
         },
         {
             "type": "section",
             "text": {
                 "type": "mrkdwn",
-                "text": f"`{obj_attr.get('source_branch', '')}` → `{obj_attr.get('target_branch', '')}`"
+                "text": f"`{event.source_branch}` → `{event.target_branch}`"
             }
         },
         {
@@ -336,8 +332,7 @@ def parse_request_to_nm_blocks(data: Dict, slack_id: str, mr_is_ready: bool) ->
             "fields": [
                 {
                     "type": "mrkdwn",
-                    "text": f"*Project:*\n<{obj_attr.get('target', '').get('web_url', '')}"
-                            f"|{obj_attr.get('target', '').get('name', '')}>"
+                    "text": f"*Project:*\n<{event.project_url}|{event.project_name}>"
                 },
                 {
                     "type": "mrkdwn",
@@ -345,7 +340,7 @@ def parse_request_to_nm_blocks(data: Dict, slack_id: str, mr_is_ready: bool) ->
                 },
                 {
                     "type": "mrkdwn",
-                    "text": f"*Last Update:*\n{parse_date()}"
+                    "text": f"*Last Update:*\n{parse_date(ctx)}"
                 },
                 {
                     "type": "mrkdwn",
@@ -360,9 +355,10 @@ def parse_request_to_nm_blocks(data: Dict, slack_id: str, mr_is_ready: bool) ->
     ]
 
 
-def parse_request_to_um_blocks(username: str, update_type: str, assignee_list: []) -> []:
+def parse_request_to_um_blocks(ctx: EventContext, username: str, update_type: str, assignee_list: []) -> []:
     """"
     Generate Blocks for the update MR message
+    :param ctx: EventContext: webhook context
     :param assignee_list: []: List of old and new assignees
     :param update_type: str: Kind of update
     :param username: str: Slack username
@@ -373,34 +369,34 @@ def parse_request_to_um_blocks(username: str, update_type: str, assignee_list: [
         "type": "section",
         "text": {
             "type": "mrkdwn",
-            "text": f"{username.capitalize()} has {parse_action_into_message(update_type, assignee_list)} this merge request"
+            "text": f"{username.capitalize()} has {parse_action_into_message(ctx, update_type, assignee_list)} "
+                    f"this merge request"
         }
     }]
 
 
-def parse_request_to_nm_metadata(data: Dict) -> Dict:
+def parse_request_to_nm_metadata(ctx: EventContext) -> Dict:
     """"
     Generate metadata for the new MR message
-    :param data: Dict: request data
+    :param ctx: EventContext: webhook context
     :return Slack message metadata dictionary
     """
-    obj_attr = data.get('object_attributes', '')
-    return {'event_type': "mr_created", 'event_payload': {'mr_id': obj_attr.get('id', ''),
-                                                          'target_branch': obj_attr.get('target_branch', ''),
-                                                          'assignees': parse_users_to_string(False,
+    return {'event_type': "mr_created", 'event_payload': {'mr_id': ctx.event.mr_id,
+                                                          'target_branch': ctx.event.target_branch,
+                                                          'assignees': parse_users_to_string(ctx, False,
                                                                                              'assignees'),
-                                                          'reviewers': parse_users_to_string(False,
+                                                          'reviewers': parse_users_to_string(ctx, False,
                                                                                              'reviewers')}}
 
 
-def parse_request_to_um_metadata(data: Dict) -> Dict:
+def parse_request_to_um_metadata(ctx: EventContext) -> Dict:
     """"
     Generate metadata for the update MR message
-    :param data: Dict: request data
+    :param ctx: EventContext: webhook context
     :return Slack message metadata dictionary
     """
     return {'event_type': "mr_updated",
-            'event_payload': {'mr_id': deep_get(data, "object_attributes.id")}}
+            'event_payload': {'mr_id': ctx.event.mr_id}}
 
 
 def is_draft(title: str) -> bool:
@@ -428,24 +424,13 @@ def is_ready(action: str, changes: Optional[Dict]) -> bool:
         return False
 
 
-def set_user_list(user_list) -> None:
-    """
-    Set user list as a global variable
-    :param user_list: list: List of usernames
-    :return: None
-    """
-    global slack_user_list
-    slack_user_list = user_list
-
-
 def deep_get(dictionary: Dict, keys: str, default=''):
     """
-    Find value by keys in a deep nested dictionary with lists
+    Find value by keys in a deep nested dictionary with lists, or a dict-like object such as a Slack API response
     :param dictionary: Dict: Dictionary
     :param keys: str: String of keys, e.g. "level1.level2.level3", can also pass list int index,
     like "level1.3.2.level4"
     :param default: str: Default value if key not found
     :return: str|list|Dict: value or ''
     """
-    return reduce(lambda d, key: d.get(key, default) if isinstance(d, dict) else (d[int(key)] if isinstance(d, list)
-                                                                   else default), keys.split("."), dictionary)
\ No newline at end of file
+    return compile_path(keys)(dictionary, default)
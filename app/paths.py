@@ -0,0 +1,31 @@
+from functools import lru_cache
+from typing import Callable, Dict, Any
+
+
+@lru_cache(maxsize=None)
+def compile_path(keys: str) -> Callable[..., Any]:
+    """
+    Compile a dotted key string into a getter for deep nested dictionaries with lists. The key string is split, and
+    list indexes are converted, only once per distinct path.
+
+    :param keys: str: String of keys, e.g. "level1.level2.level3", can also pass list int index,
+    like "level1.3.2.level4"
+    :return: Callable[[Dict, Any], Any]: getter taking the dictionary and the default value
+    """
+    path = tuple((key, int(key) if key.isdigit() else None) for key in keys.split("."))
+
+    def get(dictionary: Dict, default=''):
+        value = dictionary
+        for key, index in path:
+            if isinstance(value, dict):
+                value = value.get(key, default)
+            elif isinstance(value, list):
+                value = value[index if index is not None else int(key)]
+            elif hasattr(value, 'get'):
+                # Dict-like objects, e.g. Slack API responses
+                value = value.get(key, default)
+            else:
+                value = default
+        return value
+
+    return get
@@ -1,8 +1,6 @@
 from flask import current_app as app
-from flask import request, make_response, Response
-import app.handlers as handlers
-from slack_sdk.errors import SlackApiError
-from app import bolt_app, config
+from flask import jsonify, request, make_response, Response
+from app import bolt_app, config, health, ingest, metrics, socket_mode, spool, user_store, webhooks
 import logging
 from typing import Dict
 
@@ -11,62 +9,93 @@ from typing import Dict
 async def send_message() -> Response:
     """
     The send_message function is a ReST endpoint that accepts POST requests from GitLab.
-    It will parse the request and send a message to Slack with the relevant information.
+    It will parse the request and send a message to Slack with the relevant information, see webhooks.handle.
 
     :return: Flask response
     """
-    disable_auth = False
-    if not config.GITLAB_WEBHOOK_TOKEN:
-        disable_auth = True
-    gl_token = request.headers.get("X-Gitlab-Token")
-    if not disable_auth and (not gl_token or gl_token != config.GITLAB_WEBHOOK_TOKEN):
-        return make_response("Add the correct gitlab token to the webhook", 403)
-
-    channel_name = request.args.get('channel', '')
-    data = request.json
-    try:
-        await handlers.handle_mr_notify(data, channel_name)
-        return make_response("", 200)
-    except SlackApiError as e:
-        code = e.response["error"]
-        logging.error(e)
-        return make_response(f"Failed to send message due to {code}", 200)
-    except ValueError as ve:
-        logging.error(ve)
-        return make_response("Failed to send message due to a ValueError. Please check the logs", 400)
+    async def read_body(max_size: int) -> bytes:
+        return ingest.read(iter(lambda: request.stream.read(ingest.CHUNK_SIZE), b''), max_size)
+
+    status, body, headers = await webhooks.handle(request.headers, request.query_string.decode(), read_body)
+    return make_response(body, status, headers)
+
+
+@app.before_request
+def start_socket_mode() -> None:
+    socket_mode.ensure_started()
+
+
+@app.before_request
+def start_spool_workers() -> None:
+    """
+    With the spool enabled, the spool workers of a uwsgi worker start with its first request, like Socket Mode, so
+    webhooks spooled before a restart are sent without waiting for a new one.
+
+    :return: None
+    """
+    if config.SPOOL_ENABLED:
+        spool.ensure_workers()
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics() -> Response:
+    """
+    The get_metrics function serves the metrics of all workers in the Prometheus text format.
+
+    :return: Flask response
+    """
+    response = make_response(metrics.registry.render(), 200)
+    response.mimetype = 'text/plain'
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
 
 
 @app.route("/health", methods=["GET"])
-def health() -> Response:
-    # TODO: If necessary check whether dependencies (e.g. slack, db) are ready for conn.
+@app.route("/health/live", methods=["GET"])
+def liveness() -> Response:
     """
-    The health function is used to check whether the service is up and running.
+    The liveness function is used to check whether the service is up and running.
     :return: Flask response
     """
     return make_response("All OK", 200)
 
 
+@app.route("/health/ready", methods=["GET"])
+def readiness() -> Response:
+    """
+    The readiness function reports whether the service can handle webhooks: the state database is reachable, Slack is
+    connected, the users list is loaded and the backlog is not full. It also reports the Slack circuit breaker and how
+    warm the caches of the worker are.
+
+    :return: Flask response, 503 if not ready
+    """
+    result = health.readiness()
+    return make_response(jsonify(result), 200 if result['ready'] else 503)
+
+
 @bolt_app.event('team_join')
-def clear_user_cache() -> None:
+def add_user(event: Dict) -> None:
     """
-    The clear_user_cache function is a decorator that clears the cache of the get_users_list function.
+    The add_user function publishes the user who joined the team to the user directories of all workers.
 
+    :param event: Dict: Event data
     :return: None
     """
-    logging.info("Somebody joined teh team! Clearing user list cache.")
-    handlers.get_users_list.cache_clear()
+    usr = event.get('user')
+    logging.info("Somebody joined the team! Adding " + usr.get('name', '') + " to the user directory.")
+    user_store.publish([usr])
 
 
 @bolt_app.event('user_change')
-def clear_if_needed(event: Dict) -> None:
+def update_user(event: Dict) -> None:
     """
-    The clear_if_needed function is a decorator that will clear the cache of the get_users_list function if
-    the user who triggered this event has been deleted.
+    The update_user function publishes the user who changed to the user directories of all workers, which remove the
+    user if they have been deleted.
 
     :param event: Dict: Event data
     :return: None
     """
     usr = event.get('user')
     if usr.get('deleted') is True:
-        logging.info("User " + usr.get('username', '') + " was deleted. Clearing user list cache.")
-        handlers.get_users_list.cache_clear()
+        logging.info("User " + usr.get('name', '') + " was deleted. Removing from the user directory.")
+    user_store.publish([usr])
@@ -0,0 +1,188 @@
+import ast
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Mapping, Tuple
+from app import config
+
+# Update types that can be collected in a digest
+DIGEST_UPDATE_TYPES = frozenset(['new_commit', 'target_change', 'assignee_change', 'reviewer_change', 'no_assignees',
+                                 'no_reviewers'])
+# Seconds between checks of ROUTING_FILE for changes
+CHECK_INTERVAL = 1
+
+_routing = None
+_source = None
+_checked = 0
+_reload = False
+_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class Routing:
+    """
+    Lookup tables of the routing and user mappings, compiled from the raw mappings once per change. The tables are
+    never changed, a new Routing replaces the whole set at once, so a webhook never sees half of a change.
+    """
+    # Team name to its Slack channel ids
+    team_channels: Mapping[str, Tuple[str, ...]]
+    # Case-folded GitLab username to case-folded Slack username
+    user_mapping: Mapping[str, str]
+    # GitLab group name to group id
+    group_ids: Mapping[str, int]
+    # Slack channel id to the update types its teams collect in a digest
+    digest_types: Mapping[str, FrozenSet[str]]
+    # All Slack channel ids, sorted
+    channels: Tuple[str, ...]
+
+
+def expect_mapping(name: str, value) -> Dict:
+    if not isinstance(value, dict) or not all(isinstance(key, str) and key for key in value):
+        raise ValueError(f"{name} must map names to values")
+    return value
+
+
+def expect_names(name: str, value) -> Tuple[str, ...]:
+    values = (value,) if isinstance(value, str) else value
+    if not isinstance(values, (list, tuple)) or not values or not all(isinstance(v, str) and v for v in values):
+        raise ValueError(f"{name} must be a name or a non-empty list of names")
+    return tuple(dict.fromkeys(v.strip() for v in values))
+
+
+def compile_routing(teams: Dict, users: Dict, groups: Dict, digests: Dict) -> Routing:
+    """
+    Validate the raw mappings and compile them into lookup tables.
+
+    :param teams: Dict: team name to a Slack channel id or a list of them
+    :param users: Dict: GitLab username to Slack username
+    :param groups: Dict: GitLab group name to group id
+    :param digests: Dict: team name to the update types it collects in a digest
+    :return: Routing
+    :raises ValueError: if a mapping is invalid
+    """
+    team_channels = {team.strip(): expect_names(f"Channels of team {team}", channels)
+                     for team, channels in expect_mapping("The team channel mapping", teams).items()}
+
+    user_mapping = {}
+    for gitlab, slack in expect_mapping("The user mapping", users).items():
+        if not isinstance(slack, str) or not slack:
+            raise ValueError(f"Slack username of {gitlab} must be a name")
+        user_mapping[gitlab.casefold()] = slack.casefold()
+
+    group_ids = {}
+    for group, group_id in expect_mapping("The group id mapping", groups).items():
+        if isinstance(group_id, bool) or not isinstance(group_id, (int, str)) or not str(group_id).isdigit():
+            raise ValueError(f"Id of group {group} must be a number")
+        group_ids[group] = int(group_id)
+
+    digest_types = {}
+    for team, update_types in expect_mapping("The digest mapping", digests).items():
+        update_types = expect_names(f"Update types of team {team}", update_types)
+        if team not in team_channels:
+            raise ValueError(f"Digest of unknown team {team}")
+        unknown = set(update_types) - DIGEST_UPDATE_TYPES
+        if unknown:
+            raise ValueError(f"Unknown update types in the digest of team {team}: {', '.join(sorted(unknown))}")
+        for channel_id in team_channels[team]:
+            digest_types[channel_id] = digest_types.get(channel_id, frozenset()) | frozenset(update_types)
+
+    return Routing(team_channels=MappingProxyType(team_channels),
+                   user_mapping=MappingProxyType(user_mapping),
+                   group_ids=MappingProxyType(group_ids),
+                   digest_types=MappingProxyType(digest_types),
+                   channels=tuple(sorted({channel for channels in team_channels.values() for channel in channels})))
+
+
+def parse_literal(name: str, value: str) -> Dict:
+    try:
+        return ast.literal_eval(value) if value else {}
+    except (ValueError, SyntaxError) as e:
+        raise ValueError(f"{name} is not a valid mapping: {e}")
+
+
+def load() -> Routing:
+    """
+    Load the mappings from ROUTING_FILE, a JSON object with teams, users, groups and digests. Without it, they are
+    read from the TEAM_CHANNEL_MAPPING, SLACK_GITLAB_USER_MAPPING, GITLAB_GROUP_ID_MAPPING and DIGEST_MAPPING
+    environment variables as literals. Nothing is evaluated as code.
+
+    :return: Routing
+    :raises ValueError: if the file or a mapping is invalid
+    """
+    if not config.ROUTING_FILE:
+        return compile_routing(parse_literal("TEAM_CHANNEL_MAPPING", config.TEAM_CHANNEL_MAPPING),
+                               parse_literal("SLACK_GITLAB_USER_MAPPING", config.SLACK_GITLAB_USER_MAPPING),
+                               parse_literal("GITLAB_GROUP_ID_MAPPING", config.GITLAB_GROUP_ID_MAPPING),
+                               parse_literal("DIGEST_MAPPING", config.DIGEST_MAPPING))
+
+    with open(config.ROUTING_FILE) as f:
+        try:
+            raw = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{config.ROUTING_FILE} is not valid JSON: {e}")
+    raw = expect_mapping(config.ROUTING_FILE, raw)
+    unknown = set(raw) - {'teams', 'users', 'groups', 'digests'}
+    if unknown:
+        raise ValueError(f"Unknown keys in {config.ROUTING_FILE}: {', '.join(sorted(unknown))}")
+    return compile_routing(raw.get('teams', {}), raw.get('users', {}), raw.get('groups', {}), raw.get('digests', {}))
+
+
+def get_source():
+    try:
+        return os.stat(config.ROUTING_FILE).st_mtime_ns if config.ROUTING_FILE else None
+    except OSError:
+        return _source
+
+
+def get() -> Routing:
+    """
+    Return the current lookup tables. ROUTING_FILE is checked for changes at most every CHECK_INTERVAL seconds, and
+    reloaded when it changed or on SIGHUP. A change that does not validate is logged and the previous tables are kept.
+
+    :return: Routing
+    """
+    global _routing, _source, _checked, _reload
+    now = time.monotonic()
+    if _routing is not None and not _reload and now - _checked < CHECK_INTERVAL:
+        return _routing
+
+    with _lock:
+        _checked = now
+        source = get_source()
+        if _routing is None:
+            _routing, _source = load(), source
+        elif source != _source or _reload:
+            try:
+                routing = load()
+            except (OSError, ValueError) as e:
+                logging.error(f"Failed to reload the routing, keeping the previous one: {e}")
+            else:
+                _routing = routing
+                logging.info(f"Routing reloaded: {len(routing.team_channels)} teams, {len(routing.channels)} channels, "
+                             f"{len(routing.user_mapping)} user mappings")
+            _source = source
+        _reload = False
+        return _routing
+
+
+def request_reload(*_) -> None:
+    global _reload
+    _reload = True
+
+
+def install_reload_signal() -> None:
+    """
+    Reload the routing on SIGHUP sent to this process. Only installed in the uvicorn workers: the uWSGI master uses
+    SIGHUP to reload its workers, those pick up changes of ROUTING_FILE instead.
+
+    :return: None
+    """
+    try:
+        signal.signal(signal.SIGHUP, request_reload)
+    except ValueError:
+        logging.warning("Not in the main thread, the routing is only reloaded when ROUTING_FILE changes")
@@ -0,0 +1,72 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import threading
+from typing import Coroutine, Any
+
+_loop = None
+_pid = None
+_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the long-lived event loop of this process, starting it in a background thread on first use.
+    Flask runs every async view on a fresh event loop, so state shared between requests (queues, locks, timers)
+    lives on this loop instead.
+
+    :return: The process event loop
+    """
+    global _loop, _pid
+    with _lock:
+        if _loop is None or _pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, name="mergeminion-loop", daemon=True).start()
+    return _loop
+
+
+def use_loop(loop: asyncio.AbstractEventLoop) -> None:
+    """
+    Make a running event loop the process event loop, e.g. the loop of an ASGI server, so shared state lives on the
+    loop that serves the requests and no background loop is started.
+
+    :param loop: asyncio.AbstractEventLoop: running event loop
+    :return: None
+    """
+    global _loop, _pid
+    with _lock:
+        _loop = loop
+        _pid = os.getpid()
+
+
+async def run(coro: Coroutine) -> Any:
+    """
+    Run a coroutine on the process event loop and wait for its result. Context variables, like the Flask request
+    context, are carried over to the coroutine.
+
+    :param coro: Coroutine: Coroutine to run
+    :return: The result of the coroutine
+    """
+    loop = get_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+
+    future = concurrent.futures.Future()
+
+    def start():
+        task = loop.create_task(coro)
+        task.add_done_callback(lambda t: _copy_result(t, future))
+
+    loop.call_soon_threadsafe(start, context=contextvars.copy_context())
+    return await asyncio.wrap_future(future)
+
+
+def _copy_result(task: asyncio.Task, future: concurrent.futures.Future) -> None:
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
@@ -0,0 +1,179 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urlencode
+import aiohttp
+from app import config, metrics, parser, runtime
+
+# Points of every replica on the hash ring, so channels spread evenly and a replica change moves few of them
+VIRTUAL_NODES = 128
+FORWARDED_HEADER = 'X-Mergeminion-Forwarded'
+FORWARD_HEADERS = ('Content-Type', 'X-Gitlab-Token', 'X-Gitlab-Event', 'X-Gitlab-Event-UUID')
+
+_ring = None
+_source = None
+_sessions = {}
+_lock = threading.Lock()
+
+
+def hash_key(value: str) -> int:
+    return int.from_bytes(hashlib.sha1(value.encode()).digest()[:8], 'big')
+
+
+class Ring:
+    """
+    Consistent hash ring of the replicas. A Slack channel id belongs to the first replica point after its hash, so
+    when a replica joins or leaves only the channels of that replica move.
+    """
+
+    def __init__(self, replicas: Iterable[str]):
+        self.replicas = tuple(sorted(set(replicas)))
+        points = sorted((hash_key(f"{replica}#{i}"), replica)
+                        for replica in self.replicas for i in range(VIRTUAL_NODES))
+        self.hashes = [point for point, _ in points]
+        self.owners = [replica for _, replica in points]
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.hashes:
+            return None
+        return self.owners[bisect.bisect(self.hashes, hash_key(key)) % len(self.hashes)]
+
+
+def parse_replicas(value: str) -> Tuple[str, ...]:
+    return tuple(url.strip().rstrip('/') for url in value.replace('\n', ',').split(',') if url.strip())
+
+
+def get_ring() -> Ring:
+    """
+    Return the ring of the replica set. With REPLICAS_FILE the file is read again when it changes, so replicas can
+    be added and removed without a restart; otherwise the REPLICAS list is used.
+
+    :return: Ring
+    """
+    global _ring, _source
+    source = config.REPLICAS
+    if config.REPLICAS_FILE:
+        try:
+            source = os.stat(config.REPLICAS_FILE).st_mtime_ns
+        except OSError as e:
+            logging.error(f"Failed to read the replica set: {e}")
+            source = _source
+
+    with _lock:
+        if _ring is None or source != _source:
+            if config.REPLICAS_FILE and source is not None:
+                with open(config.REPLICAS_FILE) as f:
+                    replicas = parse_replicas(f.read())
+            else:
+                replicas = parse_replicas(config.REPLICAS)
+            if _ring is not None and replicas != _ring.replicas:
+                logging.info(f"Replica set changed to {', '.join(replicas)}, rebalancing channels")
+            _ring, _source = Ring(replicas), source
+        return _ring
+
+
+def split(channel_name: str, forwarded_by: Optional[str] = None) -> Dict[Optional[str], str]:
+    """
+    Split the channels of a webhook by the replica that owns them. Channels are owned by their Slack channel id, so
+    the same channel is handled by the same replica whichever teams a webhook names. A webhook whose channels all
+    belong to one replica keeps its team names; when they belong to several, every replica gets its channel ids.
+    Webhooks that were already forwarded are always handled here, so a replica set that differs between replicas
+    cannot forward in circles.
+
+    :param channel_name: str: team names from the webhook URL
+    :param forwarded_by: Optional[str]: FORWARDED_HEADER of the request
+    :return: The channel name to handle per replica URL, None for this replica
+    """
+    if not config.REPLICA_URL or forwarded_by:
+        return {None: channel_name}
+    ring = get_ring()
+    replica = config.REPLICA_URL.rstrip('/')
+    channels = {}
+    for channel_id in parser.get_channel_ids(channel_name):
+        owner = ring.get(channel_id)
+        channels.setdefault(owner if owner and owner != replica else None, []).append(channel_id)
+    if len(channels) <= 1:
+        return {owner: channel_name for owner in channels} or {None: channel_name}
+    return {owner: ','.join(parser.CHANNEL_ID_PREFIX + channel_id for channel_id in channel_ids)
+            for owner, channel_ids in channels.items()}
+
+
+def redirect_url(parts: Dict[Optional[str], str], query_string: str) -> Optional[str]:
+    """
+    With SHARD_REDIRECT, a webhook whose channels all belong to another replica is redirected to it instead of
+    forwarded.
+
+    :param parts: Dict: the channel name to handle per replica URL, from split()
+    :param query_string: str: query string of the webhook URL
+    :return: URL to redirect the webhook to, None to handle or forward it
+    """
+    if not config.SHARD_REDIRECT or len(parts) != 1 or None in parts:
+        return None
+    metrics.SHARD_FORWARDS.inc(result='redirected')
+    return f"{next(iter(parts))}/mr/notify?{query_string}"
+
+
+async def get_session() -> aiohttp.ClientSession:
+    session = _sessions.get(os.getpid())
+    if session is None or session.closed:
+        session = _sessions[os.getpid()] = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=config.SHARD_FORWARD_TIMEOUT))
+    return session
+
+
+async def _forward(url: str, headers: Dict, body: bytes) -> Tuple[str, int]:
+    session = await get_session()
+    async with session.post(url, data=body, headers=headers) as response:
+        return await response.text(), response.status
+
+
+async def forward_all(parts: Dict[Optional[str], str], query_string: str, headers,
+                      body: bytes) -> Tuple[str, Optional[Tuple[str, int]]]:
+    """
+    Send the parts of a webhook owned by other replicas on to them, at the same time.
+
+    :param parts: Dict: the channel name to handle per replica URL, from split()
+    :param query_string: str: query string of the webhook URL
+    :param headers: headers of the webhook, looked up by lower case name
+    :param body: bytes: webhook body
+    :return: The channel name left to handle here, including the parts of replicas that could not be reached, and
+             the response of the owners: the first unsuccessful one, if any
+    """
+    local = [name for owner, name in parts.items() if owner is None]
+    owners = [(owner, name) for owner, name in parts.items() if owner is not None]
+    # A webhook of one other replica is sent as it came, parts are sent with the channel ids of the replica
+    responses = await asyncio.gather(*(forward(owner, query_string if len(parts) == 1 else urlencode({'channel': name}),
+                                               headers, body) for owner, name in owners))
+    response = None
+    for (owner, name), forwarded in zip(owners, responses):
+        if forwarded is None:
+            local.append(name)
+        elif response is None or 200 <= response[1] < 300:
+            response = forwarded
+    return ','.join(local), response
+
+
+async def forward(owner: str, query_string: str, headers, body: bytes) -> Optional[Tuple[str, int]]:
+    """
+    Send a webhook on to the replica that owns its channel, reusing the connections of this process.
+
+    :param owner: str: URL of the owning replica
+    :param query_string: str: query string of the webhook URL
+    :param headers: headers of the webhook, looked up by lower case name
+    :param body: bytes: webhook body
+    :return: Response body and status code of the owner, None if it could not be reached
+    """
+    headers = {name: value for name in FORWARD_HEADERS if (value := headers.get(name.lower()))}
+    headers[FORWARDED_HEADER] = config.REPLICA_URL
+    try:
+        response = await runtime.run(_forward(f"{owner}/mr/notify?{query_string}", headers, body))
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.warning(f"Failed to forward webhook to {owner}, handling it here: {e}")
+        metrics.SHARD_FORWARDS.inc(result='failed')
+        return None
+    metrics.SHARD_FORWARDS.inc(result='forwarded')
+    return response
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Optional
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+from app import store, tracing
+from app.breaker import CircuitBreaker
+
+# Requests per second and burst size of the Slack Web API rate limit tiers
+# https://api.slack.com/docs/rate-limits
+TIERS = {
+    1: (1 / 60, 1),
+    2: (20 / 60, 3),
+    3: (50 / 60, 5),
+    4: (100 / 60, 10),
+}
+METHOD_TIERS = {
+    'chat_update': 3,
+    'conversations_history': 3,
+    'conversations_info': 3,
+    'users_list': 2,
+    'users_info': 4,
+    'users_lookupByEmail': 3,
+    'auth_test': 4,
+}
+# chat.postMessage has no tier, it allows about one message per second per channel with short bursts
+CHANNEL_LIMITS = {
+    'chat_postMessage': (1, 3),
+}
+DEFAULT_TIER = 3
+
+
+class TokenBucket:
+    """
+    Token bucket in its GCRA form: tat is the theoretical arrival time of the next request. Requests are reserved in
+    order, so callers are served first come, first served.
+    """
+    __slots__ = ('key', 'interval', 'tolerance', 'tat', 'waiting')
+
+    def __init__(self, rate: float, burst: int, key: str = ''):
+        self.key = key
+        self.interval = 1 / rate
+        self.tolerance = (burst - 1) * self.interval
+        self.tat = 0.0
+        self.waiting = 0
+
+    def reserve(self, now: float) -> float:
+        """
+        Reserve a token.
+
+        :param now: float: current time, monotonic or wall clock for a shared bucket
+        :return: Seconds to wait before the request may be sent
+        """
+        wait = max(0.0, self.tat - self.tolerance - now)
+        self.tat = max(self.tat, now + wait) + self.interval
+        return wait
+
+    def pause(self, now: float, seconds: float) -> None:
+        """
+        Hold back all requests for the given time, e.g. as asked by Retry-After.
+
+        :param now: float: current time, monotonic or wall clock for a shared bucket
+        :param seconds: float: pause duration
+        :return: None
+        """
+        self.tat = max(self.tat, now + seconds + self.tolerance)
+
+
+class SlackScheduler:
+    """
+    Schedules calls to the Slack Web API client with a token bucket per method tier and per channel. Calls that would
+    exceed the rate limit wait in line instead of failing, and a 429 pauses the bucket for the Retry-After time before
+    the call is retried. Slack limits the app as a whole, so shared buckets keep their state in the state database,
+    where the schedulers of all workers reserve from the same buckets. With a circuit breaker, calls fail right away
+    while Slack is degraded instead of waiting in line. Every other attribute is passed through to the client.
+    """
+
+    def __init__(self, client: AsyncWebClient, max_retries: int, breaker: Optional[CircuitBreaker] = None,
+                 shared: bool = False):
+        """
+        :param client: AsyncWebClient: Slack client to schedule calls for
+        :param max_retries: int: number of retries of a rate limited call
+        :param breaker: Optional[CircuitBreaker]: circuit breaker of the Slack calls
+        :param shared: bool: share the buckets with the other workers through the state database
+        """
+        self.client = client
+        self.max_retries = max_retries
+        self.breaker = breaker
+        self.shared = shared
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.client, name)
+        if name.startswith('_') or not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await self.call(name, attr, *args, **kwargs)
+
+        return call
+
+    def get_buckets(self, name: str, channel: Optional[str]) -> list:
+        keys = []
+        if name in CHANNEL_LIMITS:
+            keys.append((name, channel, CHANNEL_LIMITS[name]))
+        else:
+            keys.append((name, None, TIERS[METHOD_TIERS.get(name, DEFAULT_TIER)]))
+
+        with self.lock:
+            for name, channel, (rate, burst) in keys:
+                if (name, channel) not in self.buckets:
+                    self.buckets[(name, channel)] = TokenBucket(rate, burst, f"{name}:{channel}" if channel else name)
+            return [self.buckets[(name, channel)] for name, channel, _ in keys]
+
+    def update(self, buckets: list, change) -> list:
+        """
+        Apply a change to the buckets of a call. Shared buckets continue from the state the workers stored, and
+        store theirs again in the same transaction.
+
+        :param buckets: list: buckets of the call
+        :param change: Callable: called with every bucket and the current time
+        :return: The result of the change for every bucket
+        """
+        if not self.shared:
+            now = time.monotonic()
+            return [change(bucket, now) for bucket in buckets]
+
+        now = time.time()
+        with store.transaction() as conn:
+            for bucket in buckets:
+                row = conn.execute("SELECT tat FROM rate_limits WHERE key = ?", (bucket.key,)).fetchone()
+                bucket.tat = row[0] if row else 0.0
+            results = [change(bucket, now) for bucket in buckets]
+            conn.executemany("INSERT OR REPLACE INTO rate_limits (key, tat) VALUES (?, ?)",
+                             [(bucket.key, bucket.tat) for bucket in buckets])
+        return results
+
+    async def acquire(self, buckets: list) -> None:
+        with self.lock:
+            wait = max(self.update(buckets, TokenBucket.reserve))
+            if wait:
+                for bucket in buckets:
+                    bucket.waiting += 1
+        if not wait:
+            return
+
+        try:
+            with tracing.span("slack.rate_limit_wait"):
+                await asyncio.sleep(wait)
+        finally:
+            with self.lock:
+                for bucket in buckets:
+                    bucket.waiting -= 1
+
+    async def call(self, name: str, method, *args, **kwargs):
+        """
+        Call a Slack Web API method once its rate limit allows it.
+
+        :param name: str: client method name, e.g. chat_postMessage
+        :param method: Callable: client method
+        :return: Slack response
+        """
+        buckets = self.get_buckets(name, kwargs.get('channel'))
+        for attempt in range(self.max_retries + 1):
+            if self.breaker:
+                self.breaker.before_call()
+            start = time.monotonic()
+            try:
+                await self.acquire(buckets)
+                start = time.monotonic()
+                response = await method(*args, **kwargs)
+                if self.breaker:
+                    self.breaker.record(time.monotonic() - start)
+                return response
+            except asyncio.CancelledError:
+                if self.breaker:
+                    self.breaker.cancel()
+                raise
+            except Exception as e:
+                if self.breaker:
+                    self.breaker.record(time.monotonic() - start, e)
+                if not isinstance(e, SlackApiError) or e.response.status_code != 429 or attempt == self.max_retries:
+                    raise e
+                retry_after = float(e.response.headers.get('Retry-After', 1))
+                logging.warning(f"Slack rate limited {name}, retrying in {retry_after}s")
+                with self.lock:
+                    self.update(buckets, lambda bucket, now: bucket.pause(now, retry_after))
+
+    def queue_depth(self) -> Dict[str, int]:
+        """
+        Number of calls waiting for their rate limit, per method and channel.
+
+        :return: Dict[str, int]
+        """
+        with self.lock:
+            return {f"{name}:{channel}" if channel else name: bucket.waiting
+                    for (name, channel), bucket in self.buckets.items() if bucket.waiting}
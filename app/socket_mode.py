@@ -0,0 +1,107 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable
+from app import config, digest, handler, runtime, store, user_store, warmup
+import app.handlers as handlers
+
+_started_pid = None
+_lock = threading.Lock()
+# Kept open for the lifetime of the owner process, the election lock is released when it exits
+_lock_file = None
+HEARTBEAT_KEY = 'socket_mode_heartbeat'
+
+
+def ensure_started() -> None:
+    """
+    Join the election of the process that owns the Socket Mode connection, if this process has not joined yet.
+    Only one process of all workers connects, so team_join and user_change events are received once.
+
+    :return: None
+    """
+    global _started_pid
+    with _lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+    threading.Thread(target=elect, name="mergeminion-socket-mode", daemon=True).start()
+
+
+def is_owner() -> bool:
+    return _lock_file is not None and _started_pid == os.getpid()
+
+
+def elect() -> None:
+    """
+    Wait until this process holds the election lock, then connect to Socket Mode, publish the users list to the
+    shared user store and, with WARMUP_ON_START, index the threads of all team channels. The connection is made in a
+    thread of its own, so the users, the warm-up and the channel digests do not wait for Socket Mode: they only need
+    the Web API. The owner keeps publishing a heartbeat with the connection state for the readiness probes of all
+    workers. A worker takes over within SOCKET_MODE_ELECTION_INTERVAL seconds when the owner exits.
+
+    :return: None
+    """
+    while not try_lock():
+        time.sleep(config.SOCKET_MODE_ELECTION_INTERVAL)
+
+    logging.info(f"Process {os.getpid()} owns the Socket Mode connection")
+    threading.Thread(target=retry, args=(handler.connect, "connect to Socket Mode"), name="mergeminion-socket-connect",
+                     daemon=True).start()
+    digest.start(handlers.mr_queue)
+    retry(load_users, "load the users list")
+    if config.WARMUP_ON_START:
+        retry(warm_up, "warm up")
+    while True:
+        retry(heartbeat, "save the Socket Mode heartbeat")
+        time.sleep(config.SOCKET_MODE_ELECTION_INTERVAL)
+
+
+def try_lock() -> bool:
+    global _lock_file
+    lock_file = open(config.SOCKET_MODE_LOCK_PATH, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _lock_file = lock_file
+    return True
+
+
+def load_users() -> None:
+    members = asyncio.run_coroutine_threadsafe(handlers.get_users_list(), runtime.get_loop()).result()
+    user_store.publish(members, loaded=True)
+    logging.info(f"Published {len(members)} users to the user store")
+
+
+def warm_up() -> None:
+    asyncio.run_coroutine_threadsafe(warmup.warm_up(config.WARMUP_CONCURRENCY, config.WARMUP_MAX_PAGES),
+                                     runtime.get_loop()).result()
+
+
+def heartbeat() -> None:
+    value = json.dumps({'pid': os.getpid(), 'connected': handler.client.is_connected(), 'time': time.time()})
+    store.get_connection().execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (HEARTBEAT_KEY, value))
+
+
+def get_heartbeat() -> dict:
+    """
+    The last heartbeat of the Socket Mode owner.
+
+    :return: pid, connected and time of the heartbeat, empty if no owner is connected yet
+    """
+    row = store.get_connection().execute("SELECT value FROM kv WHERE key = ?", (HEARTBEAT_KEY,)).fetchone()
+    return json.loads(row[0]) if row else {}
+
+
+def retry(func: Callable[[], None], description: str) -> None:
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            logging.error(f"Failed to {description}, retrying in {config.SOCKET_MODE_ELECTION_INTERVAL}s: {e}")
+            time.sleep(config.SOCKET_MODE_ELECTION_INTERVAL)
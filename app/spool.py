@@ -0,0 +1,181 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+from app import config, metrics, parser, runtime, slack_breaker, store, tracing
+from app.breaker import CircuitOpenError
+import app.handlers as handlers
+
+_workers_pid = None
+_wakeup = None
+_lock = threading.Lock()
+
+
+class Job:
+    """
+    A spooled webhook delivery.
+    """
+    __slots__ = ('id', 'channel', 'data', 'attempts', 'event_uuid')
+
+    def __init__(self, job_id: int, channel: str, data: Dict, attempts: int, event_uuid: Optional[str] = None):
+        self.id = job_id
+        self.channel = channel
+        self.data = data
+        self.attempts = attempts
+        self.event_uuid = event_uuid
+
+
+def append(channel_name: str, data: Dict, event_uuid: Optional[str] = None) -> int:
+    """
+    Durably store a webhook delivery, to be handled by the spool workers. The X-Gitlab-Event-UUID is kept with it,
+    so the idempotency store recognises the delivery by the same key as when it is handled right away.
+
+    :param channel_name: str: team name from the webhook URL
+    :param data: Dict: webhook request data
+    :param event_uuid: Optional[str]: X-Gitlab-Event-UUID header
+    :return: Job id
+    """
+    cursor = store.get_connection().execute(
+        "INSERT INTO spool (channel, mr_id, payload, event_uuid, next_attempt) VALUES (?, ?, ?, ?, ?)",
+        (channel_name, parser.deep_get(data, "object_attributes.id", None), json.dumps(data), event_uuid,
+         time.time()))
+
+    if _workers_pid == os.getpid():
+        runtime.get_loop().call_soon_threadsafe(_wakeup.set)
+    return cursor.lastrowid
+
+
+def claim(worker_id: str) -> Optional[Job]:
+    """
+    Lock the oldest job that is due. A job is only handed out once all earlier jobs of the same MR are done, so the
+    events of an MR are handled in order. Jobs locked by a worker that died are handed out again after the lease.
+
+    :param worker_id: str: worker claiming the job
+    :return: Job or None
+    """
+    now = time.time()
+    with store.transaction() as conn:
+        row = conn.execute(
+            "SELECT id, channel, payload, attempts, event_uuid FROM spool AS s "
+            "WHERE state = 'pending' AND next_attempt <= ? AND (locked_by IS NULL OR locked_at < ?) "
+            "AND NOT EXISTS (SELECT 1 FROM spool AS p WHERE p.state = 'pending' AND p.channel = s.channel "
+            "AND p.mr_id IS s.mr_id AND p.id < s.id) "
+            "ORDER BY id LIMIT 1", (now, now - config.SPOOL_LEASE)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE spool SET locked_by = ?, locked_at = ? WHERE id = ?", (worker_id, now, row[0]))
+    return Job(row[0], row[1], json.loads(row[2]), row[3], row[4])
+
+
+def size() -> int:
+    return store.get_connection().execute("SELECT COUNT(*) FROM spool WHERE state = 'pending'").fetchone()[0]
+
+
+def release(job: Job) -> None:
+    """
+    Hand a job out again without counting the attempt, e.g. when Slack could not be called.
+
+    :param job: Job: claimed job
+    :return: None
+    """
+    store.get_connection().execute("UPDATE spool SET locked_by = NULL, locked_at = NULL WHERE id = ?", (job.id,))
+
+
+def complete(job: Job) -> None:
+    store.get_connection().execute("DELETE FROM spool WHERE id = ?", (job.id,))
+
+
+def retry(job: Job, error: Exception) -> None:
+    """
+    Schedule the job again with exponential backoff, or mark it dead once it ran out of attempts.
+
+    :param job: Job: failed job
+    :param error: Exception: reason of the failure
+    :return: None
+    """
+    attempts = job.attempts + 1
+    state = 'dead' if attempts >= config.SPOOL_MAX_ATTEMPTS else 'pending'
+    delay = min(config.SPOOL_BACKOFF * 2 ** job.attempts, config.SPOOL_MAX_BACKOFF)
+    store.get_connection().execute(
+        "UPDATE spool SET state = ?, attempts = ?, next_attempt = ?, locked_by = NULL, locked_at = NULL, error = ? "
+        "WHERE id = ?", (state, attempts, time.time() + delay, repr(error), job.id))
+
+    if state == 'dead':
+        logging.error(f"Giving up on spooled webhook {job.id} after {attempts} attempts: {error}")
+    else:
+        logging.warning(f"Spooled webhook {job.id} failed, retrying in {delay}s: {error}")
+
+
+async def process(job: Job) -> None:
+    start = time.perf_counter()
+    update_type = ''
+    try:
+        with tracing.trace("spool_job", team=job.channel, job=job.id, attempt=job.attempts + 1):
+            results = await handlers.handle_mr_notify(job.data, job.channel, job.event_uuid)
+        update_type = ','.join(sorted({result for result in results.values() if isinstance(result, str)}))
+        # Channels that were sent to are skipped on the retry by the idempotency store
+        if any(isinstance(result, CircuitOpenError) for result in results.values()):
+            release(job)
+            return
+        errors = [result for result in results.values()
+                  if isinstance(result, BaseException) and not isinstance(result, ValueError)]
+        if errors:
+            retry(job, errors[0])
+        else:
+            complete(job)
+    except CircuitOpenError:
+        release(job)
+    except ValueError as ve:
+        logging.error(ve)
+        complete(job)
+    except Exception as e:
+        retry(job, e)
+    finally:
+        metrics.SPOOL_LATENCY.observe(time.perf_counter() - start,
+                                      action=parser.deep_get(job.data, "object_attributes.action"),
+                                      update_type=update_type)
+
+
+async def worker(worker_id: str) -> None:
+    """
+    Drain the spool until the process exits. While the Slack circuit breaker is open no jobs are taken, they are
+    replayed in order once Slack recovers.
+
+    :param worker_id: str: unique worker name
+    :return: None
+    """
+    while True:
+        _wakeup.clear()
+        job = claim(worker_id) if slack_breaker.is_available() else None
+        if job is None:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), config.SPOOL_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await process(job)
+
+
+def ensure_workers() -> None:
+    """
+    Start the spool workers of this process, if they are not running yet.
+
+    :return: None
+    """
+    global _workers_pid, _wakeup
+    with _lock:
+        if _workers_pid == os.getpid():
+            return
+
+        loop = runtime.get_loop()
+        _wakeup = asyncio.Event()
+
+        def start():
+            for i in range(config.SPOOL_WORKERS):
+                loop.create_task(worker(f"{os.getpid()}-{i}"))
+
+        loop.call_soon_threadsafe(start)
+        _workers_pid = os.getpid()
@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from app import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS thread_index (
+    channel TEXT NOT NULL,
+    mr_id INTEGER NOT NULL,
+    ts TEXT NOT NULL,
+    closed REAL,
+    PRIMARY KEY (channel, mr_id)
+);
+CREATE TABLE IF NOT EXISTS thread_state (
+    channel TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    message TEXT NOT NULL,
+    PRIMARY KEY (channel, ts)
+);
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_seq ON users (seq);
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS webhook_events (
+    key TEXT PRIMARY KEY,
+    received REAL NOT NULL,
+    state TEXT NOT NULL DEFAULT 'done',
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS webhook_events_received ON webhook_events (received);
+CREATE TABLE IF NOT EXISTS digest (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    entry TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS digest_channel ON digest (channel, created);
+CREATE TABLE IF NOT EXISTS spool (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    mr_id INTEGER,
+    payload TEXT NOT NULL,
+    event_uuid TEXT,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    locked_by TEXT,
+    locked_at REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS spool_pending ON spool (state, channel, mr_id, id);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    tat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    le TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    value REAL NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (name, labels, le, pid)
+);
+"""
+# Columns added to tables of existing state databases: table, column and its definition
+COLUMNS = (
+    ('spool', 'event_uuid', 'TEXT'),
+    ('thread_index', 'closed', 'REAL'),
+    ('webhook_events', 'state', "TEXT NOT NULL DEFAULT 'done'"),
+    ('webhook_events', 'claimed_at', 'REAL'),
+)
+
+_local = threading.local()
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Return the SQLite connection to the shared state database for the current thread.
+    Connections are never reused across a fork, so every uwsgi worker opens its own handle on the same file.
+    Statements run synchronously, also on the event loop: they are lookups and writes of single rows by their key
+    in a local WAL database, which take tens of microseconds. Only while another worker commits a write does a
+    statement wait for it, at most `timeout` seconds.
+
+    :return: sqlite3.Connection
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'pid', None) != os.getpid():
+        conn = sqlite3.connect(config.STATE_DB_PATH, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        add_columns(conn)
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def add_columns(conn: sqlite3.Connection) -> None:
+    """
+    Add the COLUMNS that a state database created by an earlier version does not have yet.
+
+    :param conn: sqlite3.Connection
+    :return: None
+    """
+    for table, column, definition in COLUMNS:
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            try:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            except sqlite3.OperationalError as e:
+                # Another worker added it first
+                if 'duplicate column' not in str(e):
+                    raise
+
+
+@contextmanager
+def transaction():
+    """
+    Run the statements in the block in a single write transaction.
+
+    :return: sqlite3.Connection
+    """
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
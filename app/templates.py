@@ -0,0 +1,85 @@
+from typing import Dict, List, Tuple, Union
+
+
+class Slot:
+    """
+    A text field of a sent message: its position in the blocks, and the format its value is put into when it is
+    updated. A tuple of values fills several placeholders.
+    """
+    __slots__ = ('name', 'path', 'parent', 'key', 'format')
+
+    def __init__(self, name: str, path: Tuple, format: str = "{}"):
+        self.name = name
+        self.path = path
+        *self.parent, self.key = path
+        self.format = format
+
+    def fill(self, value: Union[str, Tuple]) -> str:
+        return self.format.format(*value) if isinstance(value, tuple) else self.format.format(value)
+
+
+class Template:
+    """
+    The text fields of a message layout by name, to read and update messages that were already sent. The positions
+    are fixed: they are those of the blocks the parser builds, and of every message sent before, so they must not
+    change.
+    """
+
+    def __init__(self, slots: List[Slot]):
+        self.slots = {slot.name: slot for slot in slots}
+
+    def locate(self, blocks: List[Dict], name: str) -> Tuple[Dict, Union[str, int]]:
+        slot = self.slots[name]
+        node = blocks
+        for step in slot.parent:
+            node = node[step]
+        return node, slot.key
+
+    def get(self, blocks: List[Dict], name: str) -> str:
+        """
+        Read the text of a slot from the blocks of a message.
+
+        :param blocks: List[Dict]: Slack message blocks
+        :param name: str: slot name
+        :return: str: slot text, with its label
+        :raises (IndexError, KeyError, TypeError): if the message does not have the layout of the template
+        """
+        node, key = self.locate(blocks, name)
+        return node[key]
+
+    def set(self, blocks: List[Dict], name: str, value: Union[str, Tuple]) -> bool:
+        """
+        Fill a slot of the blocks of a message in place.
+
+        :param blocks: List[Dict]: Slack message blocks
+        :param name: str: slot name
+        :param value: value to fill the slot with
+        :return: bool: whether the text changed
+        :raises (IndexError, KeyError, TypeError): if the message does not have the layout of the template
+        """
+        return self.set_text(blocks, name, self.slots[name].fill(value))
+
+    def set_text(self, blocks: List[Dict], name: str, text: str) -> bool:
+        node, key = self.locate(blocks, name)
+        changed = node[key] != text
+        node[key] = text
+        return changed
+
+    def path(self, name: str) -> str:
+        """
+        :param name: str: slot name
+        :return: str: path of the slot in a message, for compile_path
+        """
+        return '.'.join(map(str, ('blocks',) + self.slots[name].path))
+
+
+# The thread start of an MR, as built by parser.parse_request_to_nm_blocks
+NEW_MR = Template([
+    Slot('title', (0, 'text', 'text')),
+    Slot('branches', (1, 'text', 'text'), "`{}` → `{}`"),
+    Slot('project', (3, 'fields', 0, 'text')),
+    Slot('status', (3, 'fields', 1, 'text'), "*Status:*\n{}"),
+    Slot('last_update', (3, 'fields', 2, 'text'), "*Last Update:*\n{}"),
+    Slot('assignees', (3, 'fields', 3, 'text'), "*Assignees:*\n{}"),
+    Slot('reviewers', (3, 'fields', 4, 'text'), "*Reviewers:*\n{}"),
+])
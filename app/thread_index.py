@@ -0,0 +1,104 @@
+import json
+import time
+from typing import Dict, List, Optional
+from app import config, store
+
+
+def get_thread_ts(channel: str, mr_id: int) -> Optional[str]:
+    """
+    Look up the ts of the mr_created message that starts the thread of an MR in a channel.
+
+    :param channel: str: Slack channel id
+    :param mr_id: int: GitLab MR id (object_attributes.id)
+    :return: Thread ts or None
+    """
+    row = store.get_connection().execute("SELECT ts FROM thread_index WHERE channel = ? AND mr_id = ?",
+                                         (channel, mr_id)).fetchone()
+    return row[0] if row else None
+
+
+def save_thread_ts(channel: str, mr_id: int, ts: str) -> None:
+    """
+    Store the ts of the mr_created message of an MR. A newer thread (e.g. draft marked as ready) replaces the old one,
+    and the state of the old one is dropped.
+
+    :param channel: str: Slack channel id
+    :param mr_id: int: GitLab MR id (object_attributes.id)
+    :param ts: str: Slack message ts
+    :return: None
+    """
+    with store.transaction() as conn:
+        row = conn.execute("SELECT ts FROM thread_index WHERE channel = ? AND mr_id = ?", (channel, mr_id)).fetchone()
+        if row and row[0] != ts:
+            conn.execute("DELETE FROM thread_state WHERE channel = ? AND ts = ?", (channel, row[0]))
+        conn.execute("INSERT OR REPLACE INTO thread_index (channel, mr_id, ts) VALUES (?, ?, ?)", (channel, mr_id, ts))
+
+
+def set_closed(channel: str, mr_id: int, closed: bool) -> None:
+    """
+    Record that an MR was merged or closed, or reopened. The threads of MRs that were closed more than
+    THREAD_INDEX_TTL seconds ago are removed on the way, so the index stays bounded; a late event of such an MR finds
+    its thread in the channel history again.
+
+    :param channel: str: Slack channel id
+    :param mr_id: int: GitLab MR id (object_attributes.id)
+    :param closed: bool: merged or closed, False when reopened
+    :return: None
+    """
+    now = time.time()
+    with store.transaction() as conn:
+        conn.execute("UPDATE thread_index SET closed = ? WHERE channel = ? AND mr_id = ?",
+                     (now if closed else None, channel, mr_id))
+        if config.THREAD_INDEX_TTL > 0:
+            cutoff = now - config.THREAD_INDEX_TTL
+            conn.execute("DELETE FROM thread_state WHERE (channel, ts) IN "
+                         "(SELECT channel, ts FROM thread_index WHERE closed < ?)", (cutoff,))
+            conn.execute("DELETE FROM thread_index WHERE closed < ?", (cutoff,))
+
+
+def get_thread_message(channel: str, ts: str) -> Optional[Dict]:
+    """
+    Look up the latest state of a thread start message, as saved by any worker.
+
+    :param channel: str: Slack channel id
+    :param ts: str: Thread ts
+    :return: Compact thread start message or None
+    """
+    row = store.get_connection().execute("SELECT message FROM thread_state WHERE channel = ? AND ts = ?",
+                                         (channel, ts)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def save_thread_message(channel: str, message: Dict) -> None:
+    """
+    Store the state of a thread start message after it was posted or updated, so all workers continue from it.
+
+    :param channel: str: Slack channel id
+    :param message: Dict: message with ts, blocks and metadata
+    :return: None
+    """
+    message = {'ts': message['ts'], 'blocks': message['blocks'], 'metadata': message['metadata']}
+    store.get_connection().execute("INSERT OR REPLACE INTO thread_state (channel, ts, message) VALUES (?, ?, ?)",
+                                   (channel, message['ts'], json.dumps(message)))
+
+
+def index_threads(channel: str, messages: List[Dict]) -> int:
+    """
+    Add the mr_created messages of a channel to the thread index, keeping the threads that are already indexed.
+
+    :param channel: str: Slack channel id
+    :param messages: List[Dict]: mr_created messages, newest first
+    :return: Number of threads added
+    """
+    with store.transaction() as conn:
+        added = 0
+        for message in messages:
+            mr_id = message['metadata']['event_payload'].get('mr_id')
+            cursor = conn.execute("INSERT OR IGNORE INTO thread_index (channel, mr_id, ts) VALUES (?, ?, ?)",
+                                  (channel, mr_id, message['ts']))
+            if cursor.rowcount:
+                added += 1
+                conn.execute("INSERT OR IGNORE INTO thread_state (channel, ts, message) VALUES (?, ?, ?)",
+                             (channel, message['ts'], json.dumps({'ts': message['ts'], 'blocks': message['blocks'],
+                                                                  'metadata': message['metadata']})))
+    return added
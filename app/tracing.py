@@ -0,0 +1,165 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from app import config
+
+_current = contextvars.ContextVar('mergeminion_span', default=None)
+_export_lock = threading.Lock()
+
+
+class Span:
+    """
+    A timed stage of a webhook. Spans of one webhook share the trace, and know the span they were started in.
+    """
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'start', 'end', 'attributes')
+
+    def __init__(self, trace: 'Trace', name: str, parent_id: Optional[str], attributes: Dict):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = attributes
+        trace.spans.append(self)
+
+    def duration(self) -> float:
+        return ((self.end or time.time_ns()) - self.start) / 1e9
+
+    def to_otlp(self) -> Dict:
+        return {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            **({'parentSpanId': self.parent_id} if self.parent_id else {}),
+            'name': self.name,
+            'kind': 2 if self.parent_id is None else 1,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end or time.time_ns()),
+            'attributes': [{'key': key, 'value': otlp_value(value)} for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.attributes['error']} if 'error' in self.attributes else {},
+        }
+
+
+class Trace:
+    __slots__ = ('trace_id', 'spans')
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+
+
+def otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def is_enabled() -> bool:
+    return bool(config.TRACE_EXPORT) or config.SLOW_REQUEST_THRESHOLD > 0
+
+
+@contextmanager
+def trace(name: str, **attributes):
+    """
+    Trace a webhook: the block is the root span, and the stages started in it, also in tasks it starts, are its child
+    spans. When the block ends the trace is exported to TRACE_EXPORT, and logged if it took longer than
+    SLOW_REQUEST_THRESHOLD seconds.
+
+    :param name: str: name of the root span
+    :param attributes: attributes of the root span
+    :return: Root span, None if tracing is off
+    """
+    if not is_enabled():
+        yield None
+        return
+
+    root = Span(Trace(), name, None, attributes)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.attributes['error'] = repr(e)
+        raise
+    finally:
+        root.end = time.time_ns()
+        _current.reset(token)
+        finish(root)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a stage of the current webhook. Does nothing outside of a trace.
+
+    :param name: str: name of the stage
+    :param attributes: attributes of the span
+    :return: Span, None outside of a trace
+    """
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+
+    current = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes['error'] = repr(e)
+        raise
+    finally:
+        current.end = time.time_ns()
+        _current.reset(token)
+
+
+def set_attributes(**attributes) -> None:
+    """
+    Add attributes to the root span of the current webhook, e.g. the MR id once the body is decoded.
+
+    :return: None
+    """
+    current = _current.get()
+    if current is not None:
+        current.trace.spans[0].attributes.update(attributes)
+
+
+def finish(root: Span) -> None:
+    if config.TRACE_EXPORT:
+        export(root.trace)
+    if 0 < config.SLOW_REQUEST_THRESHOLD <= root.duration():
+        stages = ", ".join(span.name + (f"[{span.attributes['channel']}]" if span.attributes.get('channel') else '')
+                           + f" {span.duration():.3f}s" for span in root.trace.spans[1:])
+        attributes = " ".join(f"{key}={value}" for key, value in root.attributes.items())
+        logging.warning(f"Slow {root.name} took {root.duration():.3f}s, {attributes}: {stages}")
+
+
+def export(trace: Trace) -> None:
+    """
+    Write a trace as one line of OTLP JSON, the format of the OpenTelemetry file exporter, to stdout or to the file
+    in TRACE_EXPORT.
+
+    :param trace: Trace: finished trace
+    :return: None
+    """
+    line = json.dumps({'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'mergeminion'}},
+                                    {'key': 'process.pid', 'value': {'intValue': str(os.getpid())}}]},
+        'scopeSpans': [{'scope': {'name': 'mergeminion'}, 'spans': [span.to_otlp() for span in trace.spans]}],
+    }]})
+    with _export_lock:
+        if config.TRACE_EXPORT == 'stdout':
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+        else:
+            with open(config.TRACE_EXPORT, 'a') as f:
+                f.write(line + "\n")
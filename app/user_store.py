@@ -0,0 +1,58 @@
+import json
+from typing import Dict, Iterable, List, Tuple
+from app import store
+
+LOADED_KEY = 'users_loaded'
+
+
+class UsersNotLoadedError(Exception):
+    """
+    The Socket Mode owner has not published the users list in time, e.g. while Slack can not be reached.
+    """
+
+
+def publish(users: Iterable[Dict], loaded: bool = False) -> None:
+    """
+    Add or update users in the shared user store. Every change gets a new sequence number, so workers can pick up the
+    changes since they last looked.
+
+    :param users: Iterable[Dict]: Slack user objects
+    :param loaded: bool: the users are the complete users list
+    :return: None
+    """
+    with store.transaction() as conn:
+        seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM users").fetchone()[0]
+        conn.executemany("INSERT OR REPLACE INTO users (id, data, seq) VALUES (?, ?, ?)",
+                         [(user.get('id', ''), json.dumps(compact(user)), seq + i)
+                          for i, user in enumerate(users, start=1)])
+        if loaded:
+            conn.execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, '1')", (LOADED_KEY,))
+
+
+def changes(since: int) -> Tuple[int, List[Dict]]:
+    """
+    Get the users that changed after a sequence number.
+
+    :param since: int: last sequence number seen
+    :return: The new last sequence number and the changed users
+    """
+    rows = store.get_connection().execute("SELECT data, seq FROM users WHERE seq > ? ORDER BY seq",
+                                          (since,)).fetchall()
+    return (rows[-1][1] if rows else since), [json.loads(data) for data, _ in rows]
+
+
+def is_loaded() -> bool:
+    """
+    Whether the complete users list has been published.
+
+    :return: bool
+    """
+    return store.get_connection().execute("SELECT 1 FROM kv WHERE key = ?", (LOADED_KEY,)).fetchone() is not None
+
+
+def compact(user: Dict) -> Dict:
+    """
+    Keep only the fields the user directory uses.
+    """
+    return {'id': user.get('id', ''), 'name': user.get('name', ''), 'deleted': user.get('deleted', False),
+            'profile': {'display_name': (user.get('profile') or {}).get('display_name', '')}}
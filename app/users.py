@@ -0,0 +1,82 @@
+from typing import Dict, Optional, Iterable, Mapping
+from app import routing
+
+
+class UserDirectory:
+    """
+    Slack users indexed by lower-cased name and display_name. GitLab usernames are resolved through the user mapping
+    first, then looked up in the indexes.
+    """
+
+    def __init__(self, user_mapping: Optional[Mapping[str, str]] = None):
+        """
+        :param user_mapping: Optional[Mapping[str, str]]: GitLab username to Slack username mapping, by default the
+            user mapping of the current routing, so it follows reloads
+        """
+        self.user_mapping = None if user_mapping is None else {
+            gitlab.casefold(): slack.casefold() for gitlab, slack in user_mapping.items()}
+        self.by_name = {}
+        self.by_display_name = {}
+        self.keys = {}
+        self.loaded = False
+        # Last change of the shared user store applied to the directory
+        self.seq = 0
+
+    def load(self, members: Iterable[Dict]) -> None:
+        """
+        Replace the whole directory with the given users.
+
+        :param members: Iterable[Dict]: users.list members
+        :return: None
+        """
+        self.by_name = {}
+        self.by_display_name = {}
+        self.keys = {}
+        for user in members:
+            self.upsert(user)
+        self.loaded = True
+
+    def upsert(self, user: Dict) -> None:
+        """
+        Add a user or update the index entries of an existing one, e.g. on team_join or user_change.
+
+        :param user: Dict: Slack user object
+        :return: None
+        """
+        user_id = user.get('id', '')
+        self.remove(user_id)
+        if user.get('deleted') is True:
+            return
+
+        name = user.get('name', '').lower()
+        display_name = (user.get('profile') or {}).get('display_name', '').lower()
+        if name:
+            self.by_name[name] = user_id
+        if display_name:
+            self.by_display_name[display_name] = user_id
+        self.keys[user_id] = (name, display_name)
+
+    def remove(self, user_id: str) -> None:
+        """
+        Drop a user from the indexes.
+
+        :param user_id: str: Slack user id
+        :return: None
+        """
+        name, display_name = self.keys.pop(user_id, (None, None))
+        if self.by_name.get(name) == user_id:
+            del self.by_name[name]
+        if self.by_display_name.get(display_name) == user_id:
+            del self.by_display_name[display_name]
+
+    def lookup(self, username: str) -> Optional[str]:
+        """
+        Get Slack user ID by GitLab username.
+
+        :param username: str: GitLab username
+        :return: user_id | None
+        """
+        user_mapping = routing.get().user_mapping if self.user_mapping is None else self.user_mapping
+        username = user_mapping.get(username.casefold(), username.casefold())
+        user_id = self.by_name.get(username)
+        return user_id if user_id is not None else self.by_display_name.get(username)
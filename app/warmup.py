@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+from app import parser, routing, store, thread_index, user_store
+import app.handlers as handlers
+
+PAGE_SIZE = 200
+DONE_KEY = 'warmup_done'
+
+
+async def index_channel(channel: str, max_pages: int) -> Dict[str, float]:
+    """
+    Page through the history of a channel and add every mr_created message to the thread index. Threads that are
+    already indexed are kept, they are at least as new as the ones in the history.
+
+    :param channel: str: Slack channel id
+    :param max_pages: int: number of history pages to fetch at most, 0 for the whole history
+    :return: Dict with the number of pages, messages and threads, and the duration
+    """
+    start = time.perf_counter()
+    pages = messages = threads = 0
+    cursor = None
+    while True:
+        response = await handlers.get_history_page(channel, limit=PAGE_SIZE, cursor=cursor)
+        pages += 1
+        messages += len(response['messages'])
+        threads += thread_index.index_threads(channel, [
+            message for message in response['messages']
+            if parser.deep_get(message, "metadata.event_type") == "mr_created"])
+
+        cursor = parser.deep_get(response, "response_metadata.next_cursor")
+        if not response.get('has_more') or not cursor or pages == max_pages:
+            break
+
+    result = {'pages': pages, 'messages': messages, 'threads': threads, 'seconds': time.perf_counter() - start}
+    logging.info(f"Indexed {threads} new threads from {messages} messages ({pages} pages) of channel {channel} "
+                 f"in {result['seconds']:.1f}s")
+    return result
+
+
+async def warm_up(concurrency: int, max_pages: int, load_users: bool = False) -> Dict[str, Optional[Dict]]:
+    """
+    The warm_up function loads the user directory and indexes the MR threads of all channels in the team mapping,
+    at most concurrency channels at a time, so the first webhooks after a deploy do not wait for Slack.
+
+    :param concurrency: int: number of channels to index at the same time
+    :param max_pages: int: number of history pages to fetch at most per channel, 0 for the whole history
+    :param load_users: bool: download and publish the users list, instead of waiting for the Socket Mode owner
+    :return: Result per channel, None for channels that failed
+    """
+    start = time.perf_counter()
+    if load_users:
+        user_store.publish(await handlers.get_users_list(), loaded=True)
+    users = await handlers.get_user_directory()
+    logging.info(f"User directory loaded with {len(users.keys)} users")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    channels = routing.get().channels
+
+    async def index(channel: str) -> Optional[Dict]:
+        async with semaphore:
+            try:
+                return await index_channel(channel, max_pages)
+            except Exception as e:
+                logging.error(f"Failed to index channel {channel}: {e}")
+                return None
+
+    results = dict(zip(channels, await asyncio.gather(*(index(channel) for channel in channels))))
+    store.get_connection().execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, '1')", (DONE_KEY,))
+    logging.info(f"Warm-up of {len(channels)} channels done in {time.perf_counter() - start:.1f}s, "
+                 f"{sum(r['threads'] for r in results.values() if r)} new threads indexed, "
+                 f"{sum(r is None for r in results.values())} channels failed")
+    return results
+
+
+def is_done() -> bool:
+    return store.get_connection().execute("SELECT 1 FROM kv WHERE key = ?", (DONE_KEY,)).fetchone() is not None
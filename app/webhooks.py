@@ -0,0 +1,163 @@
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Mapping, Optional, Tuple
+from urllib.parse import parse_qs
+from slack_sdk.errors import SlackApiError
+from app import config, idempotency, ingest, metrics, parser, runtime, sharding, slack_breaker, spool, tracing
+from app.breaker import CircuitOpenError, is_degraded
+from app.user_store import UsersNotLoadedError
+import app.handlers as handlers
+
+
+def is_authorized(token: Optional[str]) -> bool:
+    """
+    Check the X-Gitlab-Token of a webhook, if a GITLAB_WEBHOOK_TOKEN is configured.
+
+    :param token: Optional[str]: X-Gitlab-Token header
+    :return: bool
+    """
+    if not config.GITLAB_WEBHOOK_TOKEN:
+        return True
+    return bool(token) and token == config.GITLAB_WEBHOOK_TOKEN
+
+
+async def handle(headers: Mapping[str, str], query_string: str,
+                 read_body: Callable[[int], Awaitable[bytes]]) -> Tuple[int, str, Dict[str, str]]:
+    """
+    The handle function answers a request to /mr/notify, independent of the server it came in through.
+    Other hooks and bodies larger than MAX_BODY_SIZE are rejected before they are read.
+    With a replica set, webhooks of channels owned by another replica are forwarded or redirected to it, and the
+    channels owned here are handled by receive.
+
+    :param headers: Mapping[str, str]: request headers, looked up by lower case name
+    :param query_string: str: query string of the webhook URL
+    :param read_body: Callable: reads the request body, raising ingest.BodyTooLarge past the size it is given
+    :return: Status code, response body and response headers
+    """
+    start = time.perf_counter()
+    data = {}
+    update_type = ''
+    try:
+        if not is_authorized(headers.get('x-gitlab-token')):
+            return 403, "Add the correct gitlab token to the webhook", {}
+
+        if not ingest.is_merge_request_hook(headers.get('x-gitlab-event')):
+            return 400, "Enable only the Merge request trigger on the webhook", {}
+        if int(headers.get('content-length') or 0) > config.MAX_BODY_SIZE:
+            return 413, "Webhook body too large", {}
+
+        channel_name = ','.join(parse_qs(query_string).get('channel', []))
+        parts = sharding.split(channel_name, headers.get(sharding.FORWARDED_HEADER.lower()))
+        location = sharding.redirect_url(parts, query_string)
+        if location:
+            update_type = 'redirected'
+            return 307, "", {'Location': location}
+
+        try:
+            body = await read_body(config.MAX_BODY_SIZE)
+            forwarded = None
+            if set(parts) != {None}:
+                channel_name, forwarded = await sharding.forward_all(parts, query_string, headers, body)
+                if not channel_name:
+                    update_type = 'forwarded'
+                    return forwarded[1], forwarded[0], {}
+            data = ingest.decode(body)
+        except ingest.BodyTooLarge:
+            return 413, "Webhook body too large", {}
+        except ValueError:
+            return 400, "Invalid JSON", {}
+
+        body, status, update_type = await receive(data, channel_name, headers.get('x-gitlab-event-uuid'))
+        # A failure of another replica is reported to GitLab, so it delivers the webhook again
+        if forwarded and not 200 <= forwarded[1] < 300 and 200 <= status < 300:
+            body, status = forwarded
+        return status, body, {}
+    finally:
+        metrics.NOTIFY_LATENCY.observe(time.perf_counter() - start,
+                                       action=parser.deep_get(data, "object_attributes.action"),
+                                       update_type=update_type)
+
+
+async def receive(data: Dict, channel_name: str, event_uuid: Optional[str] = None) -> Tuple[str, int, str]:
+    """
+    The receive function handles a merge request webhook, independent of the server it came in through.
+    With the spool enabled, the webhook is stored and acknowledged right away, and sent to Slack in the background.
+    While Slack is degraded, or webhooks parked while it was are not replayed yet, webhooks are stored the same way
+    to keep them in order. Once BACKLOG_MAX_SIZE webhooks are waiting new ones are rejected, so GitLab retries later.
+    When the webhook is sent to several channels and some fail, the body has the result of every channel.
+
+    :param data: Dict: webhook request data
+    :param channel_name: str: team name from the webhook URL
+    :param event_uuid: Optional[str]: X-Gitlab-Event-UUID header
+    :return: Response body, status code and the update type of the event
+    """
+    backlog = spool.size()
+    if config.SPOOL_ENABLED or backlog or not slack_breaker.is_closed():
+        if backlog >= config.BACKLOG_MAX_SIZE:
+            metrics.WEBHOOKS_SHED.inc()
+            return "Too many webhooks are waiting for Slack, try again later", 503, 'shed'
+        return park(data, channel_name, 'spooled' if config.SPOOL_ENABLED else 'parked', event_uuid)
+
+    try:
+        with tracing.trace("mr_notify", team=channel_name):
+            results = await runtime.run(handlers.handle_mr_notify(data, channel_name, event_uuid))
+    except Exception as e:
+        if should_park(e):
+            return park(data, channel_name, 'parked', event_uuid)
+        body, status = describe(e)
+        logging.error(e)
+        return body, status, ''
+
+    if any(should_park(result) for result in results.values()):
+        # The channels that were sent to are skipped on the replay by the idempotency store, which knows the
+        # delivery by the same key as the event UUID is parked with it
+        return park(data, channel_name, 'parked', event_uuid)
+
+    failures = {channel_id: describe(result) for channel_id, result in results.items()
+                if isinstance(result, BaseException)}
+    update_type = ','.join(sorted({result for result in results.values() if isinstance(result, str)}))
+    if not failures:
+        return "", 200, update_type
+    if len(results) == 1:
+        body, status = next(iter(failures.values()))
+        return body, status, update_type
+
+    body = "\n".join(f"{channel_id}: {failures[channel_id][0] if channel_id in failures else results[channel_id]}"
+                     for channel_id in results)
+    status = 400 if len(failures) == len(results) and all(status == 400 for _, status in failures.values()) else 200
+    return body, status, update_type
+
+
+def should_park(result) -> bool:
+    """
+    Check if a webhook failed because Slack is degraded, or the users list could not be loaded from it yet, so it
+    should be sent again once Slack recovers.
+
+    :param result: result of a channel, or the error that ended the webhook
+    :return: bool
+    """
+    return isinstance(result, (CircuitOpenError, UsersNotLoadedError)) or is_degraded(result)
+
+
+def park(data: Dict, channel_name: str, update_type: str, event_uuid: Optional[str] = None) -> Tuple[str, int, str]:
+    spool.append(channel_name, data, event_uuid)
+    spool.ensure_workers()
+    if update_type == 'parked':
+        metrics.WEBHOOKS_PARKED.inc()
+    return "", 202, update_type
+
+
+def describe(error: BaseException) -> Tuple[str, int]:
+    """
+    The response for a webhook that could not be sent to Slack. Unexpected errors are raised again.
+
+    :param error: BaseException: error of the webhook or of one of its channels
+    :return: Response body and status code
+    """
+    if isinstance(error, SlackApiError):
+        return f"Failed to send message due to {error.response['error']}", 200
+    if isinstance(error, ValueError):
+        return "Failed to send message due to a ValueError. Please check the logs", 400
+    if isinstance(error, idempotency.InProgressError):
+        return "The webhook is being handled by another worker, try again later", 409
+    raise error
@@ -0,0 +1,67 @@
+"""
+ASGI entry point, served by uvicorn:
+
+    $ uvicorn asgi:app --host 0.0.0.0 --port 80 --workers 4
+
+Every worker runs a single event loop that handles all webhooks concurrently and shares the Slack client, its
+connections and the caches between them. Webhooks are handled natively on that loop, the other routes are passed to
+the Flask app.
+"""
+import asyncio
+from typing import Dict
+from asgiref.wsgi import WsgiToAsgi
+from app import config, create_app, ingest, metrics, routing, runtime, socket_mode, spool, webhooks
+
+flask_app = WsgiToAsgi(create_app(config))
+
+
+async def read_body(receive, max_size: int) -> bytes:
+    body = bytearray()
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > max_size:
+            raise ingest.BodyTooLarge(f"Webhook body larger than {max_size} bytes")
+        if not message.get('more_body'):
+            return bytes(body)
+
+
+async def respond(send, status: int, body: str, headers: Dict[str, str]) -> None:
+    response_headers = [(b'content-type', b'text/html; charset=utf-8')]
+    response_headers += [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+    await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+    await send({'type': 'http.response.body', 'body': body.encode()})
+
+
+async def send_message(scope, receive, send) -> None:
+    """
+    The send_message function is the ASGI version of the /mr/notify endpoint, see webhooks.handle.
+    """
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    status, body, response_headers = await webhooks.handle(headers, scope['query_string'].decode(),
+                                                           lambda max_size: read_body(receive, max_size))
+    await respond(send, status, body, response_headers)
+
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            runtime.use_loop(asyncio.get_running_loop())
+            routing.install_reload_signal()
+            socket_mode.ensure_started()
+            if config.SPOOL_ENABLED:
+                spool.ensure_workers()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            metrics.registry.flush()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'].rstrip('/') == '/mr/notify':
+        return await send_message(scope, receive, send)
+    return await flask_app(scope, receive, send)
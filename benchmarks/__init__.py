@@ -0,0 +1,12 @@
+"""
+Benchmarks run offline: importing the app does not reach Slack, and dummy settings are used for anything not
+configured.
+"""
+import os
+
+os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-benchmark")
+os.environ.setdefault("SLACK_APP_TOKEN", "xapp-benchmark")
+os.environ.setdefault("TEAM_CHANNEL_MAPPING", '{"team": "C0000000001"}')
+os.environ.setdefault("SLACK_GITLAB_USER_MAPPING", '{}')
+os.environ.setdefault("GITLAB_GROUP_ID_MAPPING", '{}')
+os.environ.setdefault("STATE_DB_PATH", ":memory:")
@@ -0,0 +1,67 @@
+"""
+Per-event cost of rendering the thread start: dateutil dates against the current render with GitLab dates parsed by
+datetime.fromisoformat. Reports the whole render and the Last Update date on its own.
+
+    $ python -m benchmarks.bench_dates
+"""
+import timeit
+from dateutil import parser as date_parser
+import benchmarks
+from benchmarks import corpus
+from app import parser
+from app.context import EventContext
+from app.events import MergeRequestEvent
+from app.users import UserDirectory
+
+
+def legacy_date(ctx: EventContext) -> str:
+    return date_parser.parse(ctx.event.updated_at).strftime("%-d %b %H:%M")
+
+
+def legacy_blocks(ctx: EventContext, slack_id: str, open_text: str, status: str, date: str, assignees: str,
+                  reviewers: str) -> list:
+    event = ctx.event
+    return [
+        {"type": "section",
+         "text": {"type": "mrkdwn", "text": f"<@{slack_id}> {open_text} <{event.url}|!{event.iid}>: {event.title}"}},
+        {"type": "section", "text": {"type": "mrkdwn", "text": f"`{event.source_branch}` → `{event.target_branch}`"}},
+        {"type": "divider"},
+        {"type": "section",
+         "fields": [
+             {"type": "mrkdwn", "text": f"*Project:*\n<{event.project_url}|{event.project_name}>"},
+             {"type": "mrkdwn", "text": f"*Status:*\n{status}"},
+             {"type": "mrkdwn", "text": f"*Last Update:*\n{date}"},
+             {"type": "mrkdwn", "text": f"*Assignees:*\n{assignees}"},
+             {"type": "mrkdwn", "text": f"*Reviewers:*\n{reviewers}"},
+         ]}
+    ]
+
+
+def legacy_render(ctx: EventContext) -> list:
+    assignees = parser.parse_users_to_string(ctx, False, 'assignees')
+    reviewers = parser.parse_users_to_string(ctx, False, 'reviewers')
+    return legacy_blocks(ctx, 'U0000000001', "has created a new merge request:",
+                         parser.parse_new_msg_status(assignees, reviewers), legacy_date(ctx), assignees, reviewers)
+
+
+def measure(func) -> float:
+    return min(timeit.repeat(func, number=5000, repeat=5)) / 5000 * 1e6
+
+
+def main():
+    users = UserDirectory({'gitlab_dave': 'dave'})
+    users.load(corpus.workspace(200))
+    data = corpus.events()['open']
+    ctx = EventContext(data, users, MergeRequestEvent(data))
+    assert legacy_render(ctx) == parser.parse_request_to_nm_blocks(ctx, 'U0000000001', False)
+
+    for name, legacy, current in (
+            ('thread start', lambda: legacy_render(ctx),
+             lambda: parser.parse_request_to_nm_blocks(ctx, 'U0000000001', False)),
+            ('  last update', lambda: legacy_date(ctx), lambda: parser.parse_date(ctx))):
+        before, after = measure(legacy), measure(current)
+        print(f"{name:14} {before:8.2f} µs → {after:8.2f} µs   {(after - before) / before:+7.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Per-event CPU cost of reading the webhook payload and the thread start message: string-path walking with the
+previous reduce based deep_get against the compiled MergeRequestEvent and ThreadState models.
+
+    $ python -m benchmarks.bench_events
+"""
+import timeit
+from functools import reduce
+import benchmarks
+from benchmarks import corpus
+from app.events import MergeRequestEvent, ThreadState, EVENT_FIELDS, EVENT_PATHS, THREAD_FIELDS, THREAD_PATHS
+
+# Every field is read about twice per event on the hot path
+READS = 2
+
+
+def legacy_deep_get(dictionary, keys, default=''):
+    return reduce(lambda d, key: d.get(key, default) if isinstance(d, dict) else (d[int(key)] if isinstance(d, list)
+                                                                   else default), keys.split("."), dictionary)
+
+
+def legacy(data: dict, message: dict) -> None:
+    for _ in range(READS):
+        for _, path in EVENT_PATHS:
+            legacy_deep_get(data, path)
+        for _, path in THREAD_PATHS:
+            legacy_deep_get(message, path)
+
+
+def compiled(data: dict, message: dict) -> None:
+    event = MergeRequestEvent(data)
+    state = ThreadState(message)
+    for _ in range(READS):
+        for name, _ in EVENT_FIELDS:
+            getattr(event, name)
+        for name, _ in THREAD_FIELDS:
+            getattr(state, name)
+
+
+def measure(func, number: int, repeat: int = 5) -> float:
+    data, message = corpus.events()['update_reviewers'], corpus.thread_message()
+    return min(timeit.repeat(lambda: func(data, message), number=number, repeat=repeat)) / number
+
+
+def main():
+    number = 20000
+    before = measure(legacy, number)
+    after = measure(compiled, number)
+    print(f"string paths:   {before * 1e6:8.2f} µs/event")
+    print(f"compiled model: {after * 1e6:8.2f} µs/event")
+    print(f"saving:         {(1 - after / before) * 100:8.1f} %")
+
+
+if __name__ == "__main__":
+    main()
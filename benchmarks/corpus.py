@@ -0,0 +1,125 @@
+"""
+Realistic GitLab merge request webhooks, Slack thread start messages, channel histories and workspaces for the
+benchmarks.
+"""
+import copy
+
+MR_ID = 4242
+THREAD_TS = '1700000000.000100'
+DESCRIPTION = "Implements the thing.\n\n" + "- a change that needs a careful review\n" * 40
+
+
+def user(username: str, user_id: int) -> dict:
+    return {'id': user_id, 'name': username.capitalize(), 'username': username,
+            'avatar_url': f"https://gitlab.example.com/uploads/-/system/user/avatar/{user_id}/avatar.png",
+            'email': '[REDACTED]'}
+
+
+def payload(action: str = 'open', assignees=('bob',), reviewers=(), changes=None, oldrev=None,
+            target_branch: str = 'main') -> dict:
+    """
+    A merge request webhook as GitLab sends it, including the blocks the app does not read.
+    """
+    attributes = {
+        'id': MR_ID, 'iid': 17, 'title': 'Add the benchmark suite', 'description': DESCRIPTION,
+        'url': 'https://gitlab.example.com/team/project/-/merge_requests/17', 'action': action, 'state': 'opened',
+        'source_branch': 'feature/benchmarks', 'target_branch': target_branch, 'source_project_id': 12,
+        'target_project_id': 12, 'author_id': 1, 'merge_status': 'can_be_merged', 'draft': False,
+        'work_in_progress': False, 'created_at': '2024-01-01 09:00:00 UTC', 'updated_at': '2024-01-01 10:00:00 UTC',
+        'labels': [{'id': i, 'title': f"label-{i}", 'color': '#428BCA'} for i in range(5)],
+        'last_commit': {'id': 'da1560886d4f094c3e6c9ef40349f7d38b5d27d7', 'message': 'Add benchmarks',
+                        'url': 'https://gitlab.example.com/team/project/-/commit/da1560886d4f',
+                        'author': {'name': 'Alice', 'email': 'alice@example.com'}},
+        'source': {'name': 'project', 'web_url': 'https://gitlab.example.com/team/project'},
+        'target': {'name': 'project', 'web_url': 'https://gitlab.example.com/team/project'},
+    }
+    if oldrev:
+        attributes['oldrev'] = oldrev
+
+    data = {
+        'object_kind': 'merge_request', 'event_type': 'merge_request',
+        'user': user('alice', 1),
+        'project': {'id': 12, 'name': 'project', 'web_url': 'https://gitlab.example.com/team/project',
+                    'path_with_namespace': 'team/project', 'default_branch': 'main'},
+        'repository': {'name': 'project', 'url': 'git@gitlab.example.com:team/project.git',
+                       'homepage': 'https://gitlab.example.com/team/project'},
+        'object_attributes': attributes,
+        'labels': attributes['labels'],
+        'assignees': [user(name, 10 + i) for i, name in enumerate(assignees)],
+        'reviewers': [user(name, 20 + i) for i, name in enumerate(reviewers)],
+        'changes': changes or {},
+    }
+    return data
+
+
+def user_change(user_type: str, previous=(), current=()) -> dict:
+    return {user_type: {'previous': [user(name, 30 + i) for i, name in enumerate(previous)],
+                        'current': [user(name, 40 + i) for i, name in enumerate(current)]}}
+
+
+EVENTS = {
+    'open': payload('open'),
+    'update_assignees': payload('update', assignees=('bob', 'dave'),
+                                changes=user_change('assignees', ('bob',), ('bob', 'dave'))),
+    'update_reviewers': payload('update', reviewers=('carol',), changes=user_change('reviewers', (), ('carol',))),
+    'new_commit': payload('update', oldrev='5d1e4e1c9b1d3b0f0d8b6e0b1e2f3a4b5c6d7e8f'),
+    'target_change': payload('update', target_branch='release',
+                             changes={'target_branch': {'previous': 'main', 'current': 'release'}}),
+    'approved': payload('approved'),
+    'merge': payload('merge'),
+    'close': payload('close'),
+}
+
+
+def events() -> dict:
+    return copy.deepcopy(EVENTS)
+
+
+def thread_message(mr_id: int = MR_ID, ts: str = THREAD_TS) -> dict:
+    """
+    The thread start message of an MR, as conversations.history returns it.
+    """
+    fields = [{'type': 'mrkdwn', 'text': text, 'verbatim': False} for text in
+              ('*Project:*\n<https://gitlab.example.com/team/project|project>',
+               '*Status:*\n:technologist: assigned :technologist:', '*Last Update:*\n1 Jan 09:00',
+               '*Assignees:*\n<@U0000000002>', '*Reviewers:*\nNone')]
+    return {
+        'type': 'message', 'subtype': 'bot_message', 'ts': ts, 'bot_id': 'B0000000001', 'text': '',
+        'metadata': {'event_type': 'mr_created',
+                     'event_payload': {'mr_id': mr_id, 'target_branch': 'main', 'assignees': '<@U0000000002>',
+                                       'reviewers': 'None'}},
+        'blocks': [
+            {'type': 'section', 'block_id': 'a', 'text': {'type': 'mrkdwn', 'text': '<@U0000000001> has created a '
+                                                          'new merge request: <https://gitlab.example.com|!17>'}},
+            {'type': 'section', 'block_id': 'b', 'text': {'type': 'mrkdwn', 'text': '`feature/benchmarks` → `main`'}},
+            {'type': 'divider', 'block_id': 'c'},
+            {'type': 'section', 'block_id': 'd', 'fields': fields},
+        ],
+    }
+
+
+def history(size: int) -> list:
+    """
+    A channel history, newest first, where every fourth message is an MR thread start and the rest is chatter.
+    """
+    messages = []
+    for i in range(size):
+        ts = f"{1700000000 + size - i}.000100"
+        if i % 4 == 0:
+            messages.append(thread_message(mr_id=i, ts=ts))
+        else:
+            messages.append({'type': 'message', 'user': 'U0000000003', 'ts': ts, 'text': f"message {i}",
+                             'blocks': [{'type': 'rich_text', 'elements': []}]})
+    return messages
+
+
+def workspace(size: int) -> list:
+    """
+    A users.list of a Slack workspace, including the users of the corpus events.
+    """
+    members = [{'id': f"U{i:010d}", 'name': f"user{i}", 'deleted': False, 'real_name': f"User {i}",
+                'profile': {'display_name': f"User {i}", 'real_name': f"User {i}", 'email': f"user{i}@example.com"}}
+               for i in range(size)]
+    for i, name in enumerate(('alice', 'bob', 'carol', 'dave')):
+        members[size // 2 + i].update({'name': name, 'profile': {'display_name': name.capitalize()}})
+    return members
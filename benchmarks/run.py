@@ -0,0 +1,217 @@
+"""
+Micro-benchmarks of the hot paths: block rendering, thread lookup in large channel histories, Slack user lookups in
+large workspaces and Thread construction. The thread lookup of the history cache is timed next to the scan of
+parser.get_thread_start it replaced, over the same history. Results are saved as JSON, so runs of different commits
+can be compared.
+
+    $ python -m benchmarks.run --output before.json
+    $ python -m benchmarks.run --output after.json --compare before.json
+"""
+import argparse
+import copy
+import json
+import platform
+import subprocess
+import sys
+import time
+import timeit
+from typing import Callable, Dict
+import benchmarks
+from benchmarks import corpus
+from benchmarks.bench_events import legacy_deep_get
+from app import parser
+from app.context import EventContext
+from app.events import MergeRequestEvent
+from app.history import HistoryCache
+from app.models import Thread
+from app.users import UserDirectory
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    """
+    Register a benchmark. The decorated function prepares the inputs and returns the callable to time.
+    """
+    def register(setup: Callable[[], Callable[[], None]]):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def run_sync(coro):
+    """
+    Run a coroutine that completes without suspending, e.g. a cache hit, without an event loop.
+    """
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("Coroutine suspended")
+
+
+def directory(size: int = 200) -> UserDirectory:
+    users = UserDirectory({'gitlab_dave': 'dave'})
+    users.load(corpus.workspace(size))
+    return users
+
+
+def context(name: str, users: UserDirectory = None) -> EventContext:
+    data = corpus.events()[name]
+    return EventContext(data, users or directory(), MergeRequestEvent(data))
+
+
+@benchmark("render.nm_blocks")
+def bench_nm_blocks():
+    ctx = context('open')
+    return lambda: parser.parse_request_to_nm_blocks(ctx, 'U0000000001', False)
+
+
+@benchmark("render.nm_metadata")
+def bench_nm_metadata():
+    ctx = context('open')
+    return lambda: parser.parse_request_to_nm_metadata(ctx)
+
+
+@benchmark("render.um_blocks")
+def bench_um_blocks():
+    ctx = context('update_assignees')
+    assignee_list = ['<@U0000000002>', 'None', '<@U0000000002>,<@U0000000003>', 'None']
+    return lambda: parser.parse_request_to_um_blocks(ctx, 'alice', 'assignee_change', assignee_list)
+
+
+@benchmark("decode.event")
+def bench_decode_event():
+    data = corpus.events()['update_reviewers']
+    return lambda: MergeRequestEvent(data)
+
+
+def thread_benchmark(name: str):
+    ctx = context(name)
+    message = corpus.thread_message()
+    # The history cache hands out a copy of the thread start, which Thread then updates
+    return lambda: Thread(copy.deepcopy(message), ctx)
+
+
+for event_name in corpus.EVENTS:
+    if event_name != 'open':
+        benchmark(f"thread.{event_name}")(lambda event_name=event_name: thread_benchmark(event_name))
+
+
+def history_cache(size: int) -> HistoryCache:
+    messages = corpus.history(size)
+
+    async def fetch(channel, **kwargs):
+        return {'ok': True, 'messages': messages, 'has_more': False}
+
+    return HistoryCache(fetch, max_channels=10, max_threads=size, max_pages=1)
+
+
+@benchmark("history.ingest_1000")
+def bench_history_ingest():
+    cache = history_cache(1000)
+    return lambda: (cache.clear(), run_sync(cache.find_thread('C1', -1)))
+
+
+@benchmark("history.find_thread_1000")
+def bench_history_find():
+    cache = history_cache(1000)
+    run_sync(cache.find_thread('C1', -1))
+    return lambda: run_sync(cache.find_thread('C1', 996))
+
+
+def legacy_thread_start(mr_id: int, history: list):
+    """
+    The thread lookup the history cache replaced: parser.get_thread_start, a scan of the history with string paths.
+    """
+    for message in history:
+        if (legacy_deep_get(message, "metadata.event_type") == 'mr_created'
+                and legacy_deep_get(message, "metadata.event_payload.mr_id") == mr_id):
+            return message
+    return None
+
+
+@benchmark("history.legacy_scan_1000")
+def bench_history_legacy_scan():
+    messages = corpus.history(1000)
+    return lambda: legacy_thread_start(996, messages)
+
+
+@benchmark("users.load_10k")
+def bench_users_load():
+    members = corpus.workspace(10000)
+    users = UserDirectory({'gitlab_dave': 'dave'})
+    return lambda: users.load(members)
+
+
+@benchmark("users.lookup_10k")
+def bench_users_lookup():
+    ctx = EventContext({}, directory(10000), None)
+    return lambda: (parser.parse_username_to_slack_id(ctx, 'carol'),
+                    parser.parse_username_to_slack_id(ctx, 'gitlab_dave'),
+                    parser.parse_username_to_slack_id(ctx, 'nobody'))
+
+
+def measure(func: Callable[[], None], repeat: int) -> Dict[str, float]:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {'min_us': min(times) * 1e6, 'mean_us': sum(times) / len(times) * 1e6, 'number': number}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> bool:
+    """
+    Print the change against a baseline run.
+
+    :return: bool: whether any benchmark got slower than the threshold
+    """
+    regressed = False
+    print(f"\n{'benchmark':32} {'baseline µs':>12} {'current µs':>12} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['min_us'], result['min_us']
+        change = after / before - 1
+        flag = ''
+        if change > threshold:
+            regressed = True
+            flag = '  REGRESSION'
+        print(f"{name:32} {before:12.2f} {after:12.2f} {change * 100:+7.1f}%{flag}")
+    return regressed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="mergeminion benchmarks")
+    arg_parser.add_argument('--output', default='bench_results.json', help="file to save the results to")
+    arg_parser.add_argument('--compare', help="results file of a previous run to compare against")
+    arg_parser.add_argument('--threshold', type=float, default=0.1, help="relative slowdown that is a regression")
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--filter', default='', help="only run benchmarks whose name contains this")
+    args = arg_parser.parse_args()
+
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if args.filter in name:
+            results[name] = measure(setup(), args.repeat)
+            print(f"{name:32} {results[name]['min_us']:12.2f} µs")
+
+    with open(args.output, 'w') as f:
+        json.dump({'commit': git_commit(), 'python': platform.python_version(), 'time': time.time(),
+                   'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
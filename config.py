@@ -7,12 +7,52 @@ class Config:
     SLACK_BOT_TOKEN = os.environ.get("SLACK_BOT_TOKEN")
     SLACK_APP_TOKEN = os.environ.get("SLACK_APP_TOKEN")
     SLACK_SIGNING_SECRET = os.environ.get("SLACK_SIGNING_SECRET")
-    TEAM_CHANNEL_MAPPING = eval(os.environ.get("TEAM_CHANNEL_MAPPING"))
+    SLACK_API_URL = os.environ.get("SLACK_API_URL", "https://slack.com/api/")
+    SLACK_MAX_RETRIES = int(os.environ.get("SLACK_MAX_RETRIES", 5))
+    SLACK_BREAKER_FAILURES = int(os.environ.get("SLACK_BREAKER_FAILURES", 5))
+    SLACK_BREAKER_SLOW_CALL = float(os.environ.get("SLACK_BREAKER_SLOW_CALL", 10))
+    SLACK_BREAKER_COOLDOWN = float(os.environ.get("SLACK_BREAKER_COOLDOWN", 30))
+    ROUTING_FILE = os.environ.get("ROUTING_FILE", "")
+    TEAM_CHANNEL_MAPPING = os.environ.get("TEAM_CHANNEL_MAPPING", "")
+    DIGEST_MAPPING = os.environ.get("DIGEST_MAPPING", "")
+    DIGEST_INTERVAL = float(os.environ.get("DIGEST_INTERVAL", 900))
     GITLAB_WEBHOOK_TOKEN = os.environ.get("GITLAB_WEBHOOK_TOKEN")
-    SLACK_GITLAB_USER_MAPPING = eval(os.environ.get("SLACK_GITLAB_USER_MAPPING"))
+    SLACK_GITLAB_USER_MAPPING = os.environ.get("SLACK_GITLAB_USER_MAPPING", "")
     EXCLUDE_DRAFT = os.environ.get("EXCLUDE_DRAFT")
     NOTIFY_WHEN_MR_READY = os.environ.get("NOTIFY_WHEN_MR_READY")
     BOT_URL = os.environ.get("BOT_WEBHOOK_URL")
     BOT_NAME = os.environ.get("BOT_NAME")
-    GITLAB_GROUP_ID_MAPPING = eval(os.environ.get("GITLAB_GROUP_ID_MAPPING"))
+    GITLAB_GROUP_ID_MAPPING = os.environ.get("GITLAB_GROUP_ID_MAPPING", "")
     ACCESS_GITLAB = os.environ.get("ACCESS_GITLAB")
+    HISTORY_MAX_CHANNELS = int(os.environ.get("HISTORY_MAX_CHANNELS", 10))
+    HISTORY_MAX_THREADS = int(os.environ.get("HISTORY_MAX_THREADS", 500))
+    HISTORY_MAX_PAGES = int(os.environ.get("HISTORY_MAX_PAGES", 10))
+    MR_COALESCE_WINDOW = float(os.environ.get("MR_COALESCE_WINDOW", 1.0))
+    SPOOL_ENABLED = os.environ.get("SPOOL_ENABLED", "0") == "1"
+    SPOOL_WORKERS = int(os.environ.get("SPOOL_WORKERS", 4))
+    SPOOL_MAX_ATTEMPTS = int(os.environ.get("SPOOL_MAX_ATTEMPTS", 8))
+    SPOOL_BACKOFF = float(os.environ.get("SPOOL_BACKOFF", 2))
+    SPOOL_MAX_BACKOFF = float(os.environ.get("SPOOL_MAX_BACKOFF", 300))
+    SPOOL_LEASE = float(os.environ.get("SPOOL_LEASE", 120))
+    SPOOL_POLL_INTERVAL = float(os.environ.get("SPOOL_POLL_INTERVAL", 1))
+    BACKLOG_MAX_SIZE = int(os.environ.get("BACKLOG_MAX_SIZE", 10000))
+    METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 1))
+    METRICS_GAUGE_TTL = float(os.environ.get("METRICS_GAUGE_TTL", 60))
+    STATE_DB_PATH = os.environ.get("STATE_DB_PATH", os.path.join(basedir, "mergeminion.db"))
+    THREAD_INDEX_TTL = float(os.environ.get("THREAD_INDEX_TTL", 2592000))
+    SOCKET_MODE_LOCK_PATH = os.environ.get("SOCKET_MODE_LOCK_PATH", os.path.join(basedir, "socket_mode.lock"))
+    SOCKET_MODE_ELECTION_INTERVAL = float(os.environ.get("SOCKET_MODE_ELECTION_INTERVAL", 10))
+    USERS_WAIT_TIMEOUT = float(os.environ.get("USERS_WAIT_TIMEOUT", 30))
+    WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "0") == "1"
+    WARMUP_CONCURRENCY = int(os.environ.get("WARMUP_CONCURRENCY", 4))
+    WARMUP_MAX_PAGES = int(os.environ.get("WARMUP_MAX_PAGES", 0))
+    IDEMPOTENCY_TTL = float(os.environ.get("IDEMPOTENCY_TTL", 86400))
+    IDEMPOTENCY_LEASE = float(os.environ.get("IDEMPOTENCY_LEASE", 300))
+    MAX_BODY_SIZE = int(os.environ.get("MAX_BODY_SIZE", 1048576))
+    TRACE_EXPORT = os.environ.get("TRACE_EXPORT", "")
+    SLOW_REQUEST_THRESHOLD = float(os.environ.get("SLOW_REQUEST_THRESHOLD", 5))
+    REPLICA_URL = os.environ.get("REPLICA_URL", "")
+    REPLICAS = os.environ.get("REPLICAS", "")
+    REPLICAS_FILE = os.environ.get("REPLICAS_FILE", "")
+    SHARD_REDIRECT = os.environ.get("SHARD_REDIRECT", "0") == "1"
+    SHARD_FORWARD_TIMEOUT = float(os.environ.get("SHARD_FORWARD_TIMEOUT", 10))
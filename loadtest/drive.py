@@ -0,0 +1,181 @@
+"""
+Load test of /mr/notify: sends generated GitLab merge request event streams at a target rate and reports the latency
+percentiles and error rate per action, and the Slack calls per webhook counted by the fake Slack API.
+
+    $ python -m loadtest.fake_slack --port 8900 --channel-rate 0 --latency 0.05 --rate-limit-ratio 0.01
+    $ SLACK_API_URL=http://localhost:8900/api/ uvicorn asgi:app --port 8000 --workers 2
+    $ python -m loadtest.drive --url http://localhost:8000 --rate 2 --duration 60 --team-count 100
+
+with the teams team0 to team99 in TEAM_CHANNEL_MAPPING of the app, see the README.
+
+Every MR is opened, gets an assignee, a reviewer and a new commit, is approved and merged. The events of an MR are
+sent one after the other, like GitLab does, and new MRs are opened to keep up the rate.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+import aiohttp
+from benchmarks import corpus
+
+STREAM = ('open', 'assignee', 'reviewer', 'new_commit', 'approved', 'merge')
+_updated = itertools.count()
+
+
+def event(kind: str, mr_id: int, author: str, assignee: str, reviewer: str) -> dict:
+    """
+    The webhook of one step of an MR stream.
+    """
+    if kind == 'assignee':
+        data = corpus.payload('update', assignees=(assignee,), changes=corpus.user_change('assignees', (), (assignee,)))
+    elif kind == 'reviewer':
+        data = corpus.payload('update', assignees=(assignee,), reviewers=(reviewer,),
+                              changes=corpus.user_change('reviewers', (), (reviewer,)))
+    elif kind == 'new_commit':
+        data = corpus.payload('update', assignees=(assignee,), reviewers=(reviewer,), oldrev=f"{mr_id:040x}")
+    else:
+        data = corpus.payload(kind, assignees=() if kind == 'open' else (assignee,),
+                              reviewers=() if kind == 'open' else (reviewer,))
+
+    attributes = data['object_attributes']
+    attributes.update({'id': mr_id, 'iid': mr_id, 'url': f"https://gitlab.example.com/team/project/-/merge_requests/"
+                                                         f"{mr_id}",
+                       'updated_at': time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime(next(_updated)))})
+    data['user'] = corpus.user(author, 1)
+    return data
+
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)] if values else 0
+
+
+class Stream:
+    """
+    The events of one MR, sent one at a time.
+    """
+
+    def __init__(self, mr_id: int, team: str, users: int):
+        author, assignee, reviewer = (f"user{random.randrange(users)}" for _ in range(3))
+        self.team = team
+        self.events = [(kind, event(kind, mr_id, author, assignee, reviewer)) for kind in STREAM]
+        self.busy = False
+
+
+async def get_stats(session: aiohttp.ClientSession, slack: Optional[str]) -> Dict:
+    if not slack:
+        return {}
+    async with session.get(f"{slack.rstrip('/')}/stats") as response:
+        return await response.json()
+
+
+async def drive(url: str, slack: Optional[str], rate: float, duration: float, teams: List[str], users: int,
+                token: Optional[str]) -> Dict:
+    """
+    Send webhooks at the target rate for the duration and collect the result of every webhook.
+
+    :return: Latencies and errors per action, the Slack calls made and the achieved rate
+    """
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    headers = {'X-Gitlab-Event': 'Merge Request Hook', **({'X-Gitlab-Token': token} if token else {})}
+    mr_ids = itertools.count(1000000 + random.randrange(1000000) * 100)
+    streams = []
+    tasks = set()
+
+    async def send(session: aiohttp.ClientSession, stream: Stream) -> None:
+        kind, data = stream.events.pop(0)
+        start = time.perf_counter()
+        try:
+            async with session.post(f"{url.rstrip('/')}/mr/notify", params={'channel': stream.team}, json=data,
+                                    headers=headers) as response:
+                body = await response.text()
+                if response.status >= 400 or body:
+                    errors[kind] += 1
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            errors[kind] += 1
+        latencies[kind].append(time.perf_counter() - start)
+        stream.busy = False
+
+    connector = aiohttp.TCPConnector(limit=0, force_close=True)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=300)) as session:
+        before = await get_stats(session, slack)
+        start = time.perf_counter()
+        sent = 0
+        while time.perf_counter() - start < duration:
+            streams = [stream for stream in streams if stream.events]
+            stream = next((stream for stream in streams if not stream.busy), None)
+            if stream is None:
+                stream = Stream(next(mr_ids), random.choice(teams), users)
+                streams.append(stream)
+            stream.busy = True
+            task = asyncio.ensure_future(send(session, stream))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            sent += 1
+            await asyncio.sleep(max(0, start + sent / rate - time.perf_counter()))
+        sending = time.perf_counter() - start
+        if tasks:
+            await asyncio.wait(tasks)
+        # Let the coalesced Slack calls of the last events go out
+        await asyncio.sleep(2)
+        after = await get_stats(session, slack)
+
+    calls = {method: count - before.get('calls', {}).get(method, 0)
+             for method, count in after.get('calls', {}).items()}
+    rate_limited = sum(after.get('rate_limited', {}).values()) - sum(before.get('rate_limited', {}).values())
+    return {'latencies': latencies, 'errors': errors, 'sent': sent, 'rate': sent / sending, 'calls': calls,
+            'rate_limited': rate_limited}
+
+
+def report(result: Dict) -> Dict:
+    rows = {}
+    for kind in list(STREAM) + ['all']:
+        values = (list(itertools.chain(*result['latencies'].values())) if kind == 'all'
+                  else result['latencies'].get(kind, []))
+        error_count = sum(result['errors'].values()) if kind == 'all' else result['errors'].get(kind, 0)
+        if values:
+            rows[kind] = {'events': len(values), 'errors': error_count, 'error_rate': error_count / len(values),
+                          **{f"p{p}_ms": percentile(values, p) * 1000 for p in (50, 95, 99)}}
+
+    print(f"{result['sent']} webhooks at {result['rate']:.1f}/s")
+    print(f"{'action':12} {'events':>7} {'errors':>7} {'error %':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for kind, row in rows.items():
+        print(f"{kind:12} {row['events']:7} {row['errors']:7} {row['error_rate'] * 100:7.1f}% {row['p50_ms']:9.1f} "
+              f"{row['p95_ms']:9.1f} {row['p99_ms']:9.1f}")
+    if result['calls']:
+        print("Slack calls per webhook: " + ", ".join(f"{method} {count / result['sent']:.2f}"
+                                                   for method, count in sorted(result['calls'].items()) if count))
+        print(f"Slack 429s: {result['rate_limited']}")
+    return {'actions': rows, 'rate': result['rate'], 'slack_calls': result['calls'],
+            'slack_rate_limited': result['rate_limited']}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Load test /mr/notify")
+    arg_parser.add_argument('--url', default='http://localhost:80', help="app URL")
+    arg_parser.add_argument('--slack', default='http://localhost:8900', help="fake Slack URL, for the call counts")
+    arg_parser.add_argument('--rate', type=float, default=20, help="webhooks per second")
+    arg_parser.add_argument('--duration', type=float, default=30, help="seconds to send webhooks for")
+    arg_parser.add_argument('--teams', nargs='+', default=['team0'], help="team names from TEAM_CHANNEL_MAPPING")
+    arg_parser.add_argument('--team-count', type=int, help="send to the teams team0 to teamN-1 instead of --teams")
+    arg_parser.add_argument('--users', type=int, default=100, help="users in the fake Slack workspace")
+    arg_parser.add_argument('--token', help="GITLAB_WEBHOOK_TOKEN of the app")
+    arg_parser.add_argument('--output', help="file to save the report to as JSON")
+    args = arg_parser.parse_args()
+
+    teams = [f"team{i}" for i in range(args.team_count)] if args.team_count else args.teams
+    result = asyncio.run(drive(args.url, args.slack, args.rate, args.duration, teams, args.users, args.token))
+    summary = report(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
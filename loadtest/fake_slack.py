@@ -0,0 +1,148 @@
+"""
+Local fake of the Slack Web API methods mergeminion uses. Point the app at it with
+SLACK_API_URL=http://localhost:8900/api/ to run it without a Slack workspace. GET /stats returns the number of calls
+per method and of injected 429s, which loadtest.drive uses to count the Slack calls per webhook.
+
+    $ python -m loadtest.fake_slack --port 8900 --channel-rate 1 --rate-limit-ratio 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from aiohttp import web
+
+
+class FakeSlack:
+    def __init__(self, users: int, channel_rate: float, rate_limit_ratio: float, retry_after: int,
+                 latency: float = 0, jitter: float = 0):
+        """
+        :param users: int: number of users in the fake workspace
+        :param channel_rate: float: chat.postMessage calls per second per channel before answering 429, 0 disables
+        :param rate_limit_ratio: float: share of calls answered with 429 at random
+        :param retry_after: int: Retry-After of injected 429s in seconds
+        :param latency: float: seconds every call takes
+        :param jitter: float: seconds added to the latency at random, up to
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.channel_rate = channel_rate
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.messages = defaultdict(list)
+        self.last_post = {}
+        self.counter = 0
+        self.calls = defaultdict(int)
+        self.rate_limited_calls = defaultdict(int)
+        self.users = [{'id': f"U{i:06d}", 'name': f"user{i}", 'deleted': False,
+                       'profile': {'display_name': f"User {i}"}} for i in range(users)]
+
+    def next_ts(self) -> str:
+        self.counter += 1
+        return f"{time.time():.0f}.{self.counter:06d}"
+
+    def rate_limited(self, method: str, channel: str) -> bool:
+        if random.random() < self.rate_limit_ratio:
+            return True
+        if method == 'chat.postMessage' and self.channel_rate:
+            now = time.monotonic()
+            if now - self.last_post.get(channel, 0) < 1 / self.channel_rate:
+                return True
+            self.last_post[channel] = now
+        return False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        args = dict(request.query)
+        if request.content_type == 'application/json':
+            # apps.connections.open and auth.test are sent without a body
+            args.update(load(await request.text() or '{}'))
+        elif request.can_read_body:
+            args.update(await request.post())
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.random() * self.jitter)
+
+        self.calls[method] += 1
+        if self.rate_limited(method, args.get('channel')):
+            self.rate_limited_calls[method] += 1
+            return web.json_response({'ok': False, 'error': 'ratelimited'}, status=429,
+                                     headers={'Retry-After': str(self.retry_after)})
+
+        handler = getattr(self, method.replace('.', '_'), None)
+        if handler is None:
+            return web.json_response({'ok': False, 'error': 'unknown_method'})
+        return web.json_response(handler(args))
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({'calls': self.calls, 'rate_limited': self.rate_limited_calls})
+
+    def auth_test(self, args: dict) -> dict:
+        return {'ok': True, 'user_id': 'UBOT', 'bot_id': 'BBOT', 'team_id': 'T1'}
+
+    def chat_postMessage(self, args: dict) -> dict:
+        message = {'type': 'message', 'ts': self.next_ts(), 'text': args.get('text', ''),
+                   'blocks': load(args.get('blocks')), 'metadata': load(args.get('metadata'))}
+        if args.get('thread_ts'):
+            message['thread_ts'] = args['thread_ts']
+        else:
+            self.messages[args['channel']].insert(0, message)
+        return {'ok': True, 'channel': args['channel'], 'ts': message['ts'], 'message': message}
+
+    def chat_update(self, args: dict) -> dict:
+        for message in self.messages[args['channel']]:
+            if message['ts'] == args['ts']:
+                message['blocks'] = load(args.get('blocks'))
+                message['metadata'] = load(args.get('metadata'))
+                return {'ok': True, 'channel': args['channel'], 'ts': args['ts']}
+        return {'ok': False, 'error': 'message_not_found'}
+
+    def conversations_history(self, args: dict) -> dict:
+        oldest = float(args.get('oldest') or 0)
+        latest = float(args.get('latest') or 'inf')
+        inclusive = args.get('inclusive') in (True, 'true', '1', 1)
+        messages = [m for m in self.messages[args['channel']]
+                    if (oldest <= float(m['ts']) <= latest if inclusive else oldest < float(m['ts']) < latest)]
+        return page(messages, args, 'messages')
+
+    def users_list(self, args: dict) -> dict:
+        return page(self.users, args, 'members')
+
+
+def load(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def page(items: list, args: dict, key: str) -> dict:
+    start = int(args.get('cursor') or 0)
+    limit = int(args.get('limit') or 100)
+    more = start + limit < len(items)
+    return {'ok': True, key: items[start:start + limit], 'has_more': more,
+            'response_metadata': {'next_cursor': str(start + limit) if more else ''}}
+
+
+def create_app(fake: FakeSlack) -> web.Application:
+    app = web.Application()
+    app.router.add_route('*', '/api/{method}', fake.handle)
+    app.router.add_get('/stats', fake.stats)
+    return app
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Fake Slack Web API")
+    arg_parser.add_argument('--port', type=int, default=8900)
+    arg_parser.add_argument('--users', type=int, default=100)
+    arg_parser.add_argument('--channel-rate', type=float, default=1)
+    arg_parser.add_argument('--rate-limit-ratio', type=float, default=0)
+    arg_parser.add_argument('--retry-after', type=int, default=1)
+    arg_parser.add_argument('--latency', type=float, default=0, help="seconds every call takes")
+    arg_parser.add_argument('--jitter', type=float, default=0, help="seconds added to the latency at random, up to")
+    args = arg_parser.parse_args()
+
+    fake = FakeSlack(args.users, args.channel_rate, args.rate_limit_ratio, args.retry_after, args.latency, args.jitter)
+    web.run_app(create_app(fake), port=args.port)
+
+
+if __name__ == "__main__":
+    main()
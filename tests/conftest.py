@@ -0,0 +1,90 @@
+"""
+Tests run offline against a state database of their own; the benchmark corpus provides the webhooks and Slack
+messages, and dummy settings are used for anything not configured.
+"""
+import asyncio
+import os
+import tempfile
+import pytest
+
+os.environ.setdefault("STATE_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="mergeminion-tests-"), "state.db"))
+
+from benchmarks import corpus  # noqa: E402  (also sets the dummy Slack settings)
+from app import store  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def state_db():
+    """
+    Empty the tables of the state database before every test.
+    """
+    conn = store.get_connection()
+    tables = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+    for (table,) in tables.fetchall():
+        conn.execute(f"DELETE FROM {table}")
+    return conn
+
+
+class FakeSlack:
+    """
+    The Slack Web API calls of the app, recorded in memory. Calls to the channels in fail raise that error, every call
+    takes delay seconds.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.messages = {}
+        self.fail = {}
+        self.ts = 1700000000
+        self.delay = 0
+
+    async def call(self, method: str, channel: str, **kwargs) -> dict:
+        self.calls.append((method, channel))
+        await asyncio.sleep(self.delay)
+        if channel in self.fail:
+            raise self.fail[channel]
+        self.ts += 1
+        return {'ok': True, 'ts': f"{self.ts}.000100", 'channel': channel}
+
+    async def chat_postMessage(self, channel: str, **kwargs) -> dict:
+        response = await self.call('chat.postMessage', channel)
+        if 'thread_ts' not in kwargs:
+            self.messages.setdefault(channel, []).insert(0, {'ts': response['ts'], 'blocks': kwargs.get('blocks'),
+                                                             'metadata': kwargs.get('metadata')})
+        return response
+
+    async def chat_update(self, channel: str, **kwargs) -> dict:
+        return await self.call('chat.update', channel)
+
+    async def conversations_history(self, channel: str, **kwargs) -> dict:
+        await self.call('conversations.history', channel)
+        return {'ok': True, 'messages': list(self.messages.get(channel, [])), 'has_more': False}
+
+    def sent(self, method: str) -> list:
+        return [channel for called, channel in self.calls if called == method]
+
+
+@pytest.fixture
+def slack(monkeypatch):
+    """
+    Send the Slack calls of the handlers to a FakeSlack, with the users list of the corpus published.
+    """
+    from app import handlers, user_store
+    from app.users import UserDirectory
+
+    fake = FakeSlack()
+    monkeypatch.setattr(handlers, 'client', fake)
+    monkeypatch.setattr(handlers, 'user_directory', UserDirectory())
+    handlers.history_cache.clear()
+    user_store.publish(corpus.workspace(20), loaded=True)
+    return fake
+
+
+@pytest.fixture
+def channels(monkeypatch):
+    """
+    Route the team of the webhooks to the channels C1 and C2.
+    """
+    from app import routing
+
+    monkeypatch.setattr(routing, '_routing', routing.compile_routing({'team': ['C1', 'C2']}, {}, {}, {}))
@@ -0,0 +1,73 @@
+import aiohttp
+import pytest
+from app import breaker
+from app.breaker import CircuitBreaker, CircuitOpenError, CLOSED, HALF_OPEN, OPEN
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(breaker.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def fail(circuit: CircuitBreaker) -> None:
+    circuit.before_call()
+    circuit.record(0.1, aiohttp.ClientConnectionError("Connection reset by peer"))
+
+
+def test_breaker_opens_after_failures_in_a_row(clock):
+    circuit = CircuitBreaker(failure_threshold=3, slow_call=5, cooldown=30)
+    fail(circuit)
+    fail(circuit)
+    circuit.before_call()
+    circuit.record(0.1)
+    fail(circuit)
+    fail(circuit)
+    assert circuit.state == CLOSED
+
+    fail(circuit)
+    assert circuit.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        circuit.before_call()
+    assert not circuit.is_available()
+
+
+def test_slow_calls_count_as_failures(clock):
+    circuit = CircuitBreaker(failure_threshold=2, slow_call=5, cooldown=30)
+    for _ in range(2):
+        circuit.before_call()
+        circuit.record(6)
+    assert circuit.state == OPEN
+
+
+def test_probe_after_cooldown_closes_or_opens_the_breaker(clock):
+    circuit = CircuitBreaker(failure_threshold=1, slow_call=5, cooldown=30)
+    fail(circuit)
+    clock[0] += 30
+    assert circuit.is_available()
+
+    # One call probes Slack, the others still fail right away
+    circuit.before_call()
+    assert circuit.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        circuit.before_call()
+    circuit.record(0.1, aiohttp.ClientConnectionError("Connection reset by peer"))
+    assert circuit.state == OPEN
+    assert circuit.trips == 2
+
+    clock[0] += 30
+    circuit.before_call()
+    circuit.record(0.1)
+    assert circuit.state == CLOSED
+    circuit.before_call()
+
+
+def test_cancelled_probe_lets_another_call_probe(clock):
+    circuit = CircuitBreaker(failure_threshold=1, slow_call=5, cooldown=30)
+    fail(circuit)
+    clock[0] += 30
+    circuit.before_call()
+    circuit.cancel()
+    circuit.before_call()
+    assert circuit.state == HALF_OPEN
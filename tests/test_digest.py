@@ -0,0 +1,45 @@
+import asyncio
+import copy
+import pytest
+from benchmarks import corpus
+from app import digest, thread_index
+from app.templates import NEW_MR
+import app.handlers as handlers
+
+ENTRY = {'title': 'Benchmarks', 'url': 'https://gitlab.example.com', 'lines': ['New commit']}
+
+
+@pytest.fixture
+def root(slack, monkeypatch):
+    monkeypatch.setattr(digest, 'client', slack)
+    message = corpus.thread_message()
+    thread_index.save_thread_message('C1', message)
+    return message
+
+
+def test_digest_waits_for_the_lock_of_the_mr(slack, root):
+    async def run():
+        async with handlers.mr_queue.acquire('C1', corpus.MR_ID):
+            flush = asyncio.ensure_future(digest.flush_channel(handlers.mr_queue, 'C1', [ENTRY], [root['ts']]))
+            await asyncio.sleep(0.01)
+            assert slack.sent('chat.update') == []
+        await flush
+
+    asyncio.run(run())
+    assert slack.sent('chat.update') == ['C1']
+    assert slack.sent('chat.postMessage') == ['C1']
+
+
+def test_digest_leaves_a_pending_batch_to_update_the_root(slack, root):
+    latest = copy.deepcopy(root)
+    NEW_MR.set(latest['blocks'], 'reviewers', '<@U0000000003>')
+
+    async def run():
+        async with handlers.mr_queue.acquire('C1', corpus.MR_ID):
+            done = handlers.mr_queue.submit('C1', corpus.MR_ID, root=latest)
+        await digest.flush_channel(handlers.mr_queue, 'C1', [ENTRY], [root['ts']])
+        assert slack.sent('chat.update') == []
+        await done
+
+    asyncio.run(run())
+    assert slack.sent('chat.update') == ['C1']
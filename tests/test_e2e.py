@@ -0,0 +1,67 @@
+"""
+The webhooks of an MR handled end to end, through the Slack client of the app and real HTTP, against the fake Slack
+Web API of the load test.
+"""
+import asyncio
+import pytest
+from aiohttp import web
+from slack_sdk.web.async_client import AsyncWebClient
+from benchmarks import corpus
+from loadtest.fake_slack import FakeSlack, create_app
+from app import digest, metrics, routing, runtime, user_store
+from app.slack_scheduler import SlackScheduler
+from app.templates import NEW_MR
+from app.users import UserDirectory
+import app.handlers as handlers
+
+
+@pytest.fixture
+def fake_slack(monkeypatch):
+    fake = FakeSlack(users=0, channel_rate=0, rate_limit_ratio=0, retry_after=0)
+    fake.users = corpus.workspace(20)
+    monkeypatch.setattr(routing, '_routing', routing.compile_routing({'team': ['C1']}, {}, {}, {}))
+    monkeypatch.setattr(handlers, 'user_directory', UserDirectory())
+    monkeypatch.setattr(handlers.mr_queue, 'window', 0.01)
+    monkeypatch.setattr(runtime, '_loop', None)
+    handlers.history_cache.clear()
+    return fake
+
+
+async def serve(fake: FakeSlack, monkeypatch) -> web.AppRunner:
+    runner = web.AppRunner(create_app(fake))
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    client = SlackScheduler(metrics.InstrumentedClient(AsyncWebClient(token='xoxb-test',
+                                                                      base_url=f"http://127.0.0.1:{port}/api/")),
+                            max_retries=2)
+    monkeypatch.setattr(handlers, 'client', client)
+    monkeypatch.setattr(digest, 'client', client)
+    return runner
+
+
+def test_thread_of_an_mr_is_started_updated_and_merged(fake_slack, monkeypatch, state_db):
+    events = corpus.events()
+
+    async def run():
+        runtime.use_loop(asyncio.get_running_loop())
+        runner = await serve(fake_slack, monkeypatch)
+        try:
+            user_store.publish(await handlers.get_users_list(), loaded=True)
+            results = [await handlers.handle_mr_notify(events[name], 'team', f"uuid-{name}")
+                       for name in ('open', 'update_assignees', 'merge')]
+            results.append(await handlers.handle_mr_notify(events['merge'], 'team', 'uuid-merge'))
+            return results
+        finally:
+            await runner.cleanup()
+
+    results = asyncio.run(run())
+    assert results == [{'C1': 'new'}, {'C1': 'assignee_change'}, {'C1': ''}, {'C1': 'duplicate'}]
+    assert fake_slack.calls['chat.postMessage'] == 3
+    assert fake_slack.calls['chat.update'] == 2
+
+    [root] = fake_slack.messages['C1']
+    assert root['metadata']['event_payload']['mr_id'] == corpus.MR_ID
+    assert 'merged' in NEW_MR.get(root['blocks'], 'status').lower()
+    assert state_db.execute("SELECT ts, closed IS NOT NULL FROM thread_index").fetchall() == [(root['ts'], 1)]
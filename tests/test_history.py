@@ -0,0 +1,53 @@
+import asyncio
+from slack_sdk.web.async_slack_response import AsyncSlackResponse
+from benchmarks import corpus
+from app.history import PAGE_SIZE, HistoryCache
+
+
+class FakeChannel:
+    """
+    conversations.history of one channel, newest first, answered with real Slack responses.
+    """
+
+    def __init__(self, messages: list):
+        self.messages = messages
+        self.calls = 0
+
+    async def fetch(self, channel: str, oldest=None, latest=None, inclusive=False, limit=PAGE_SIZE, cursor=None):
+        self.calls += 1
+        selected = [m for m in self.messages
+                    if (oldest is None or float(m['ts']) > float(oldest) or inclusive and m['ts'] == oldest)
+                    and (latest is None or float(m['ts']) < float(latest) or inclusive and m['ts'] == latest)]
+        start = int(cursor or 0)
+        has_more = start + limit < len(selected)
+        data = {'ok': True, 'messages': selected[start:start + limit], 'has_more': has_more,
+                'response_metadata': {'next_cursor': str(start + limit) if has_more else ''}}
+        return AsyncSlackResponse(client=None, http_verb='POST', api_url='conversations.history', req_args={},
+                                  data=data, headers={}, status_code=200)
+
+
+def test_find_thread_pages_with_the_cursor_of_slack_responses():
+    channel = FakeChannel(corpus.history(4 * PAGE_SIZE))
+    cache = HistoryCache(channel.fetch, max_channels=1, max_threads=1000, max_pages=10)
+    history = cache.get_channel('C1')
+    history.newest_ts = channel.messages[-1]['ts']
+
+    asyncio.run(cache.fetch_newer('C1', history))
+
+    assert channel.calls == 4
+    assert len(history.threads) == PAGE_SIZE
+
+
+def test_fetch_newer_does_not_skip_messages_beyond_max_pages():
+    channel = FakeChannel(corpus.history(4 * PAGE_SIZE))
+    cache = HistoryCache(channel.fetch, max_channels=1, max_threads=1000, max_pages=2)
+    channel.messages, older = channel.messages[:PAGE_SIZE * 3], channel.messages[PAGE_SIZE * 3:]
+    history = cache.get_channel('C1')
+    for message in older:
+        history.add(message)
+
+    # The thread of MR 200 is on the third page of the new messages, one page past max_pages
+    thread = asyncio.run(cache.find_thread('C1', 200))
+
+    assert thread is not None and thread['metadata']['event_payload']['mr_id'] == 200
+    assert history.newest_ts == channel.messages[0]['ts']
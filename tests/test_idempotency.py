@@ -0,0 +1,109 @@
+import asyncio
+import multiprocessing
+import time
+import pytest
+from slack_sdk.errors import SlackApiError
+from benchmarks import corpus
+from app import idempotency, spool
+import app.handlers as handlers
+
+
+def test_event_key_prefers_the_event_uuid():
+    data = corpus.events()['open']
+    assert idempotency.event_key('C1', data, 'b3c1a7e0-uuid') == 'C1:b3c1a7e0-uuid'
+    assert idempotency.event_key('C1', data) == idempotency.event_key('C1', corpus.events()['open'])
+    assert idempotency.event_key('C1', data) != idempotency.event_key('C2', data)
+    assert idempotency.event_key('C1', data) != idempotency.event_key('C1', corpus.events()['merge'])
+
+
+def test_claim_drops_a_second_delivery_once_done():
+    assert idempotency.claim('C1:a')
+    with pytest.raises(idempotency.InProgressError):
+        idempotency.claim('C1:a')
+    idempotency.done('C1:a')
+    assert not idempotency.claim('C1:a')
+
+
+def test_released_claim_is_claimed_again():
+    assert idempotency.claim('C1:a')
+    idempotency.release('C1:a')
+    assert idempotency.claim('C1:a')
+
+
+def test_claim_of_a_worker_is_taken_over_after_the_lease(state_db):
+    assert idempotency.claim('C1:a')
+    lease = idempotency.config.IDEMPOTENCY_LEASE
+    state_db.execute("UPDATE webhook_events SET claimed_at = claimed_at - ?", (lease + 1,))
+    assert idempotency.claim('C1:a')
+    with pytest.raises(idempotency.InProgressError):
+        idempotency.claim('C1:a')
+
+
+def test_claims_expire_after_the_ttl(monkeypatch, state_db):
+    assert idempotency.claim('C1:a')
+    state_db.execute("UPDATE webhook_events SET received = received - ?", (idempotency.config.IDEMPOTENCY_TTL + 1,))
+    assert idempotency.claim('C1:b')
+    assert state_db.execute("SELECT key FROM webhook_events").fetchall() == [('C1:b',)]
+    assert idempotency.claim('C1:a')
+
+
+def test_claims_are_off_without_a_ttl(monkeypatch):
+    monkeypatch.setattr(idempotency.config, 'IDEMPOTENCY_TTL', 0)
+    assert idempotency.claim('C1:a') and idempotency.claim('C1:a')
+
+
+def test_failed_channel_is_released_for_the_retry(slack, channels):
+    slack.fail['C2'] = SlackApiError("channel_not_found", {'ok': False, 'error': 'channel_not_found'})
+    data = corpus.events()['open']
+
+    first = asyncio.run(handlers.handle_mr_notify(data, 'team', 'b3c1a7e0-uuid'))
+    del slack.fail['C2']
+    retry = asyncio.run(handlers.handle_mr_notify(data, 'team', 'b3c1a7e0-uuid'))
+
+    assert first['C1'] == 'new' and isinstance(first['C2'], SlackApiError)
+    assert retry == {'C1': 'duplicate', 'C2': 'new'}
+
+
+def test_cancelled_delivery_is_released(slack, channels):
+    async def cancelled():
+        task = asyncio.create_task(handlers.handle_mr_notify(corpus.events()['open'], 'team', 'b3c1a7e0-uuid'))
+        while not slack.calls:
+            await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    slack.delay = 1
+    asyncio.run(cancelled())
+    assert idempotency.claim('C1:b3c1a7e0-uuid') and idempotency.claim('C2:b3c1a7e0-uuid')
+
+
+def test_job_of_a_killed_worker_is_replayed(slack, channels, monkeypatch, state_db):
+    job_id = spool.append('team', corpus.events()['open'], 'b3c1a7e0-uuid')
+
+    def handle():
+        slack.delay = 60
+        asyncio.run(spool.process(spool.claim('killed')))
+
+    worker = multiprocessing.get_context('fork').Process(target=handle)
+    worker.start()
+    deadline = time.time() + 10
+    while state_db.execute("SELECT COUNT(*) FROM webhook_events WHERE state = 'in_progress'").fetchone()[0] < 2:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    worker.kill()
+    worker.join()
+
+    # Another worker sees the delivery in progress until the leases of the job and of its claim run out
+    assert spool.claim('other') is None
+    results = asyncio.run(handlers.handle_mr_notify(corpus.events()['open'], 'team', 'b3c1a7e0-uuid'))
+    assert all(isinstance(result, idempotency.InProgressError) for result in results.values())
+    monkeypatch.setattr(spool.config, 'SPOOL_LEASE', 0)
+    monkeypatch.setattr(idempotency.config, 'IDEMPOTENCY_LEASE', 0)
+    time.sleep(0.01)
+    job = spool.claim('other')
+    asyncio.run(spool.process(job))
+
+    assert job.id == job_id and spool.size() == 0
+    assert sorted(slack.sent('chat.postMessage')) == ['C1', 'C2']
+    assert state_db.execute("SELECT state FROM webhook_events").fetchall() == [('done',), ('done',)]
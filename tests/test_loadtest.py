@@ -0,0 +1,72 @@
+"""
+Smoke check of the load test commands of the README: the fake Slack API, the app under uvicorn pointed at it, and a
+short drive, run as separate processes the way they are documented. The drive stays at 1 webhook per second, within
+the capacity the chat.update rate limit leaves; it checks the responses, not the latency.
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 20) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+@pytest.fixture
+def processes():
+    started = []
+    yield started
+    for process in started:
+        process.terminate()
+    for process in started:
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def test_documented_load_test_gets_a_response_to_every_webhook(processes, tmp_path):
+    slack_port, app_port = free_port(), free_port()
+    env = dict(os.environ, SLACK_BOT_TOKEN='xoxb-local', SLACK_APP_TOKEN='xapp-local', SLACK_SIGNING_SECRET='local',
+               STATE_DB_PATH=str(tmp_path / 'state.db'), SOCKET_MODE_LOCK_PATH=str(tmp_path / 'socket_mode.lock'),
+               TEAM_CHANNEL_MAPPING=json.dumps({f"team{i}": f"C{i:010d}" for i in range(4)}),
+               SLACK_API_URL=f"http://localhost:{slack_port}/api/")
+    run = dict(cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    processes.append(subprocess.Popen([sys.executable, '-m', 'loadtest.fake_slack', '--port', str(slack_port),
+                                       '--channel-rate', '0', '--latency', '0.05'], **run))
+    processes.append(subprocess.Popen([sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(app_port),
+                                       '--workers', '2'], **run))
+    wait_for(f"http://localhost:{slack_port}/stats")
+    wait_for(f"http://localhost:{app_port}/health/live")
+
+    subprocess.run([sys.executable, '-m', 'loadtest.drive', '--url', f"http://localhost:{app_port}",
+                    '--slack', f"http://localhost:{slack_port}", '--rate', '1', '--duration', '6',
+                    '--team-count', '4', '--output', str(tmp_path / 'load.json')], check=True, timeout=120, **run)
+
+    with open(tmp_path / 'load.json') as f:
+        report = json.load(f)
+    assert report['actions']['all']['events'] == 6
+    assert report['actions']['all']['errors'] == 0
+    assert report['slack_calls']['chat.postMessage'] > 0
@@ -0,0 +1,36 @@
+from benchmarks import corpus
+from app.context import EventContext
+from app.events import MergeRequestEvent
+from app.models import Thread, visible_state
+from app.templates import NEW_MR
+from app.users import UserDirectory
+
+
+def context(data: dict) -> EventContext:
+    users = UserDirectory({})
+    users.load(corpus.workspace(20))
+    return EventContext(data, users, MergeRequestEvent(data))
+
+
+def test_visible_state_ignores_last_update():
+    message = corpus.thread_message()
+    previous = visible_state(message)
+    NEW_MR.set(message['blocks'], 'last_update', "2 Jan 11:00")
+    assert visible_state(message) == previous
+
+
+def test_visible_state_sees_metadata_changed_in_place():
+    message = corpus.thread_message()
+    previous = visible_state(message)
+    message['metadata']['event_payload']['target_branch'] = 'release'
+    assert visible_state(message) != previous
+
+
+def test_thread_update_changes_visible_state():
+    message = corpus.thread_message()
+    previous = visible_state(message)
+    thread = Thread(message, context(corpus.events()['target_change']))
+    root = {'blocks': thread.blocks, 'metadata': thread.metadata}
+    assert thread.get_update_type() == 'target_change'
+    assert previous[1]['event_payload']['target_branch'] == 'main'
+    assert visible_state(root)[1]['event_payload']['target_branch'] == 'release'
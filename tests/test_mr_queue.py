@@ -0,0 +1,74 @@
+import asyncio
+from app.mr_queue import MergeRequestQueue
+
+
+def root(status: str) -> dict:
+    return {'ts': '1700000000.000100', 'blocks': [status], 'metadata': {}, 'text': ''}
+
+
+def test_events_in_the_window_are_sent_as_one_batch():
+    flushed = []
+
+    async def flush(batch):
+        flushed.append((batch.root['blocks'], batch.replies))
+
+    async def event(queue, status, reply):
+        async with queue.acquire('C1', 1):
+            done = queue.submit('C1', 1, root=root(status), reply=reply)
+        await done
+
+    async def run():
+        queue = MergeRequestQueue(flush, window=0.02)
+        await asyncio.gather(event(queue, 'assigned', ['a']), event(queue, 'reviewed', None),
+                             event(queue, 'approved', ['b', 'c']))
+        assert not queue.batches
+        assert not queue.locks
+
+    asyncio.run(run())
+    assert flushed == [(['approved'], ['a', 'b', 'c'])]
+
+
+def test_events_of_an_mr_hold_the_lock_in_arrival_order():
+    order = []
+
+    async def event(queue, name):
+        async with queue.acquire('C1', 1):
+            order.append(name)
+            await asyncio.sleep(0.01)
+            assert queue.get_pending_root('C1', 1) is None
+
+    async def run():
+        queue = MergeRequestQueue(None, window=0)
+        await asyncio.gather(*(event(queue, name) for name in 'abc'))
+
+    asyncio.run(run())
+    assert order == ['a', 'b', 'c']
+
+
+def test_pending_root_is_a_copy():
+    async def run():
+        async def flush(batch):
+            pass
+
+        queue = MergeRequestQueue(flush, window=0.01)
+        async with queue.acquire('C1', 1):
+            done = queue.submit('C1', 1, root=root('assigned'))
+            queue.get_pending_root('C1', 1)['blocks'].append('changed')
+            assert queue.get_pending_root('C1', 1) == root('assigned')
+        await done
+
+    asyncio.run(run())
+
+
+def test_failed_flush_fails_every_event_of_the_batch():
+    async def flush(batch):
+        raise RuntimeError("Slack failed")
+
+    async def run():
+        queue = MergeRequestQueue(flush, window=0.01)
+        async with queue.acquire('C1', 1):
+            first = queue.submit('C1', 1, root=root('assigned'))
+            second = queue.submit('C1', 1, root=root('reviewed'))
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+    assert [type(result) for result in asyncio.run(run())] == [RuntimeError, RuntimeError]
@@ -0,0 +1,11 @@
+from app import config, create_app, socket_mode, spool
+
+
+def test_spool_workers_start_with_the_first_request(monkeypatch):
+    started = []
+    monkeypatch.setattr(socket_mode, 'ensure_started', lambda: None)
+    monkeypatch.setattr(spool, 'ensure_workers', lambda: started.append(True))
+    monkeypatch.setattr(config, 'SPOOL_ENABLED', True)
+
+    assert create_app(config).test_client().get('/health/live').status_code == 200
+    assert started
@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+from app import parser, routing, sharding
+
+REPLICAS = ('http://replica1', 'http://replica2', 'http://replica3')
+
+
+@pytest.fixture
+def replicas(monkeypatch):
+    teams = {f"team{i}": f"C{i:04d}" for i in range(20)}
+    teams['shared'] = ['C0000', 'C0001']
+    monkeypatch.setattr(routing, '_routing', routing.compile_routing(teams, {}, {}, {}))
+    monkeypatch.setattr(sharding.config, 'REPLICAS', ','.join(REPLICAS))
+    monkeypatch.setattr(sharding.config, 'REPLICA_URL', REPLICAS[0])
+    return sharding.get_ring()
+
+
+def owner_of(ring: sharding.Ring, channel_id: str):
+    owner = ring.get(channel_id)
+    return None if owner == REPLICAS[0] else owner
+
+
+def test_ring_spreads_keys_over_all_replicas():
+    ring = sharding.Ring(REPLICAS)
+    owners = [ring.get(f"C{i:04d}") for i in range(3000)]
+    assert {owner: owners.count(owner) > 600 for owner in REPLICAS} == dict.fromkeys(REPLICAS, True)
+
+
+def test_ring_only_moves_keys_of_a_removed_replica():
+    before, after = sharding.Ring(REPLICAS), sharding.Ring(REPLICAS[:2])
+    for i in range(1000):
+        owner = before.get(f"C{i:04d}")
+        assert owner == REPLICAS[2] or after.get(f"C{i:04d}") == owner
+
+
+def test_empty_ring_has_no_owner():
+    assert sharding.Ring(()).get('C0000') is None
+
+
+def test_split_owns_channels_whatever_the_team_names(replicas):
+    assert sharding.split('team3') == {owner_of(replicas, 'C0003'): 'team3'}
+    assert sharding.split('team3,team3') == {owner_of(replicas, 'C0003'): 'team3,team3'}
+    channels = [parser.get_channel_ids(name) for name in sharding.split('shared').values()]
+    assert sorted(channels) == sorted(parser.get_channel_ids(name) for name in sharding.split('team1,team0').values())
+
+
+def test_split_sends_every_replica_its_channel_ids(replicas):
+    names = ','.join(f"team{i}" for i in range(20))
+    parts = sharding.split(names)
+    assert len(parts) == 3
+    channels = {}
+    for owner, name in parts.items():
+        for channel_id in parser.get_channel_ids(name):
+            channels[channel_id] = owner
+    assert channels == {f"C{i:04d}": owner_of(replicas, f"C{i:04d}") for i in range(20)}
+    assert sharding.split(names, forwarded_by=REPLICAS[1]) == {None: names}
+
+
+def test_channel_ids_of_unknown_channels_are_ignored(replicas):
+    assert parser.get_channel_ids(f"{parser.CHANNEL_ID_PREFIX}C0001,{parser.CHANNEL_ID_PREFIX}C9999") == ['C0001']
+
+
+def test_forward_all_handles_unreachable_parts_here(monkeypatch):
+    async def forward(owner, query_string, headers, body):
+        return None if owner == REPLICAS[2] else ("", 202)
+
+    monkeypatch.setattr(sharding, 'forward', forward)
+    parts = {None: '#C0001', REPLICAS[1]: '#C0002', REPLICAS[2]: '#C0003'}
+    assert asyncio.run(sharding.forward_all(parts, 'channel=a', {}, b'{}')) == ('#C0001,#C0003', ("", 202))
+
+
+def test_only_webhooks_of_one_other_replica_are_redirected(replicas, monkeypatch):
+    monkeypatch.setattr(sharding.config, 'SHARD_REDIRECT', True)
+    assert sharding.redirect_url({REPLICAS[1]: 'team1'}, 'channel=team1') == f"{REPLICAS[1]}/mr/notify?channel=team1"
+    assert sharding.redirect_url({None: 'team1'}, 'channel=team1') is None
+    assert sharding.redirect_url({None: '#C0001', REPLICAS[1]: '#C0002'}, 'channel=team1,team2') is None
+    monkeypatch.setattr(sharding.config, 'SHARD_REDIRECT', False)
+    assert sharding.redirect_url({REPLICAS[1]: 'team1'}, 'channel=team1') is None
@@ -0,0 +1,101 @@
+import asyncio
+import aiohttp
+import pytest
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_slack_response import AsyncSlackResponse
+from app.breaker import CircuitBreaker, OPEN
+from app.slack_scheduler import SlackScheduler, TokenBucket
+
+
+def response(status_code: int, data: dict, headers: dict = None) -> AsyncSlackResponse:
+    return AsyncSlackResponse(client=None, http_verb='POST', api_url='chat.postMessage', req_args={}, data=data,
+                              headers=headers or {}, status_code=status_code)
+
+
+class FakeClient:
+    """
+    chat.postMessage answering the queued outcomes in order, then ok.
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def chat_postMessage(self, channel: str, **kwargs):
+        self.calls += 1
+        if self.outcomes:
+            raise self.outcomes.pop(0)
+        return response(200, {'ok': True, 'channel': channel})
+
+
+def rate_limited(retry_after: str) -> SlackApiError:
+    return SlackApiError("ratelimited", response(429, {'ok': False, 'error': 'ratelimited'},
+                                                 {'Retry-After': retry_after}))
+
+
+def test_bucket_allows_the_burst_then_one_request_per_interval():
+    bucket = TokenBucket(rate=1, burst=3)
+    assert [bucket.reserve(10) for _ in range(3)] == [0, 0, 0]
+    assert bucket.reserve(10) == pytest.approx(1)
+    assert bucket.reserve(10) == pytest.approx(2)
+    # Tokens that were not used come back over time
+    assert bucket.reserve(20) == 0
+
+
+def test_bucket_pause_holds_back_the_next_request():
+    bucket = TokenBucket(rate=1, burst=3)
+    bucket.pause(10, 5)
+    assert bucket.reserve(10) == pytest.approx(5)
+
+
+def test_rate_limited_call_is_retried_after_retry_after():
+    client = FakeClient(rate_limited('0.05'))
+    scheduler = SlackScheduler(client, max_retries=2)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = await scheduler.chat_postMessage(channel='C1', text='')
+        return result, loop.time() - start
+
+    result, duration = asyncio.run(run())
+    assert result['ok'] is True
+    assert client.calls == 2
+    assert duration >= 0.05
+
+
+def test_rate_limited_call_gives_up_after_max_retries():
+    client = FakeClient(rate_limited('0'), rate_limited('0'))
+    scheduler = SlackScheduler(client, max_retries=1)
+    with pytest.raises(SlackApiError):
+        asyncio.run(scheduler.chat_postMessage(channel='C1', text=''))
+    assert client.calls == 2
+
+
+def test_channels_have_buckets_of_their_own():
+    scheduler = SlackScheduler(FakeClient(), max_retries=0)
+    first = scheduler.get_buckets('chat_postMessage', 'C1')
+    assert scheduler.get_buckets('chat_postMessage', 'C1') == first
+    assert scheduler.get_buckets('chat_postMessage', 'C2') != first
+    assert scheduler.get_buckets('chat_update', 'C1') == scheduler.get_buckets('chat_update', 'C2')
+
+
+def test_failed_calls_open_the_breaker():
+    circuit = CircuitBreaker(failure_threshold=1, slow_call=5, cooldown=30)
+    client = FakeClient(aiohttp.ClientConnectionError("Connection reset by peer"))
+    scheduler = SlackScheduler(client, max_retries=2, breaker=circuit)
+    with pytest.raises(aiohttp.ClientConnectionError):
+        asyncio.run(scheduler.chat_postMessage(channel='C1', text=''))
+    assert circuit.state == OPEN
+    assert client.calls == 1
+
+
+def test_shared_buckets_are_shared_by_all_workers():
+    workers = [SlackScheduler(FakeClient(), max_retries=0, shared=True) for _ in range(2)]
+    buckets = [worker.get_buckets('chat_update', None) for worker in workers]
+
+    # Tier 3 allows a burst of 5, whichever worker takes it
+    waits = [max(workers[i % 2].update(buckets[i % 2], TokenBucket.reserve)) for i in range(6)]
+    assert waits[:5] == [0] * 5
+    assert waits[5] > 1
+    assert workers[0].get_buckets('chat_postMessage', 'C1')[0].key == 'chat_postMessage:C1'
@@ -0,0 +1,72 @@
+import copy
+import sqlite3
+import time
+import pytest
+from benchmarks import corpus
+from app import spool, store
+
+
+def test_job_keeps_the_event_uuid():
+    spool.append('team', corpus.events()['open'], 'b3c1a7e0-uuid')
+    spool.append('team', corpus.events()['merge'])
+
+    first = spool.claim('worker')
+    spool.complete(first)
+    second = spool.claim('worker')
+
+    assert (first.event_uuid, second.event_uuid) == ('b3c1a7e0-uuid', None)
+
+
+def test_event_uuid_column_is_added_to_an_existing_spool(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'old.db', isolation_level=None)
+    conn.execute("CREATE TABLE spool (id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, mr_id INTEGER, "
+                 "payload TEXT NOT NULL, state TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+                 "next_attempt REAL NOT NULL, locked_by TEXT, locked_at REAL, error TEXT)")
+    conn.execute("CREATE TABLE webhook_events (key TEXT PRIMARY KEY, received REAL NOT NULL)")
+    conn.execute("CREATE TABLE thread_index (channel TEXT NOT NULL, mr_id INTEGER NOT NULL, ts TEXT NOT NULL, "
+                 "PRIMARY KEY (channel, mr_id))")
+
+    store.add_columns(conn)
+    store.add_columns(conn)
+
+    assert 'event_uuid' in {row[1] for row in conn.execute("PRAGMA table_info(spool)")}
+
+
+def test_events_of_an_mr_are_claimed_in_order():
+    first = spool.append('team', corpus.events()['open'])
+    spool.append('team', corpus.events()['update_assignees'])
+    data = copy.deepcopy(corpus.events()['open'])
+    data['object_attributes']['id'] += 1
+    other = spool.append('team', data)
+
+    assert spool.claim('worker').id == first
+    # The next event of the MR waits for the first one, another MR does not
+    assert spool.claim('worker').id == other
+    assert spool.claim('worker') is None
+
+
+def test_claim_of_a_dead_worker_is_handed_out_after_the_lease(monkeypatch):
+    job_id = spool.append('team', corpus.events()['open'])
+    assert spool.claim('dead-worker').id == job_id
+    assert spool.claim('worker') is None
+
+    monkeypatch.setattr(spool.config, 'SPOOL_LEASE', -1)
+    assert spool.claim('worker').id == job_id
+
+
+def test_retry_backs_off_and_gives_up(monkeypatch, state_db):
+    monkeypatch.setattr(spool.config, 'SPOOL_MAX_ATTEMPTS', 2)
+    monkeypatch.setattr(spool.config, 'SPOOL_BACKOFF', 30)
+    spool.append('team', corpus.events()['open'])
+
+    job = spool.claim('worker')
+    spool.retry(job, ValueError("Slack failed"))
+    state, attempts, next_attempt = state_db.execute("SELECT state, attempts, next_attempt FROM spool").fetchone()
+    assert (state, attempts) == ('pending', 1)
+    assert next_attempt - time.time() == pytest.approx(30, abs=1)
+    assert spool.claim('worker') is None
+
+    job.attempts = 1
+    spool.retry(job, ValueError("Slack failed"))
+    assert state_db.execute("SELECT state, attempts FROM spool").fetchone() == ('dead', 2)
+    assert spool.size() == 0
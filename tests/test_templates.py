@@ -0,0 +1,39 @@
+import copy
+from benchmarks import corpus
+from app import parser
+from app.context import EventContext
+from app.events import MergeRequestEvent
+from app.templates import NEW_MR
+from app.users import UserDirectory
+
+
+def thread_start() -> tuple:
+    users = UserDirectory({})
+    users.load(corpus.workspace(20))
+    data = corpus.events()['open']
+    ctx = EventContext(data, users, MergeRequestEvent(data))
+    return ctx, parser.parse_request_to_nm_blocks(ctx, 'U0000000001', False)
+
+
+def test_slots_match_the_blocks_of_the_parser():
+    ctx, blocks = thread_start()
+    event = ctx.event
+    assert NEW_MR.get(blocks, 'title') == (f"<@U0000000001> has created a new merge request: "
+                                           f"<{event.url}|!{event.iid}>: {event.title}")
+    assert NEW_MR.get(blocks, 'branches') == NEW_MR.slots['branches'].fill((event.source_branch, event.target_branch))
+    assert NEW_MR.get(blocks, 'project') == f"*Project:*\n<{event.project_url}|{event.project_name}>"
+    assert NEW_MR.get(blocks, 'last_update') == NEW_MR.slots['last_update'].fill(parser.parse_date(ctx))
+
+
+def test_set_fills_the_slot_and_reports_a_change():
+    _, blocks = thread_start()
+    original = copy.deepcopy(blocks)
+    assert NEW_MR.set(blocks, 'status', ":white_check_mark: Merged")
+    assert blocks[3]['fields'][1]['text'] == "*Status:*\n:white_check_mark: Merged"
+    assert not NEW_MR.set(blocks, 'status', ":white_check_mark: Merged")
+    blocks[3]['fields'][1] = original[3]['fields'][1]
+    assert blocks == original
+
+
+def test_path_points_at_the_slot_for_compile_path():
+    assert NEW_MR.path('reviewers') == 'blocks.3.fields.4.text'
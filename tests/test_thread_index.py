@@ -0,0 +1,31 @@
+from app import thread_index
+
+
+def save(channel: str, mr_id: int, ts: str) -> None:
+    thread_index.save_thread_ts(channel, mr_id, ts)
+    thread_index.save_thread_message(channel, {'ts': ts, 'blocks': [], 'metadata': {}})
+
+
+def test_threads_of_closed_mrs_are_pruned_after_the_ttl(state_db):
+    save('C1', 1, '1.1')
+    save('C1', 2, '1.2')
+    save('C1', 3, '1.3')
+    thread_index.set_closed('C1', 1, True)
+    thread_index.set_closed('C1', 2, True)
+    thread_index.set_closed('C1', 2, False)
+    ttl = thread_index.config.THREAD_INDEX_TTL
+    state_db.execute("UPDATE thread_index SET closed = closed - ? WHERE closed IS NOT NULL", (ttl + 1,))
+
+    thread_index.set_closed('C1', 3, True)
+
+    assert thread_index.get_thread_ts('C1', 1) is None and thread_index.get_thread_message('C1', '1.1') is None
+    assert thread_index.get_thread_ts('C1', 2) == '1.2' and thread_index.get_thread_message('C1', '1.2')
+    assert thread_index.get_thread_ts('C1', 3) == '1.3' and thread_index.get_thread_message('C1', '1.3')
+
+
+def test_replaced_thread_drops_the_state_of_the_old_one():
+    save('C1', 1, '1.1')
+    save('C1', 1, '1.2')
+
+    assert thread_index.get_thread_message('C1', '1.1') is None
+    assert thread_index.get_thread_message('C1', '1.2') == {'ts': '1.2', 'blocks': [], 'metadata': {}}
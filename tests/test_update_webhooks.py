@@ -0,0 +1,61 @@
+import json
+import threading
+import requests
+import update_webhooks
+
+
+class FakeSession:
+    def __init__(self, hooks: list, status: int):
+        self.hooks = hooks
+        self.status = status
+
+    def response(self, status: int, body: str = '[]') -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        response._content = body.encode()
+        return response
+
+    def get(self, url: str):
+        return self.response(200, json.dumps(self.hooks))
+
+    def post(self, url: str, data: dict):
+        return self.response(self.status, '{"message": "url is blocked"}' if self.status >= 400 else '{}')
+
+    put = post
+
+
+def provision(monkeypatch, hooks: list, status: int):
+    monkeypatch.setattr(update_webhooks, 'get_session', lambda: FakeSession(hooks, status))
+    monkeypatch.setattr(update_webhooks.config, 'BOT_NAME', 'mergeminion')
+    project = {'id': 1, 'path_with_namespace': 'team/project'}
+    return update_webhooks.provision('https://gitlab.example.com/api/v4', project,
+                                     'https://mergeminion.example.com/mr/notify?channel=team', 'token', False, False)
+
+
+def test_provision_reports_added_hook(monkeypatch):
+    lines, ok = provision(monkeypatch, [], 201)
+    assert ok
+    assert lines == ["+ team/project (1) add hook: url: None -> https://mergeminion.example.com/mr/notify?channel=team "
+                     "[201]"]
+
+
+def test_provision_reports_rejected_hook_as_failed(monkeypatch):
+    hooks = [{'id': 7, 'url': 'https://mergeminion.example.com/old', 'merge_requests_events': True,
+              'push_events': False}]
+    lines, ok = provision(monkeypatch, hooks, 422)
+    assert not ok
+    assert lines[0].startswith("! team/project (1) edit hook 7: url: ")
+    assert lines[0].endswith('[422 {"message": "url is blocked"}]')
+
+
+def test_get_session_is_per_thread(monkeypatch):
+    monkeypatch.setattr(update_webhooks, '_local', threading.local())
+    monkeypatch.setattr(update_webhooks, 'get_gitlab_session', lambda pool_size: (object(), ''))
+    sessions = []
+    workers = [threading.Thread(target=lambda: sessions.extend([update_webhooks.get_session()] * 2))
+               for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert sessions[0] is sessions[1] and sessions[2] is sessions[3] and sessions[0] is not sessions[2]
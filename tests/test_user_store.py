@@ -0,0 +1,33 @@
+import asyncio
+from benchmarks import corpus
+from app import user_store
+import app.handlers as handlers
+
+
+def test_changes_are_picked_up_by_sequence_number():
+    members = corpus.workspace(8)
+    user_store.publish(members, loaded=True)
+    seq, users = user_store.changes(0)
+    assert (seq, [user['id'] for user in users]) == (8, [member['id'] for member in members])
+    assert user_store.changes(seq) == (8, [])
+
+    renamed = dict(members[1], name='renamed')
+    user_store.publish([renamed])
+    assert user_store.changes(seq) == (9, [user_store.compact(renamed)])
+    assert user_store.is_loaded()
+
+
+def test_users_are_not_loaded_until_the_whole_list_is_published():
+    user_store.publish(corpus.workspace(8)[:1])
+    assert not user_store.is_loaded()
+
+
+def test_worker_applies_the_changes_since_it_last_looked(slack):
+    users = asyncio.run(handlers.get_user_directory())
+    assert users.lookup('carol') is not None
+    seq = users.seq
+
+    user_store.publish([{'id': 'U0000000099', 'name': 'erin', 'profile': {'display_name': 'Erin'}}])
+    users = asyncio.run(handlers.get_user_directory())
+    assert users.seq == seq + 1
+    assert users.lookup('erin') == 'U0000000099'
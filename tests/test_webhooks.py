@@ -0,0 +1,87 @@
+import asyncio
+import json
+import aiohttp
+import pytest
+from benchmarks import corpus
+from app import ingest, runtime, sharding, spool, webhooks
+import app.handlers as handlers
+
+
+@pytest.fixture(autouse=True)
+def no_workers(monkeypatch):
+    monkeypatch.setattr(spool, 'ensure_workers', lambda: None)
+
+
+def test_webhook_is_parked_while_users_are_not_loaded(monkeypatch, state_db):
+    monkeypatch.setattr(handlers.config, 'USERS_WAIT_TIMEOUT', 0)
+    monkeypatch.setattr(handlers.user_directory, 'loaded', False)
+
+    assert asyncio.run(webhooks.receive(corpus.events()['open'], 'team')) == ("", 202, 'parked')
+    assert state_db.execute("SELECT channel, state FROM spool").fetchall() == [('team', 'pending')]
+
+
+def test_partial_failure_is_replayed_only_to_the_failed_channels(slack, channels, state_db):
+    slack.fail['C2'] = aiohttp.ClientConnectionError("Connection reset by peer")
+
+    response = asyncio.run(webhooks.receive(corpus.events()['open'], 'team', 'b3c1a7e0-uuid'))
+    assert response == ("", 202, 'parked')
+    assert slack.sent('chat.postMessage') == ['C1', 'C2']
+
+    del slack.fail['C2']
+    job = spool.claim('worker')
+    assert job.event_uuid == 'b3c1a7e0-uuid'
+    asyncio.run(runtime.run(spool.process(job)))
+
+    assert slack.sent('chat.postMessage') == ['C1', 'C2', 'C2']
+    assert spool.size() == 0
+
+
+def request(body: bytes, **headers):
+    """
+    Arguments of webhooks.handle for a merge request hook to the team, with the given headers on top.
+    """
+    async def read_body(max_size: int) -> bytes:
+        return ingest.read([body], max_size)
+
+    headers = {'x-gitlab-event': ingest.MERGE_REQUEST_HOOK, 'content-length': str(len(body)), **headers}
+    return headers, 'channel=team', read_body
+
+
+def test_handle_rejects_other_hooks_and_large_bodies(monkeypatch):
+    monkeypatch.setattr(webhooks.config, 'GITLAB_WEBHOOK_TOKEN', 'secret')
+    body = json.dumps(corpus.events()['open']).encode()
+
+    assert asyncio.run(webhooks.handle(*request(body, **{'x-gitlab-token': 'wrong'})))[0] == 403
+    monkeypatch.setattr(webhooks.config, 'GITLAB_WEBHOOK_TOKEN', '')
+    assert asyncio.run(webhooks.handle(*request(body, **{'x-gitlab-event': 'Push Hook'})))[0] == 400
+    assert asyncio.run(webhooks.handle(*request(b'{"object_kind"')))[:2] == (400, "Invalid JSON")
+    monkeypatch.setattr(webhooks.config, 'MAX_BODY_SIZE', len(body) - 1)
+    assert asyncio.run(webhooks.handle(*request(body)))[0] == 413
+    assert asyncio.run(webhooks.handle(*request(body, **{'content-length': '0'})))[0] == 413
+
+
+def test_handle_sends_the_webhook_to_slack(slack):
+    body = json.dumps(corpus.events()['open']).encode()
+    assert asyncio.run(webhooks.handle(*request(body))) == (200, "", {})
+    assert len(slack.sent('chat.postMessage')) == 1
+
+
+def test_handle_redirects_to_the_owner_of_the_channels(monkeypatch):
+    monkeypatch.setattr(sharding, 'split', lambda channel_name, forwarded_by: {'http://replica2': channel_name})
+    monkeypatch.setattr(sharding.config, 'SHARD_REDIRECT', True)
+    body = json.dumps(corpus.events()['open']).encode()
+
+    assert asyncio.run(webhooks.handle(*request(body))) == (
+        307, "", {'Location': 'http://replica2/mr/notify?channel=team'})
+
+
+def test_handle_reports_a_failure_of_another_replica(slack, monkeypatch):
+    async def forward_all(parts, query_string, headers, body):
+        return 'team', ("Failed to send message due to channel_not_found", 500)
+
+    monkeypatch.setattr(sharding, 'split', lambda channel_name, forwarded_by: {None: 'team', 'http://replica2': '#C2'})
+    monkeypatch.setattr(sharding, 'forward_all', forward_all)
+    body = json.dumps(corpus.events()['open']).encode()
+
+    assert asyncio.run(webhooks.handle(*request(body))) == (500, "Failed to send message due to channel_not_found", {})
+    assert len(slack.sent('chat.postMessage')) == 1
@@ -1,56 +1,158 @@
-from util import get_gitlab, get_gitlab_requests, get_webhook_token
-from requests import Response
-from app import config
-
-
-def edit_hook(project, hook_id, url, token) -> Response:
-    if not config.ACCESS_GITLAB:
-        return Response()
-    data = {
-        "url": url,
-        "token": token,
-        "merge_requests_events": True,
-        "push_events": False
-    }
-    return get_gitlab_requests(type="PUT", path=f"/projects/{project.id}/hooks/{hook_id}", data=data)
-
-
-def add_hook(project, url, token) -> Response:
-    if not config.ACCESS_GITLAB:
-        return Response()
-    data = {
-        "url": url,
-        "token": token,
-        "merge_requests_events": True,
-        "push_events": False
-    }
-    return get_gitlab_requests(type="POST", path=f"/projects/{project.id}/hooks", data=data)
-
-
-def get_hooks(project):
-    return get_gitlab_requests(type="GET", path=f"/projects/{project.id}/hooks")
-
-
-def main():
-    gl = get_gitlab()
-    squad = config.GITLAB_GROUP_ID_MAPPING["group_name"]  # enter your gitlab group name
-    group = gl.groups.get(squad)
-    projects = group.projects.list(archived=False)
-    url = config.BOT_URL + squad.name.lower()
+"""
+Add or update the merge request webhook of the app in all projects of the groups in GITLAB_GROUP_ID_MAPPING,
+including the projects of subgroups. Projects whose hook is already correct are skipped.
+
+    $ python update_webhooks.py --dry-run
+    $ python update_webhooks.py --group group_name --concurrency 16
+"""
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+import requests
+from util import get_gitlab_session, get_webhook_token
+from app import config, routing
+
+PER_PAGE = 100
+HOOK_EVENTS = {
+    "merge_requests_events": True,
+    "push_events": False
+}
+
+_local = threading.local()
+
+
+def get_session() -> requests.Session:
+    """
+    Return the GitLab session of the current worker thread. requests.Session is not thread safe, so the workers do
+    not share one.
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session, _ = get_gitlab_session(pool_size=1)
+        _local.session = session
+    return session
+
+
+def get_pages(session: requests.Session, url: str, params: Dict) -> Iterator[Dict]:
+    """
+    Iterate over all pages of a GitLab list endpoint.
+    """
+    page = 1
+    while page:
+        res = session.get(url, params={**params, "per_page": PER_PAGE, "page": page})
+        res.raise_for_status()
+        yield from res.json()
+        page = int(res.headers.get("X-Next-Page") or 0)
+
+
+def get_projects(session: requests.Session, api_url: str, group_id: str) -> Iterator[Dict]:
+    return get_pages(session, f"{api_url}/groups/{group_id}/projects",
+                     {"include_subgroups": "true", "archived": "false", "simple": "true"})
+
+
+def plan_hook(hooks: List[Dict], url: str, force: bool) -> List[Dict]:
+    """
+    Decide which changes bring the hooks of a project in line with the expected hook.
+
+    :param hooks: List[Dict]: current hooks of the project
+    :param url: str: expected hook URL
+    :param force: bool: also edit hooks that are already correct, e.g. to rotate the token
+    :return: List of changes, each with the action, the hook id and the changed fields
+    """
+    app_hooks = [hook for hook in hooks if config.BOT_NAME in hook["url"]]
+    if not app_hooks:
+        return [{"action": "add", "hook_id": None, "changes": {"url": (None, url)}}]
+
+    plan = []
+    expected = {"url": url, **HOOK_EVENTS}
+    for hook in app_hooks:
+        changes = {key: (hook.get(key), value) for key, value in expected.items() if hook.get(key) != value}
+        if changes or force:
+            plan.append({"action": "edit", "hook_id": hook["id"], "changes": changes})
+    return plan
+
+
+def provision(api_url: str, project: Dict, url: str, token: str, dry_run: bool, force: bool) -> Tuple[List[str], bool]:
+    """
+    Bring the app hook of one project up to date.
+
+    :return: Lines of the diff of the project, and whether all changes were accepted by GitLab
+    """
+    session = get_session()
+    hooks_url = f"{api_url}/projects/{project['id']}/hooks"
+    res = session.get(hooks_url)
+    res.raise_for_status()
+
+    lines = []
+    ok = True
+    data = {"url": url, "token": token, **HOOK_EVENTS}
+    for change in plan_hook(res.json(), url, force):
+        diff = ", ".join(f"{key}: {old} -> {new}" for key, (old, new) in change["changes"].items())
+        status = "dry-run"
+        mark = "+" if change["action"] == "add" else "~"
+        if not dry_run:
+            if change["action"] == "add":
+                res = session.post(hooks_url, data=data)
+            else:
+                res = session.put(f"{hooks_url}/{change['hook_id']}", data=data)
+            status = res.status_code
+            if not res.ok:
+                ok = False
+                mark = "!"
+                status = f"{res.status_code} {res.text[:200]}"
+        if change["action"] == "add":
+            lines.append(f"{mark} {project['path_with_namespace']} ({project['id']}) add hook: {diff} [{status}]")
+        else:
+            lines.append(f"{mark} {project['path_with_namespace']} ({project['id']}) edit hook {change['hook_id']}: "
+                         f"{diff} [{status}]")
+    return lines, ok
+
+
+def main(groups: Optional[List[str]], concurrency: int, dry_run: bool, force: bool):
+    if not config.ACCESS_GITLAB and not dry_run:
+        print("ACCESS_GITLAB is not set, only showing the changes")
+        dry_run = True
+
+    # The project listing runs in this thread, every worker has a session of its own
+    session, api_url = get_gitlab_session(pool_size=1)
     token = get_webhook_token()
-    for project in projects:
-        res = get_hooks(project)
-        hooks = res.json()
-        project_has_hook = False
-        for hook in hooks:
-            if config.BOT_NAME in hook["url"]:
-                project_has_hook = True
-                res = edit_hook(project, hook["id"], url, token)
-                print(res.status_code, project.id, project.name, "edited hook")
-        if not project_has_hook:
-            res = add_hook(project, url, token)
-            print(res.status_code, project.id, project.name, "add hook")
+    unchanged = failed = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {}
+        for name, group_id in routing.get().group_ids.items():
+            if groups and name not in groups:
+                continue
+            url = config.BOT_URL + name.lower()
+            for project in get_projects(session, api_url, group_id):
+                future = executor.submit(provision, api_url, project, url, token, dry_run, force)
+                futures[future] = project
+
+        for future in as_completed(futures):
+            project = futures[future]
+            try:
+                lines, ok = future.result()
+            except requests.RequestException as e:
+                failed += 1
+                print(f"! {project['path_with_namespace']} ({project['id']}) failed: {e}")
+                continue
+            if not ok:
+                failed += 1
+            elif not lines:
+                unchanged += 1
+            for line in lines:
+                print(line)
+
+    print(f"{len(futures)} projects, {len(futures) - unchanged - failed} changed, {unchanged} unchanged, "
+          f"{failed} failed")
 
 
 if __name__ == "__main__":
-    main()
+    arg_parser = argparse.ArgumentParser(description="Add the mergeminion webhook to all projects of the groups")
+    arg_parser.add_argument('--group', action='append', help="group name from GITLAB_GROUP_ID_MAPPING, default all")
+    arg_parser.add_argument('--concurrency', type=int, default=8, help="parallel GitLab requests")
+    arg_parser.add_argument('--dry-run', action='store_true', help="only show the changes")
+    arg_parser.add_argument('--force', action='store_true', help="also update hooks that are correct, e.g. to "
+                                                                 "rotate the token")
+    args = arg_parser.parse_args()
+    main(args.group, args.concurrency, args.dry_run, args.force)
@@ -1,25 +1,31 @@
 import gitlab
 import requests
 import os
-from typing import Optional
+from typing import Optional, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 config_file = os.path.expanduser("python-gitlab.cfg")
 
-def get_gitlab(config_name: str = "elnino") -> gitlab.Gitlab:
+def get_gitlab_session(pool_size: int, config_name: str = "team") -> Tuple[requests.Session, str]:
     # Follow the python-gitlab configuration and name one of the configs "team"
     # https://python-gitlab.readthedocs.io/en/stable/cli-usage.html#configuration-file-format
     # And see python-gitlab.cfg.example
-    return gitlab.Gitlab.from_config(config_name, [config_file])
-
-def get_gitlab_requests(type: str, path, data={}):
-    config = gitlab.config.GitlabConfigParser("team", [config_file])
-    url = f"{config.url}/api/v{config.api_version}{path}"
-    headers = {
+    # One session with a connection pool for all requests, the configuration is parsed once
+    # GET and PUT requests are retried on rate limiting and server errors, POST is not to not add a hook twice
+    config = gitlab.config.GitlabConfigParser(config_name, [config_file])
+    session = requests.Session()
+    session.headers.update({
             'Accept': 'application/json',
             "PRIVATE-TOKEN": config.private_token
-            }
-    return requests.request(type, url, headers=headers, data=data)
+            })
+    session.verify = config.ssl_verify
+    retry = Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset(["GET", "PUT"]))
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry))
+    session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry))
+    return session, f"{config.url}/api/v{config.api_version}"
 
 class ConfigInvalidException(Exception):
     "Config items are invalid"
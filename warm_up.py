@@ -0,0 +1,19 @@
+"""
+Load the user directory and index the merge request threads of all channels in TEAM_CHANNEL_MAPPING, e.g. after
+a deploy or to find threads that are older than the recent channel history.
+
+    $ python warm_up.py --concurrency 4 --max-pages 0
+"""
+import argparse
+import asyncio
+from app import config
+from app.warmup import warm_up
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Warm up the mergeminion state database")
+    arg_parser.add_argument('--concurrency', type=int, default=config.WARMUP_CONCURRENCY,
+                            help="channels to index at the same time")
+    arg_parser.add_argument('--max-pages', type=int, default=config.WARMUP_MAX_PAGES,
+                            help="history pages of 200 messages to fetch per channel, 0 for the whole history")
+    args = arg_parser.parse_args()
+    asyncio.run(warm_up(args.concurrency, args.max_pages, load_users=True))